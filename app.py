@@ -5,11 +5,17 @@ Roles: user | staff (supervisor / driver / collector) | admin
 import json
 from flask import (Flask, render_template, request, redirect,
                    url_for, session, flash, jsonify)
-from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
-from db import execute_query, execute_one, execute_update, call_proc, call_func, get_conn, set_app_user
+from functools import wraps, cache
+from db import (execute_query, execute_one, execute_update, call_proc, call_func, get_conn, set_app_user, db_metrics,
+                begin_request, wrote_during_request, READ_YOUR_WRITES_WINDOW, SHARDS, set_shard, current_shard)
+from migrate import check_schema_version, MigrationError
+import writebehind
+import fragcache
+import passwords
+import shards
+import queries
 from dotenv import load_dotenv
-import os, psycopg2
+import os, time, threading, psycopg2
 
 load_dotenv()
 
@@ -63,6 +69,54 @@ def sub_role_required(*sub_roles):
         return dec
     return decorator
 
+# ─────────────────────────────────────────────
+#  Schema version check
+# ─────────────────────────────────────────────
+# Migrations are applied out of band with `python migrate.py up`; a worker only
+# verifies that nothing is pending (one pooled SELECT per shard, no DDL), once,
+# before its first request (asgi.py: at lifespan startup). Until then: 503.
+
+_schema = {'checked': os.environ.get('SKIP_SCHEMA_CHECK') == '1'}
+_schema_lock = threading.Lock()
+
+def check_schema():
+    if not _schema['checked']:
+        with _schema_lock:
+            if not _schema['checked']:
+                check_schema_version()
+                _schema['checked'] = True
+
+@app.before_request
+def require_schema():
+    try:
+        check_schema()
+    except MigrationError as e:
+        return str(e), 503
+
+# ─────────────────────────────────────────────
+#  Shard and read-replica routing (read your writes)
+# ─────────────────────────────────────────────
+
+@app.before_request
+def route_reads():
+    # Pin reads to the primary for a short window after this session last wrote,
+    # so a redirect after POST never shows replica-stale data.
+    begin_request(pin_primary=session.get('rw_until', 0) > time.time(),
+                  shard=shards.session_shard(session))
+    # A city being moved has its rows copied then deleted on the old shard: writes to them
+    # meanwhile would be lost. Sessions without a city (admins) wait for the whole shard.
+    if request.method == 'POST' and 'account_id' in session and request.endpoint != 'admin_switch_shard':
+        if shards.city_moving(session.get('city')) or (
+                not session.get('city') and shards.moving_out(current_shard())):
+            flash('A city on this server is being moved; please try again in a few minutes.', 'warning')
+            return redirect(request.referrer or url_for('home'))
+
+@app.after_request
+def remember_writes(resp):
+    if wrote_during_request():
+        session['rw_until'] = time.time() + READ_YOUR_WRITES_WINDOW
+    return resp
+
 # ─────────────────────────────────────────────
 #  Root
 # ─────────────────────────────────────────────
@@ -89,11 +143,16 @@ def login():
     if request.method == 'POST':
         username = request.form.get('username','').strip()
         password = request.form.get('password','')
-        acc = execute_one(
-            "SELECT a.*, s.sub_role FROM accounts a "
-            "LEFT JOIN staff s ON a.staff_id = s.staff_id "
-            "WHERE a.username = %s AND a.is_active = TRUE", (username,))
-        if acc and check_password_hash(acc['password_hash'], password):
+        set_shard(shards.account_shard(username))
+        acc = execute_one(queries.LOGIN, (username,))
+        try:
+            ok = acc is not None and passwords.verify(acc['password_hash'], password)
+        except passwords.Busy:
+            flash('Too many sign-ins right now, please try again in a moment.', 'warning')
+            return render_template('auth/login.html'), 503
+        if ok:
+            if passwords.needs_rehash(acc['password_hash']):
+                passwords.rehash_in_background(acc['account_id'], acc['password_hash'], password)
             session['account_id'] = acc['account_id']
             session['username']   = acc['username']
             session['role']       = acc['role']
@@ -101,8 +160,9 @@ def login():
             session['user_id']    = acc['user_id']
             session['staff_id']   = acc['staff_id']
             session['full_name']  = acc['display_name']
-            execute_update("UPDATE accounts SET last_login=NOW() WHERE account_id=%s",
-                           (acc['account_id'],))
+            session['city']       = acc['city']
+            session['shard']      = current_shard()
+            writebehind.record_login(acc['account_id'])
             flash(f"Welcome, {acc['display_name']}!", 'success')
             return redirect(url_for('home'))
         flash('Invalid credentials.', 'danger')
@@ -120,16 +180,27 @@ def register():
             cty = request.form['city'].strip()
             un  = request.form['username'].strip()
             pw  = request.form['password']
+            if shards.city_moving(cty):
+                flash('Registration for this city reopens in a few minutes.', 'warning')
+                return render_template('auth/register.html')
+            shard = shards.shard_for_city(cty)
+            set_shard(shard)
             if execute_one("SELECT 1 FROM accounts WHERE username=%s", (un,)):
                 flash('Username taken.', 'danger'); return render_template('auth/register.html')
             if execute_one("SELECT 1 FROM users WHERE email=%s", (em,)):
                 flash('Email already registered.', 'danger'); return render_template('auth/register.html')
-            user = execute_one(
-                "INSERT INTO users (full_name,email,phone,address,city) VALUES(%s,%s,%s,%s,%s) RETURNING user_id",
-                (fn, em, ph, adr, cty))
-            execute_update(
-                "INSERT INTO accounts (username,password_hash,role,user_id,display_name) VALUES(%s,%s,'user',%s,%s)",
-                (un, generate_password_hash(pw), user['user_id'], fn))
+            if not shards.reserve_username(un, shard):
+                flash('Username taken.', 'danger'); return render_template('auth/register.html')
+            try:
+                user = execute_one(
+                    "INSERT INTO users (full_name,email,phone,address,city) VALUES(%s,%s,%s,%s,%s) RETURNING user_id",
+                    (fn, em, ph, adr, cty))
+                execute_update(
+                    "INSERT INTO accounts (username,password_hash,role,user_id,display_name) VALUES(%s,%s,'user',%s,%s)",
+                    (un, passwords.hash_password(pw), user['user_id'], fn))
+            except Exception:
+                shards.release_username(un)
+                raise
             flash('Registered! Please log in.', 'success')
             return redirect(url_for('login'))
         except Exception as e:
@@ -150,18 +221,13 @@ def logout():
 @role_required('user')
 def user_dashboard():
     uid = session['user_id']
-    stats = execute_one("""
-        SELECT
-            COUNT(*) FILTER (WHERE status='pending')             AS pending_count,
-            COUNT(*) FILTER (WHERE status IN ('supervisor_assigned','field_assigned')) AS assigned_count,
-            COUNT(*) FILTER (WHERE status='collected')           AS collected_count,
-            COUNT(*) FILTER (WHERE status='completed')           AS completed_count,
-            COALESCE(SUM(total_weight_kg) FILTER (WHERE status='completed'),0) AS total_weight,
-            COALESCE(SUM(total_amount)    FILTER (WHERE status='completed'),0) AS total_earned
-        FROM pickup_requests WHERE user_id=%s
-    """, (uid,))
-    recent = execute_query(
-        "SELECT * FROM v_pickup_full WHERE user_id=%s ORDER BY pickup_id DESC LIMIT 5", (uid,))
+    stats = execute_one(queries.USER_STATS, (uid,), readonly=True)
+    archived = execute_one("SELECT * FROM archive_user_totals WHERE user_id=%s", (uid,), readonly=True)
+    if archived:
+        stats['completed_count'] += archived['pickups']
+        stats['total_weight']    += archived['total_weight_kg']
+        stats['total_earned']    += archived['total_earnings']
+    recent = execute_query(queries.USER_RECENT, (uid,))
     warnings = execute_query(
         "SELECT * FROM warnings WHERE target_user_id=%s ORDER BY issued_at DESC LIMIT 3", (uid,))
     return render_template('user/dashboard.html', stats=stats, recent=recent, warnings=warnings)
@@ -170,18 +236,17 @@ def user_dashboard():
 @role_required('user')
 def user_pickups():
     uid = session['user_id']
-    pickups = execute_query(
-        "SELECT * FROM v_pickup_full WHERE user_id=%s ORDER BY pickup_id DESC", (uid,))
+    pickups = execute_query(queries.USER_PICKUPS, (uid,))
     return render_template('user/pickups.html', pickups=pickups)
 
 @app.route('/my-pickups/<int:pid>')
 @role_required('user')
 def user_pickup_detail(pid):
     uid = session['user_id']
-    pickup = execute_one("SELECT * FROM v_pickup_full WHERE pickup_id=%s AND user_id=%s", (pid, uid))
+    pickup = execute_one(queries.USER_PICKUP, (pid, uid))
     if not pickup: flash('Not found.','danger'); return redirect(url_for('user_pickups'))
-    items = execute_query("SELECT * FROM v_item_details WHERE pickup_id=%s", (pid,))
-    payment = execute_one("SELECT * FROM payments WHERE pickup_id=%s AND payment_status='completed'", (pid,))
+    items = execute_query(queries.PICKUP_ITEMS, (pid,))
+    payment = execute_one("SELECT * FROM v_payment_history WHERE pickup_id=%s AND payment_status='completed'", (pid,))
     pay_req = execute_one(
         "SELECT * FROM payment_requests WHERE pickup_id=%s AND user_id=%s ORDER BY requested_at DESC LIMIT 1",
         (pid, uid))
@@ -254,13 +319,7 @@ def user_request_payment(pid):
 @role_required('user')
 def user_payments():
     uid = session['user_id']
-    payments = execute_query("""
-        SELECT py.*, p.pickup_address, p.total_weight_kg, p.collected_at
-        FROM payments py
-        JOIN pickup_requests p ON py.pickup_id = p.pickup_id
-        WHERE p.user_id = %s AND py.payment_status = 'completed'
-        ORDER BY py.processed_at DESC
-    """, (uid,))
+    payments = execute_query(queries.USER_PAYMENTS, (uid,))
     return render_template('user/payments.html', payments=payments)
 
 # ═══════════════════════════════════════════════
@@ -272,27 +331,8 @@ def user_payments():
 def field_dashboard():
     sid = session['staff_id']
     sub_role = session.get('sub_role', '')
-    if sub_role == 'collector':
-        active_statuses = "('field_assigned')"
-        done_statuses   = "('picked_up','collected','completed')"
-    else:  # driver
-        active_statuses = "('field_assigned','picked_up')"
-        done_statuses   = "('delivered','collected','completed')"
-
-    stats = execute_one(f"""
-        SELECT
-            COUNT(*) FILTER (WHERE status IN {active_statuses} AND scheduled_time::date = CURRENT_DATE) AS today_count,
-            COUNT(*) FILTER (WHERE status IN {active_statuses}) AS pending_count,
-            COUNT(*) FILTER (WHERE status IN {done_statuses})   AS done_count,
-            COALESCE(SUM(total_weight_kg) FILTER (WHERE status IN {done_statuses}), 0) AS total_weight
-        FROM v_pickup_full
-        WHERE driver_id=%s OR collector_id=%s
-    """, (sid, sid))
-    open_assignments = execute_query(f"""
-        SELECT * FROM v_pickup_full
-        WHERE (driver_id=%s OR collector_id=%s) AND status IN {active_statuses}
-        ORDER BY scheduled_time ASC LIMIT 10
-    """, (sid, sid))
+    stats = execute_one(queries.FIELD_STATS, (sid,))
+    open_assignments = execute_query(queries.FIELD_OPEN, (sid,))
     return render_template('field/dashboard.html', stats=stats, open_assignments=open_assignments, sub_role=sub_role)
 
 @app.route('/field/assignments')
@@ -300,14 +340,12 @@ def field_dashboard():
 def field_assignments():
     sid = session['staff_id']
     sub_role = session.get('sub_role', '')
-    if sub_role == 'collector':
-        active_statuses = ('field_assigned',)
-    else:
-        active_statuses = ('field_assigned', 'picked_up')
-    placeholders = ','.join(['%s'] * len(active_statuses))
-    pickups = execute_query(
-        f"SELECT * FROM v_pickup_full WHERE (driver_id=%s OR collector_id=%s) AND status IN ({placeholders}) ORDER BY scheduled_time ASC",
-        [sid, sid] + list(active_statuses))
+    pickups = execute_query("""
+        SELECT v.* FROM pickup_assignments a
+        JOIN v_pickup_full v ON v.pickup_id = a.pickup_id
+        WHERE a.staff_id=%s AND a.phase='active'
+        ORDER BY a.scheduled_time ASC
+    """, (sid,))
     return render_template('field/assignments.html', pickups=pickups, sub_role=sub_role)
 
 @app.route('/field/collect/<int:pid>', methods=['GET','POST'])
@@ -352,30 +390,18 @@ def field_deliver(pid):
 @sub_role_required('driver','collector')
 def field_history():
     sid = session['staff_id']
-    sub_role = session.get('sub_role', '')
-    if sub_role == 'collector':
-        done_statuses = ('picked_up', 'collected', 'completed')
-    else:
-        done_statuses = ('delivered', 'collected', 'completed')
-    placeholders = ','.join(['%s'] * len(done_statuses))
-    pickups = execute_query(
-        f"SELECT * FROM v_pickup_full WHERE (driver_id=%s OR collector_id=%s) AND status IN ({placeholders}) ORDER BY collected_at DESC LIMIT 100",
-        [sid, sid] + list(done_statuses))
+    pickups = execute_query(queries.FIELD_HISTORY, (sid,))
     return render_template('field/history.html', pickups=pickups)
 
 @app.route('/supervisor/history')
 @sub_role_required('supervisor')
 def sup_history():
     sid = session['staff_id']
-    pickups = execute_query("""
-        SELECT * FROM v_pickup_full
-        WHERE supervisor_id=%s AND status IN ('collected','completed')
-        ORDER BY collected_at DESC LIMIT 100
-    """, (sid,))
+    pickups = execute_query(queries.SUP_HISTORY, (sid,))
     payments = execute_query("""
         SELECT py.*, pf.user_name, pf.pickup_address
-        FROM payments py
-        JOIN v_pickup_full pf ON py.pickup_id = pf.pickup_id
+        FROM v_payment_history py
+        JOIN v_pickup_history pf ON py.pickup_id = pf.pickup_id
         WHERE pf.supervisor_id = %s AND py.payment_status = 'completed'
         ORDER BY py.processed_at DESC LIMIT 100
     """, (sid,))
@@ -384,26 +410,30 @@ def sup_history():
 @app.route('/admin/history')
 @role_required('admin')
 def admin_history():
-    pickups = execute_query(
-        "SELECT * FROM v_pickup_full ORDER BY pickup_id DESC LIMIT 200")
-    payments = execute_query("""
-        SELECT py.*, pf.user_name, pf.pickup_address, pf.supervisor_name
-        FROM payments py
-        JOIN v_pickup_full pf ON py.pickup_id = pf.pickup_id
-        ORDER BY py.processed_at DESC LIMIT 200
-    """)
-    return render_template('admin/history.html', pickups=pickups, payments=payments)
+    frag = fragcache.Fragments()
+    fragments = {
+        'pickups': frag.get('history.pickups', ('pickups', 'payments', 'people', 'catalog'), lambda: render_template(
+            'admin/fragments/history_pickups.html', pickups=execute_query(
+                queries.ADMIN_HISTORY, readonly=True))),
+        'payments': frag.get('history.payments', ('pickups', 'payments', 'people', 'catalog'), lambda: render_template(
+            'admin/fragments/history_payments.html', payments=execute_query("""
+                SELECT py.*, pf.user_name, pf.pickup_address, pf.supervisor_name
+                FROM v_payment_history py
+                JOIN v_pickup_history pf ON py.pickup_id = pf.pickup_id
+                ORDER BY py.processed_at DESC LIMIT 200
+            """, readonly=True))),
+    }
+    return render_template('admin/history.html', fragments=fragments)
 
 @app.route('/my-history')
 @role_required('user')
 def user_history():
     uid = session['user_id']
-    pickups = execute_query(
-        "SELECT * FROM v_pickup_full WHERE user_id=%s ORDER BY pickup_id DESC", (uid,))
+    pickups = execute_query(queries.USER_HISTORY, (uid,))
     payments = execute_query("""
         SELECT py.*, pr.pickup_address
-        FROM payments py
-        JOIN pickup_requests pr ON py.pickup_id = pr.pickup_id
+        FROM v_payment_history py
+        JOIN v_pickup_history pr ON py.pickup_id = pr.pickup_id
         WHERE pr.user_id = %s AND py.payment_status = 'completed'
         ORDER BY py.processed_at DESC
     """, (uid,))
@@ -417,18 +447,11 @@ def user_history():
 @sub_role_required('supervisor')
 def sup_dashboard():
     sid = session['staff_id']
-    stats_rows = call_func('get_supervisor_stats', (sid,))
+    stats_rows = call_func('get_supervisor_stats', (sid,), readonly=True)
     stats = stats_rows[0] if stats_rows else {}
-    needs_assignment = execute_query(
-        "SELECT * FROM v_pickup_full WHERE supervisor_id=%s AND status='supervisor_assigned' ORDER BY preferred_date ASC",
-        (sid,))
-    in_progress = execute_query(
-        """SELECT * FROM v_pickup_full
-           WHERE supervisor_id=%s AND status IN ('field_assigned','picked_up','delivered')
-           ORDER BY scheduled_time ASC""", (sid,))
-    pay_requests = execute_query(
-        "SELECT * FROM v_payment_requests_full WHERE supervisor_id=%s AND status='pending' ORDER BY requested_at DESC",
-        (sid,))
+    needs_assignment = execute_query(queries.SUP_NEEDS_ASSIGNMENT, (sid,))
+    in_progress = execute_query(queries.SUP_IN_PROGRESS, (sid,))
+    pay_requests = execute_query(queries.SUP_PAY_REQUESTS, (sid,))
     overdue = execute_query(
         "SELECT * FROM v_overdue_payments WHERE supervisor_id=%s", (sid,))
     team = execute_query(
@@ -485,9 +508,7 @@ def sup_assign(pid):
 @sub_role_required('supervisor')
 def sup_payments():
     sid = session['staff_id']
-    pending = execute_query(
-        "SELECT * FROM v_pickup_full WHERE supervisor_id=%s AND status='collected' ORDER BY collected_at ASC",
-        (sid,))
+    pending = execute_query(queries.SUP_COLLECTED, (sid,))
     # Pre-calculate estimated payout for each pending pickup (for modal display)
     estimated = {}
     for p in pending:
@@ -586,43 +607,34 @@ def sup_batch_add_items(bid):
         JOIN users u ON p.user_id = u.user_id
         WHERE p.supervisor_id = %s
           AND p.status IN ('delivered', 'collected')
-          AND i.item_id NOT IN (SELECT item_id FROM batch_items WHERE batch_id = %s)
+          AND NOT EXISTS (SELECT 1 FROM batch_items bi WHERE bi.batch_id = %s AND bi.item_id = i.item_id)
         ORDER BY p.status DESC, p.pickup_id, i.item_id
     """, (sid, bid))
     if request.method == 'POST':
-        item_ids = request.form.getlist('item_ids')
-        added = 0
-        for iid in item_ids:
-            # get pickup_id for this item
-            row = execute_one("SELECT pickup_id FROM items WHERE item_id=%s", (int(iid),))
-            if row:
-                try:
-                    execute_update(
-                        "INSERT INTO batch_items (batch_id, item_id, pickup_id, added_by) VALUES (%s,%s,%s,%s)",
-                        (bid, int(iid), row['pickup_id'], sid))
-                    added += 1
-                except Exception:
-                    pass
+        item_ids = [int(iid) for iid in request.form.getlist('item_ids')]
+        added = execute_update("""
+            INSERT INTO batch_items (batch_id, item_id, pickup_id, added_by)
+            SELECT %s, item_id, pickup_id, %s FROM items WHERE item_id = ANY(%s)
+            ON CONFLICT (batch_id, item_id) DO NOTHING
+        """, (bid, sid, item_ids)) if item_ids else 0
         flash(f'{added} item(s) added to batch.', 'success')
         return redirect(url_for('sup_batch_add_items', bid=bid))
+    # Weight and value are the snapshots kept by the batch triggers; the
+    # totals are batch.live_weight_kg / batch.est_value (14_batch_aggregates.sql).
     batch_items = execute_query("""
         SELECT bi.item_id, i.item_description,
                i.actual_weight_kg, i.estimated_weight_kg,
-               COALESCE(i.actual_weight_kg, i.estimated_weight_kg, 0) AS effective_weight,
+               bi.weight_kg AS effective_weight,
                c.category_name, i.pickup_id,
-               ROUND(COALESCE(i.actual_weight_kg, i.estimated_weight_kg, 0)
-                     * c.base_price_per_kg, 2) AS est_value
+               bi.est_value
         FROM batch_items bi
         JOIN items i ON bi.item_id = i.item_id
         JOIN categories c ON i.category_id = c.category_id
         WHERE bi.batch_id = %s
         ORDER BY i.pickup_id, i.item_id
     """, (bid,))
-    batch_total_weight = sum(float(r['effective_weight'] or 0) for r in batch_items)
-    batch_total_value  = sum(float(r['est_value'] or 0) for r in batch_items)
     return render_template('supervisor/batch_add_items.html',
-                           batch=batch, available_items=eligible, batch_items=batch_items,
-                           batch_total_weight=batch_total_weight, batch_total_value=batch_total_value)
+                           batch=batch, available_items=eligible, batch_items=batch_items)
 
 @app.route('/supervisor/batches/<int:bid>/process', methods=['POST'])
 @sub_role_required('supervisor')
@@ -683,19 +695,19 @@ def admin_dashboard():
             (SELECT COUNT(*) FROM pickup_requests WHERE status='supervisor_assigned') AS sup_assigned,
             (SELECT COUNT(*) FROM pickup_requests WHERE status='field_assigned')    AS field_assigned,
             (SELECT COUNT(*) FROM pickup_requests WHERE status='collected')         AS collected,
-            (SELECT COUNT(*) FROM pickup_requests WHERE status='completed')         AS completed,
-            (SELECT COALESCE(SUM(amount),0) FROM payments WHERE payment_status='completed') AS total_paid,
+            (SELECT COUNT(*) FROM pickup_requests WHERE status='completed')
+              + (SELECT COALESCE(SUM(pickups),0) FROM archive_supervisor_totals)   AS completed,
+            (SELECT COALESCE(SUM(amount),0) FROM payments WHERE payment_status='completed')
+              + (SELECT COALESCE(SUM(total_paid_out),0) FROM archive_supervisor_totals) AS total_paid,
             (SELECT COALESCE(SUM(total_value),0) FROM system_revenue)               AS total_revenue,
             (SELECT COUNT(*) FROM admin_alerts WHERE NOT is_resolved)               AS unresolved_alerts,
             (SELECT COUNT(*) FROM v_overdue_payments)                               AS overdue_payments,
             (SELECT COUNT(*) FROM recycling_batches WHERE status='open')            AS open_batches
-    """)
-    alerts = execute_query(
-        "SELECT * FROM v_admin_alerts_active LIMIT 10")
-    recent_pickups = execute_query(
-        "SELECT * FROM v_pickup_full ORDER BY pickup_id DESC LIMIT 8")
-    supervisors = execute_query("SELECT * FROM v_supervisor_team ORDER BY supervisor_name")
-    overdue = execute_query("SELECT * FROM v_overdue_payments LIMIT 10")
+    """, readonly=True)
+    alerts = execute_query(queries.ADMIN_ALERTS_ACTIVE, readonly=True)
+    recent_pickups = execute_query(queries.ADMIN_RECENT_PICKUPS, readonly=True)
+    supervisors = execute_query("SELECT * FROM v_supervisor_team ORDER BY supervisor_name", readonly=True)
+    overdue = execute_query(queries.ADMIN_OVERDUE, readonly=True)
     return render_template('admin/dashboard.html', stats=stats, alerts=alerts,
                            recent_pickups=recent_pickups, supervisors=supervisors, overdue=overdue)
 
@@ -704,16 +716,44 @@ def admin_dashboard():
 def admin_pickups():
     sf  = request.args.get('status','')
     sid = request.args.get('supervisor_id','')
-    sql = "SELECT * FROM v_pickup_full WHERE 1=1"
+    pid = request.args.get('pickup_id', type=int)      # alert links
+    sql = queries.ADMIN_PICKUPS
     params = []
     if sf:  sql += " AND status=%s";          params.append(sf)
     if sid: sql += " AND supervisor_id=%s";   params.append(int(sid))
-    sql += " ORDER BY pickup_id DESC"
+    if pid: sql += " AND pickup_id=%s";       params.append(pid)
+    sql += queries.ADMIN_PICKUPS_ORDER
     pickups = execute_query(sql, params)
     supervisors = execute_query("SELECT staff_id, full_name FROM staff WHERE sub_role='supervisor' AND is_active ORDER BY full_name")
     return render_template('admin/pickups.html', pickups=pickups, status_filter=sf,
                            supervisors=supervisors, sup_filter=sid)
 
+@app.route('/admin/search')
+@role_required('admin')
+def admin_search():
+    q     = request.args.get('q', '').strip()
+    page  = max(request.args.get('page', 1, type=int), 1)
+    limit = 25
+    pickups, has_next = [], False
+    if len(q) >= 3:
+        # Fetch one extra hit to know whether a next page exists (no COUNT over all matches)
+        hits = call_func('search_pickups', (q, limit + 1, (page - 1) * limit), readonly=True)
+        has_next = len(hits) > limit
+        hits = hits[:limit]
+        rows = {r['pickup_id']: r for r in execute_query(
+            "SELECT * FROM v_pickup_full WHERE pickup_id = ANY(%s)",
+            ([h['pickup_id'] for h in hits],), readonly=True)}
+        for h in hits:
+            row = rows.get(h['pickup_id'])
+            if row:
+                row['matched_on'] = h['matched_on']
+                row['rank']       = h['rank']
+                pickups.append(row)
+    elif q:
+        flash('Enter at least 3 characters to search.', 'warning')
+    return render_template('admin/search.html', q=q, pickups=pickups,
+                           page=page, has_next=has_next)
+
 @app.route('/admin/assign-supervisor/<int:pid>', methods=['GET','POST'])
 @role_required('admin')
 def admin_assign_supervisor(pid):
@@ -760,18 +800,26 @@ def admin_create_staff():
         un      = request.form['username'].strip()
         pw      = request.form['password']
         sup_id  = request.form.get('supervisor_id') or None
+        city    = request.form.get('city', '').strip() or None
         if sup_id: sup_id = int(sup_id)
         if sr in ('driver','collector') and not sup_id:
             flash('Driver/Collector must be assigned to a supervisor.', 'danger')
             return redirect(url_for('admin_staff'))
         if execute_one("SELECT 1 FROM accounts WHERE username=%s", (un,)):
             flash('Username taken.', 'danger'); return redirect(url_for('admin_staff'))
-        staff = execute_one(
-            "INSERT INTO staff (full_name,sub_role,contact_number,supervisor_id) VALUES(%s,%s,%s,%s) RETURNING staff_id",
-            (name, sr, contact, sup_id))
-        execute_update(
-            "INSERT INTO accounts (username,password_hash,role,staff_id,display_name) VALUES(%s,%s,'staff',%s,%s)",
-            (un, generate_password_hash(pw), staff['staff_id'], name))
+        # Created on the shard the admin is viewing (see /admin/shard)
+        if not shards.reserve_username(un, current_shard()):
+            flash('Username taken.', 'danger'); return redirect(url_for('admin_staff'))
+        try:
+            staff = execute_one(
+                "INSERT INTO staff (full_name,sub_role,contact_number,supervisor_id,city) VALUES(%s,%s,%s,%s,%s) RETURNING staff_id",
+                (name, sr, contact, sup_id, city))
+            execute_update(
+                "INSERT INTO accounts (username,password_hash,role,staff_id,display_name) VALUES(%s,%s,'staff',%s,%s)",
+                (un, passwords.hash_password(pw), staff['staff_id'], name))
+        except Exception:
+            shards.release_username(un)
+            raise
         flash(f'{sr.title()} {name} created.', 'success')
     except Exception as e:
         flash(f'Error: {e}', 'danger')
@@ -818,7 +866,7 @@ def admin_create_vehicle():
 @app.route('/admin/users')
 @role_required('admin')
 def admin_users():
-    users = execute_query("SELECT * FROM v_user_activity ORDER BY registered_at DESC")
+    users = execute_query("SELECT * FROM v_user_activity ORDER BY registered_at DESC", readonly=True)
     return render_template('admin/users.html', users=users)
 
 @app.route('/admin/users/toggle/<int:uid>', methods=['POST'])
@@ -869,13 +917,17 @@ def admin_warnings():
 def admin_alerts():
     severity_filter = request.args.get('severity', '')
     show_resolved   = request.args.get('resolved', '') == '1'
-    sql = "SELECT * FROM admin_alerts WHERE 1=1"
+    page  = max(request.args.get('page', 1, type=int), 1)
+    limit = 100
+    sql = queries.ALERTS
     params = []
     if severity_filter: sql += " AND severity=%s"; params.append(severity_filter)
     if not show_resolved: sql += " AND is_resolved=FALSE"
-    sql += " ORDER BY CASE severity WHEN 'critical' THEN 1 WHEN 'high' THEN 2 WHEN 'medium' THEN 3 ELSE 4 END, created_at DESC"
-    alerts = execute_query(sql, params or None)
-    return render_template('admin/alerts.html', alerts=alerts,
+    sql += queries.ALERTS_ORDER
+    # One extra row tells whether a next page exists
+    alerts = execute_query(sql, params + [limit + 1, (page - 1) * limit])
+    has_next, alerts = len(alerts) > limit, alerts[:limit]
+    return render_template('admin/alerts.html', alerts=alerts, page=page, has_next=has_next,
                            severity_filter=severity_filter, show_resolved=show_resolved)
 
 @app.route('/admin/alerts/resolve/<int:aid>', methods=['POST'])
@@ -886,6 +938,30 @@ def admin_resolve_alert(aid):
         (session['account_id'], aid))
     return redirect(url_for('admin_alerts'))
 
+@app.route('/api/alerts/resolve', methods=['POST'])
+@role_required('admin')
+def api_resolve_alerts():
+    """Resolve many open alerts in one UPDATE: the given alert_ids, and/or
+    every open alert matching alert_type / severity / related_table + related_id.
+    Takes JSON or a form post (the alerts page); JSON gets {"resolved": n}."""
+    data = request.get_json(silent=True) if request.is_json else None
+    args = data or request.form
+    ids  = data.get('alert_ids') if data else request.form.getlist('alert_ids')
+    sql, params = queries.RESOLVE_ALERTS, [session['account_id']]
+    criteria = 0
+    if ids:
+        sql += " AND alert_id = ANY(%s)"; params.append([int(i) for i in ids]); criteria += 1
+    for col in ('alert_type', 'severity', 'related_table', 'related_id'):
+        if args.get(col):
+            sql += f" AND {col} = %s"; params.append(args[col]); criteria += 1
+    resolved = execute_update(sql, params) if criteria else 0
+    if data is not None:
+        if not criteria:
+            return jsonify({'error': 'Give alert_ids or a filter.'}), 400
+        return jsonify({'resolved': resolved})
+    flash(f'{resolved} alert(s) resolved.', 'success' if resolved else 'warning')
+    return redirect(url_for('admin_alerts', severity=args.get('severity', '')))
+
 @app.route('/admin/logs')
 @role_required('admin')
 def admin_logs():
@@ -893,43 +969,77 @@ def admin_logs():
     page    = int(request.args.get('page', 1))
     limit   = 50
     offset  = (page - 1) * limit
-    sql = "SELECT * FROM audit_log WHERE 1=1"
+    sql = queries.AUDIT_LOG
     params = []
     if table_f: sql += " AND table_name=%s"; params.append(table_f)
-    sql += " ORDER BY changed_at DESC LIMIT %s OFFSET %s"
+    sql += queries.AUDIT_LOG_ORDER
     params += [limit, offset]
-    logs  = execute_query(sql, params)
+    logs  = execute_query(sql, params, readonly=True)
     total = execute_one("SELECT COUNT(*) AS c FROM audit_log" + (" WHERE table_name=%s" if table_f else ""),
-                        ([table_f] if table_f else None))
+                        ([table_f] if table_f else None), readonly=True)
     return render_template('admin/logs.html', logs=logs, table_filter=table_f,
                            page=page, total=total['c'] if total else 0, limit=limit)
 
 @app.route('/admin/reports')
 @role_required('admin')
 def admin_reports():
-    sup_stats = execute_query("SELECT * FROM v_supervisor_team ORDER BY total_pickups DESC")
-    cat_stats = execute_query("SELECT * FROM v_category_statistics WHERE total_items>0 ORDER BY total_payout_value DESC")
-    fac_cap   = execute_query("SELECT * FROM v_facility_capacity ORDER BY utilisation_pct DESC")
-    user_top  = execute_query("SELECT * FROM v_user_activity WHERE total_pickups>0 ORDER BY total_earnings DESC LIMIT 15")
-    rev_sum   = execute_query("SELECT * FROM v_system_revenue_summary ORDER BY total_revenue DESC")
-    monthly   = execute_query("""
-        SELECT TO_CHAR(request_date,'Mon YYYY') AS period,
-               EXTRACT(YEAR FROM request_date) AS yr,
-               EXTRACT(MONTH FROM request_date) AS mo,
-               COUNT(*) AS total_pickups,
-               COALESCE(SUM(total_weight_kg),0) AS total_weight,
-               COALESCE(SUM(total_amount),0) AS total_payout
-        FROM pickup_requests
-        GROUP BY period, yr, mo ORDER BY yr DESC, mo DESC LIMIT 12
-    """)
-    return render_template('admin/reports.html',
-                           sup_stats=sup_stats, cat_stats=cat_stats, fac_cap=fac_cap,
-                           user_top=user_top, rev_sum=rev_sum, monthly=monthly)
+    # Each query runs at most once per request, and only if a fragment that needs it missed.
+    # Reports cover every shard: each query runs on all of them and the rows are merged.
+    def everywhere(sql):
+        return shards.fan_out(execute_query, sql, readonly=True)
+    @cache
+    def sup_stats():
+        return shards.merge_rows(everywhere(queries.REPORT_SUPERVISORS),
+                                 'total_pickups', reverse=True)
+    @cache
+    def cat_stats():
+        return shards.merge_sum(everywhere(queries.REPORT_CATEGORIES),
+                                ('category_id',), ('total_items', 'total_weight_kg', 'total_payout_value', 'mercury_items'),
+                                'total_payout_value', reverse=True)
+    @cache
+    def rev_sum():
+        return shards.merge_rows(everywhere("SELECT * FROM v_system_revenue_summary ORDER BY total_revenue DESC"),
+                                 'total_revenue', reverse=True)
+    @cache
+    def monthly():
+        return shards.merge_sum(everywhere("""
+            SELECT TO_CHAR(request_date,'Mon YYYY') AS period,
+                   EXTRACT(YEAR FROM request_date) AS yr,
+                   EXTRACT(MONTH FROM request_date) AS mo,
+                   COUNT(*) AS total_pickups,
+                   COALESCE(SUM(total_weight_kg),0) AS total_weight,
+                   COALESCE(SUM(total_amount),0) AS total_payout
+            FROM pickup_requests
+            GROUP BY period, yr, mo ORDER BY yr DESC, mo DESC LIMIT 12
+        """), ('period', 'yr', 'mo'), ('total_pickups', 'total_weight', 'total_payout'),
+            ('yr', 'mo'), reverse=True, limit=12)
+
+    frag = fragcache.Fragments(fan_out=True)
+    fragments = {
+        'summary': frag.get('reports.summary', ('pickups', 'payments', 'people', 'catalog', 'revenue'),
+            lambda: render_template('admin/fragments/reports_summary.html', rev_sum=rev_sum(),
+                                    sup_stats=sup_stats(), cat_stats=cat_stats(), monthly=monthly())),
+        'revenue': frag.get('reports.revenue', ('revenue', 'catalog'),
+            lambda: render_template('admin/fragments/reports_revenue.html', rev_sum=rev_sum())),
+        'categories': frag.get('reports.categories', ('pickups', 'catalog'),
+            lambda: render_template('admin/fragments/reports_categories.html', cat_stats=cat_stats())),
+        'top_users': frag.get('reports.top_users', ('pickups', 'payments', 'people'),
+            lambda: render_template('admin/fragments/reports_top_users.html', user_top=shards.merge_rows(everywhere(queries.REPORT_TOP_USERS),
+                'total_earnings', reverse=True, limit=15))),
+        'supervisors': frag.get('reports.supervisors', ('pickups', 'payments', 'people'),
+            lambda: render_template('admin/fragments/reports_supervisors.html', sup_stats=sup_stats())),
+        'monthly': frag.get('reports.monthly', ('pickups',),
+            lambda: render_template('admin/fragments/reports_monthly.html', monthly=monthly())),
+    }
+    # Facility load moves with every delivery and is cheap to read; always live.
+    fac_cap = shards.merge_rows(everywhere("SELECT * FROM v_facility_capacity ORDER BY utilisation_pct DESC"),
+                                'utilisation_pct', reverse=True)
+    return render_template('admin/reports.html', fragments=fragments, fac_cap=fac_cap)
 
 @app.route('/admin/batches')
 @role_required('admin')
 def admin_batches():
-    batches = execute_query("SELECT * FROM v_batch_full ORDER BY batch_id DESC")
+    batches = execute_query("SELECT * FROM v_batch_full ORDER BY batch_id DESC", readonly=True)
     return render_template('admin/batches.html', batches=batches)
 
 @app.route('/admin/batches/<int:bid>/force-process', methods=['POST'])
@@ -946,10 +1056,20 @@ def admin_force_process_batch(bid):
 #  API endpoints
 # ─────────────────────────────────────────────
 
+@app.route('/admin/shard', methods=['POST'])
+@role_required('admin')
+def admin_switch_shard():
+    # Admin pages other than reports show one shard at a time.
+    shard = request.form.get('shard')
+    if shard in SHARDS:
+        session['shard'] = shard
+        flash(f'Now viewing shard {shard}.', 'info')
+    return redirect(request.referrer or url_for('admin_dashboard'))
+
 @app.route('/api/supervisor-stats/<int:sid>')
 @role_required('admin')
 def api_sup_stats(sid):
-    rows = call_func('get_supervisor_stats', (sid,))
+    rows = call_func('get_supervisor_stats', (sid,), readonly=True)
     return jsonify(rows[0] if rows else {})
 
 @app.route('/api/facility-capacity/<int:fid>')
@@ -958,6 +1078,26 @@ def api_facility_capacity(fid):
     cap = execute_one("SELECT * FROM v_facility_capacity WHERE facility_id=%s", (fid,))
     return jsonify(cap or {})
 
+@app.route('/api/write-behind')
+@role_required('admin')
+def api_write_behind():
+    return jsonify(writebehind.metrics())
+
+@app.route('/api/passwords')
+@role_required('admin')
+def api_passwords():
+    return jsonify(passwords.metrics())
+
+@app.route('/api/fragment-cache')
+@role_required('admin')
+def api_fragment_cache():
+    return jsonify(fragcache.metrics())
+
+@app.route('/api/db-metrics')
+@role_required('admin')
+def api_db_metrics():
+    return jsonify(db_metrics())
+
 # ─────────────────────────────────────────────
 #  Context processor
 # ─────────────────────────────────────────────
@@ -981,31 +1121,11 @@ def inject_globals():
             'user_id':    session.get('user_id'),
             'staff_id':   session.get('staff_id'),
         },
-        unresolved_alerts=unresolved
+        unresolved_alerts=unresolved,
+        shard_names=list(SHARDS) if shards.sharded() else [],
+        current_shard=current_shard()
     )
 
-# ─────────────────────────────────────────────
-#  Missing procedure stub in sample data
-# ─────────────────────────────────────────────
-
-def register_extra_procedures():
-    """
-    Registers helper procedure create_recycling_batch_v2 that also sets supervisor_id.
-    Reads and executes 06b_extra.sql at startup.
-    """
-    import os
-    sql_path = os.path.join(os.path.dirname(__file__), 'database', '06b_extra.sql')
-    try:
-        with open(sql_path) as f:
-            sql = f.read()
-        from db import get_conn
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql)
-    except Exception as e:
-        print(f'[startup] register_extra_procedures: {e}')
-
-register_extra_procedures()
-
 if __name__ == '__main__':
+    check_schema()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+asgi.py — ASGI entry point: async JSON API in front of the Flask app
+
+    uvicorn asgi:application --workers 4 --port 8000
+
+/api/... requests are served here on the event loop through db_async, so one
+process can hold thousands of concurrent pollers on a few DB connections.
+Every other path goes to the unchanged Flask app via asgiref's WsgiToAsgi
+(a thread pool). The session is Flask's signed cookie, verified with the
+app's own serializer, so logging in on the HTML pages authorizes the API.
+Unlike the HTML routes, a missing login or role is a JSON 401/403, not a
+redirect. Queries go to the session's shard, as in app.py (shards.py).
+`python app.py` still serves the same endpoints synchronously.
+"""
+import re
+import asyncio
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie
+from asgiref.wsgi import WsgiToAsgi
+from psycopg import Error as DatabaseError
+from psycopg_pool import PoolTimeout
+from app import app as flask_app, check_schema
+import db
+import db_async
+import fragcache
+import passwords
+import shards
+import writebehind
+
+wsgi = WsgiToAsgi(flask_app)
+_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+
+
+# ─────────────────────────────────────────────
+#  API endpoints (async mirrors of app.py's /api routes)
+# ─────────────────────────────────────────────
+
+async def api_sup_stats(sid):
+    rows = await db_async.call_func('get_supervisor_stats', (sid,))
+    return rows[0] if rows else {}
+
+async def api_facility_capacity(fid):
+    cap = await db_async.execute_one("SELECT * FROM v_facility_capacity WHERE facility_id=%s", (fid,))
+    return cap or {}
+
+async def api_write_behind():
+    return writebehind.metrics()
+
+async def api_passwords():
+    return passwords.metrics()
+
+async def api_fragment_cache():
+    return fragcache.metrics()
+
+async def api_db_metrics():
+    return dict(db.db_metrics(), async_pool=db_async.pool_metrics())
+
+# (path pattern, roles allowed or None for any logged-in account, handler)
+ROUTES = [
+    (re.compile(r'/api/supervisor-stats/(\d+)'),  ('admin',), api_sup_stats),
+    (re.compile(r'/api/facility-capacity/(\d+)'), None,       api_facility_capacity),
+    (re.compile(r'/api/write-behind'),            ('admin',), api_write_behind),
+    (re.compile(r'/api/passwords'),               ('admin',), api_passwords),
+    (re.compile(r'/api/fragment-cache'),          ('admin',), api_fragment_cache),
+    (re.compile(r'/api/db-metrics'),              ('admin',), api_db_metrics),
+]
+
+
+# ─────────────────────────────────────────────
+#  ASGI plumbing
+# ─────────────────────────────────────────────
+
+def _session(scope):
+    """The Flask session dict from the request cookie ({} if absent or tampered)."""
+    cookie = b'; '.join(v for k, v in scope['headers'] if k == b'cookie').decode('latin-1')
+    value  = parse_cookie(cookie).get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not value or _serializer is None:
+        return {}
+    try:
+        return _serializer.loads(value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+async def _send_json(send, status, body):
+    data = flask_app.json.dumps(body).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(data)).encode())]})
+    await send({'type': 'http.response.body', 'body': data})
+
+async def _api(scope, receive, send):
+    for pattern, roles, handler in ROUTES:
+        match = pattern.fullmatch(scope['path'])
+        if match:
+            break
+    else:
+        return await wsgi(scope, receive, send)     # not ours; let Flask answer (404 etc.)
+
+    if scope['method'] not in ('GET', 'HEAD'):
+        return await _send_json(send, 405, {'error': 'Method not allowed.'})
+    sess = _session(scope)
+    if 'account_id' not in sess:
+        return await _send_json(send, 401, {'error': 'Please log in.'})
+    if roles and sess.get('role') not in roles:
+        return await _send_json(send, 403, {'error': 'Access denied.'})
+    try:
+        if shards.directory_stale():
+            # Reloading the directory is a blocking psycopg2 query; keep it off the event loop.
+            shard = await asyncio.get_running_loop().run_in_executor(None, shards.session_shard, sess)
+        else:
+            shard = shards.session_shard(sess)
+        db.set_shard(shard)
+        result = await handler(*(int(g) for g in match.groups()))
+    except PoolTimeout:
+        return await _send_json(send, 503, {'error': 'Database busy, retry shortly.'})
+    except DatabaseError as e:
+        print(f'[asgi] {scope["path"]}: {e}')
+        return await _send_json(send, 500, {'error': 'Database error.'})
+    await _send_json(send, 200, result)
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, check_schema)
+                await db_async.open_pool()
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await db_async.close_pool()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] == 'http' and scope['path'].startswith('/api/'):
+        return await _api(scope, receive, send)
+    return await wsgi(scope, receive, send)
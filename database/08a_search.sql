@@ -0,0 +1,80 @@
+-- ============================================================
+-- 08a_search.sql — Ranked trigram search (admin search page)
+-- pg_trgm GIN indexes on user name/email/phone, pickup address
+-- and item description, and search_pickups() over them.
+-- ============================================================
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Serve ILIKE '%term%' and fuzzy (<%) matches in search_pickups
+CREATE INDEX idx_user_name_trgm     ON users USING GIN (full_name gin_trgm_ops);
+CREATE INDEX idx_user_email_trgm    ON users USING GIN (email gin_trgm_ops);
+CREATE INDEX idx_user_phone_trgm    ON users USING GIN (phone gin_trgm_ops);
+CREATE INDEX idx_pickup_addr_trgm   ON pickup_requests USING GIN (pickup_address gin_trgm_ops);
+CREATE INDEX idx_item_desc_trgm     ON items USING GIN (item_description gin_trgm_ops);
+
+
+-- ── search_pickups ────────────────────────────────────────
+-- Ranked admin search over user name/email/phone, pickup address and item
+-- description. Each branch is served by its trigram GIN index and keeps its
+-- best 500 candidates by word_similarity (a fixed cap, so every page
+-- ranks the same set); those are ranked together and paged.
+CREATE OR REPLACE FUNCTION search_pickups(
+    p_query  TEXT,
+    p_limit  INT DEFAULT 25,
+    p_offset INT DEFAULT 0
+)
+RETURNS TABLE (
+    pickup_id  INT,
+    matched_on TEXT,
+    rank       REAL
+) LANGUAGE plpgsql STABLE AS $$
+#variable_conflict use_column
+DECLARE
+    v_term TEXT := btrim(p_query);
+    v_pat  TEXT;
+    v_cap  CONSTANT INT := 500;
+BEGIN
+    IF length(v_term) < 3 THEN RETURN; END IF;
+    -- Escape LIKE wildcards so user input is matched literally
+    v_pat := '%' || replace(replace(replace(v_term, '\', '\\'), '%', '\%'), '_', '\_') || '%';
+
+    RETURN QUERY
+    SELECT h.pickup_id, h.matched_on, h.rank
+    FROM (
+        SELECT DISTINCT ON (x.pickup_id) x.pickup_id, x.matched_on, x.rank
+        FROM (
+            (SELECT p.pickup_id, 'user'::TEXT AS matched_on, uh.rank
+             FROM (
+                 SELECT u.user_id,
+                        GREATEST(word_similarity(v_term, u.full_name),
+                                 word_similarity(v_term, u.email),
+                                 word_similarity(v_term, u.phone)) AS rank
+                 FROM users u
+                 WHERE u.full_name ILIKE v_pat OR u.email ILIKE v_pat
+                    OR u.phone ILIKE v_pat OR v_term <% u.full_name
+                 ORDER BY rank DESC, u.user_id DESC
+                 LIMIT v_cap
+             ) uh
+             JOIN pickup_requests p ON p.user_id = uh.user_id
+             ORDER BY uh.rank DESC, p.pickup_id DESC
+             LIMIT v_cap)
+            UNION ALL
+            (SELECT p.pickup_id, 'address'::TEXT, word_similarity(v_term, p.pickup_address)
+             FROM pickup_requests p
+             WHERE p.pickup_address ILIKE v_pat OR v_term <% p.pickup_address
+             ORDER BY 3 DESC, p.pickup_id DESC
+             LIMIT v_cap)
+            UNION ALL
+            (SELECT i.pickup_id, 'item'::TEXT, word_similarity(v_term, i.item_description)
+             FROM items i
+             WHERE i.item_description ILIKE v_pat OR v_term <% i.item_description
+             ORDER BY 3 DESC, i.item_id DESC
+             LIMIT v_cap)
+        ) x
+        ORDER BY x.pickup_id, x.rank DESC
+    ) h
+    ORDER BY h.rank DESC, h.pickup_id DESC
+    LIMIT p_limit OFFSET p_offset;
+END;
+$$;
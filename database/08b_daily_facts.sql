@@ -0,0 +1,292 @@
+-- ============================================================
+-- 08b_daily_facts.sql — Daily fact tables for revenue / hazard analytics
+-- fact_revenue_daily and fact_hazard_daily are kept in step with
+-- system_revenue and items by triggers (T10–T12), backfilled
+-- below from the rows already there. get_revenue_by_range,
+-- get_revenue_by_period and get_hazardous_items_by_supervisor
+-- read them instead of scanning system_revenue / items.
+-- ============================================================
+
+-- ── fact_revenue_daily ────────────────────────────────────
+-- Pre-aggregated system_revenue per day/facility/material.
+CREATE TABLE fact_revenue_daily (
+    day           DATE          NOT NULL,
+    facility_id   INT           NOT NULL,
+    material_type VARCHAR(50)   NOT NULL,
+    weight_kg     DECIMAL(14,2) NOT NULL DEFAULT 0,
+    total_value   DECIMAL(16,2) NOT NULL DEFAULT 0,
+    entry_count   INT           NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, facility_id, material_type)
+);
+
+-- ── fact_hazard_daily ─────────────────────────────────────
+-- Hazardous item counts per item-created day/supervisor/category.
+-- An item counts when its category hazard_level >= 3 or it contains mercury.
+CREATE TABLE fact_hazard_daily (
+    day               DATE NOT NULL,
+    supervisor_id     INT  NOT NULL,
+    category_id       INT  NOT NULL,
+    hazardous_items   BIGINT NOT NULL DEFAULT 0,
+    mercury_items     BIGINT NOT NULL DEFAULT 0,
+    total_batteries   BIGINT NOT NULL DEFAULT 0,
+    high_hazard_items BIGINT NOT NULL DEFAULT 0,   -- category hazard_level >= 4
+    PRIMARY KEY (day, supervisor_id, category_id)
+);
+
+-- PKs lead with day for range scans; these serve per-entity lookups
+CREATE INDEX idx_fact_rev_facility  ON fact_revenue_daily(facility_id, day);
+CREATE INDEX idx_fact_haz_sup       ON fact_hazard_daily(supervisor_id, day);
+
+
+-- ── Backfill ──────────────────────────────────────────────
+-- Same rules as fn_apply_hazard_fact. Runs before the triggers
+-- exist, inside this migration's transaction.
+INSERT INTO fact_revenue_daily (day, facility_id, material_type, weight_kg, total_value, entry_count)
+SELECT recorded_at::DATE, facility_id, material_type, SUM(weight_kg), SUM(total_value), COUNT(*)
+FROM system_revenue GROUP BY 1, 2, 3;
+
+INSERT INTO fact_hazard_daily (day, supervisor_id, category_id, hazardous_items,
+                               mercury_items, total_batteries, high_hazard_items)
+SELECT i.created_at::DATE, p.supervisor_id, i.category_id,
+       COUNT(*),
+       COUNT(*) FILTER (WHERE COALESCE((i.hazard_details->>'contains_mercury')::BOOLEAN, FALSE)),
+       SUM(COALESCE((i.hazard_details->>'battery_count')::INT, 0)),
+       COUNT(*) FILTER (WHERE c.hazard_level >= 4)
+FROM items i
+JOIN pickup_requests p ON p.pickup_id = i.pickup_id
+JOIN categories c      ON c.category_id = i.category_id
+WHERE p.supervisor_id IS NOT NULL
+  AND (COALESCE(c.hazard_level, 0) >= 3
+       OR COALESCE((i.hazard_details->>'contains_mercury')::BOOLEAN, FALSE))
+GROUP BY 1, 2, 3;
+
+
+-- ── get_revenue_by_range ──────────────────────────────────
+-- Revenue per day/week/month between two dates (inclusive), with a JSONB
+-- material breakdown. Reads fact_revenue_daily, never system_revenue.
+CREATE OR REPLACE FUNCTION get_revenue_by_range(
+    p_from        DATE,
+    p_to          DATE,
+    p_granularity TEXT DEFAULT 'month'
+)
+RETURNS TABLE (
+    period             TEXT,
+    period_start       DATE,
+    total_revenue      NUMERIC,
+    total_weight_kg    NUMERIC,
+    material_breakdown JSONB
+) LANGUAGE plpgsql STABLE AS $$
+BEGIN
+    IF p_granularity NOT IN ('day','week','month') THEN
+        RAISE EXCEPTION 'Granularity must be day, week or month (got %).', p_granularity;
+    END IF;
+
+    RETURN QUERY
+    WITH base AS (
+        SELECT date_trunc(p_granularity, f.day)::DATE AS period_start,
+               f.material_type,
+               SUM(f.total_value)::NUMERIC AS material_value,
+               SUM(f.weight_kg)::NUMERIC   AS material_weight
+        FROM fact_revenue_daily f
+        WHERE f.day BETWEEN p_from AND p_to
+        GROUP BY 1, 2
+    )
+    SELECT
+        CASE p_granularity
+            WHEN 'day'  THEN TO_CHAR(b.period_start, 'DD Mon YYYY')
+            WHEN 'week' THEN 'Week ' || TO_CHAR(b.period_start, 'IW IYYY')
+            ELSE             TO_CHAR(b.period_start, 'Mon YYYY')
+        END,
+        b.period_start,
+        SUM(b.material_value),
+        SUM(b.material_weight),
+        COALESCE(jsonb_object_agg(b.material_type, ROUND(b.material_value, 2)), '{}'::jsonb)
+    FROM base b
+    GROUP BY b.period_start
+    ORDER BY b.period_start DESC;
+END;
+$$;
+
+
+-- ── get_revenue_by_period ─────────────────────────────────
+-- Monthly revenue breakdown for the last p_months (business income).
+-- Kept for existing callers; delegates to get_revenue_by_range.
+CREATE OR REPLACE FUNCTION get_revenue_by_period(p_months INT DEFAULT 12)
+RETURNS TABLE (
+    period             TEXT,
+    yr                 DOUBLE PRECISION,
+    mo                 DOUBLE PRECISION,
+    total_revenue      NUMERIC,
+    material_breakdown JSONB
+) LANGUAGE sql STABLE AS $$
+    SELECT
+        r.period,
+        EXTRACT(YEAR  FROM r.period_start)::DOUBLE PRECISION,
+        EXTRACT(MONTH FROM r.period_start)::DOUBLE PRECISION,
+        r.total_revenue,
+        r.material_breakdown
+    FROM get_revenue_by_range(
+        (NOW() - (p_months || ' months')::INTERVAL)::DATE, CURRENT_DATE, 'month') r;
+$$;
+
+
+-- ── get_hazardous_items_by_supervisor ─────────────────────
+-- Hazardous item stats per supervisor, optionally limited to items created
+-- between p_from and p_to. Reads fact_hazard_daily instead of scanning items.
+DROP FUNCTION IF EXISTS get_hazardous_items_by_supervisor();
+CREATE OR REPLACE FUNCTION get_hazardous_items_by_supervisor(
+    p_from DATE DEFAULT NULL,
+    p_to   DATE DEFAULT NULL
+)
+RETURNS TABLE (
+    supervisor_id   INT,
+    supervisor_name VARCHAR,
+    total_hazardous BIGINT,
+    mercury_count   BIGINT,
+    total_batteries BIGINT,
+    hazard_summary  JSONB
+) LANGUAGE sql STABLE AS $$
+    SELECT
+        f.supervisor_id,
+        s.full_name,
+        SUM(f.hazardous_items)::BIGINT,
+        SUM(f.mercury_items)::BIGINT,
+        SUM(f.total_batteries)::BIGINT,
+        jsonb_build_object(
+            'mercury_items',     SUM(f.mercury_items),
+            'total_batteries',   SUM(f.total_batteries),
+            'high_hazard_items', SUM(f.high_hazard_items)
+        )
+    FROM fact_hazard_daily f
+    JOIN staff s ON f.supervisor_id = s.staff_id
+    WHERE (p_from IS NULL OR f.day >= p_from)
+      AND (p_to   IS NULL OR f.day <= p_to)
+    GROUP BY f.supervisor_id, s.full_name
+    HAVING SUM(f.hazardous_items) > 0;
+$$;
+
+
+-- ────────────────────────────────────────────────────────────
+-- T10: trg_fact_revenue
+-- Keeps fact_revenue_daily in step with system_revenue
+-- (rows are inserted by complete_batch).
+-- ────────────────────────────────────────────────────────────
+CREATE OR REPLACE FUNCTION fn_fact_revenue()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE','DELETE') THEN
+        UPDATE fact_revenue_daily
+        SET    weight_kg   = weight_kg   - OLD.weight_kg,
+               total_value = total_value - OLD.total_value,
+               entry_count = entry_count - 1
+        WHERE  day = OLD.recorded_at::DATE
+          AND  facility_id   = OLD.facility_id
+          AND  material_type = OLD.material_type;
+    END IF;
+    IF TG_OP IN ('INSERT','UPDATE') THEN
+        INSERT INTO fact_revenue_daily AS f (day, facility_id, material_type, weight_kg, total_value, entry_count)
+        VALUES (NEW.recorded_at::DATE, NEW.facility_id, NEW.material_type, NEW.weight_kg, NEW.total_value, 1)
+        ON CONFLICT (day, facility_id, material_type) DO UPDATE
+        SET    weight_kg   = f.weight_kg   + EXCLUDED.weight_kg,
+               total_value = f.total_value + EXCLUDED.total_value,
+               entry_count = f.entry_count + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_fact_revenue
+AFTER INSERT OR UPDATE OR DELETE ON system_revenue
+FOR EACH ROW EXECUTE FUNCTION fn_fact_revenue();
+
+
+-- ────────────────────────────────────────────────────────────
+-- T11: trg_fact_hazard_items
+-- Adds/removes an item's contribution to fact_hazard_daily.
+-- Items of pickups without a supervisor are counted once one is
+-- assigned (see T12).
+-- ────────────────────────────────────────────────────────────
+CREATE OR REPLACE FUNCTION fn_apply_hazard_fact(
+    p_day           DATE,
+    p_supervisor_id INT,
+    p_category_id   INT,
+    p_hazard        JSONB,
+    p_sign          INT      -- +1 add, -1 remove
+) RETURNS VOID LANGUAGE plpgsql AS $$
+DECLARE
+    v_level   INT;
+    v_mercury BOOLEAN;
+BEGIN
+    IF p_supervisor_id IS NULL THEN RETURN; END IF;
+
+    SELECT hazard_level INTO v_level FROM categories WHERE category_id = p_category_id;
+    v_mercury := COALESCE((p_hazard->>'contains_mercury')::BOOLEAN, FALSE);
+    IF NOT (COALESCE(v_level, 0) >= 3 OR v_mercury) THEN RETURN; END IF;
+
+    INSERT INTO fact_hazard_daily AS f
+        (day, supervisor_id, category_id, hazardous_items, mercury_items, total_batteries, high_hazard_items)
+    VALUES (
+        p_day, p_supervisor_id, p_category_id,
+        p_sign,
+        CASE WHEN v_mercury THEN p_sign ELSE 0 END,
+        p_sign * COALESCE((p_hazard->>'battery_count')::INT, 0),
+        CASE WHEN v_level >= 4 THEN p_sign ELSE 0 END
+    )
+    ON CONFLICT (day, supervisor_id, category_id) DO UPDATE
+    SET    hazardous_items   = f.hazardous_items   + EXCLUDED.hazardous_items,
+           mercury_items     = f.mercury_items     + EXCLUDED.mercury_items,
+           total_batteries   = f.total_batteries   + EXCLUDED.total_batteries,
+           high_hazard_items = f.high_hazard_items + EXCLUDED.high_hazard_items;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION fn_fact_hazard_items()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE','DELETE') THEN
+        PERFORM fn_apply_hazard_fact(
+            OLD.created_at::DATE,
+            (SELECT supervisor_id FROM pickup_requests WHERE pickup_id = OLD.pickup_id),
+            OLD.category_id, OLD.hazard_details, -1);
+    END IF;
+    IF TG_OP IN ('INSERT','UPDATE') THEN
+        PERFORM fn_apply_hazard_fact(
+            NEW.created_at::DATE,
+            (SELECT supervisor_id FROM pickup_requests WHERE pickup_id = NEW.pickup_id),
+            NEW.category_id, NEW.hazard_details, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_fact_hazard_items
+AFTER INSERT OR DELETE OR UPDATE OF category_id, hazard_details, pickup_id ON items
+FOR EACH ROW EXECUTE FUNCTION fn_fact_hazard_items();
+
+
+-- ────────────────────────────────────────────────────────────
+-- T12: trg_fact_hazard_supervisor
+-- Moves a pickup's hazard facts when its supervisor changes.
+-- ────────────────────────────────────────────────────────────
+CREATE OR REPLACE FUNCTION fn_fact_hazard_supervisor()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+DECLARE
+    v_item RECORD;
+BEGIN
+    FOR v_item IN
+        SELECT created_at, category_id, hazard_details FROM items WHERE pickup_id = NEW.pickup_id
+    LOOP
+        PERFORM fn_apply_hazard_fact(v_item.created_at::DATE, OLD.supervisor_id,
+                                     v_item.category_id, v_item.hazard_details, -1);
+        PERFORM fn_apply_hazard_fact(v_item.created_at::DATE, NEW.supervisor_id,
+                                     v_item.category_id, v_item.hazard_details, 1);
+    END LOOP;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_fact_hazard_supervisor
+AFTER UPDATE OF supervisor_id ON pickup_requests
+FOR EACH ROW
+WHEN (OLD.supervisor_id IS DISTINCT FROM NEW.supervisor_id)
+EXECUTE FUNCTION fn_fact_hazard_supervisor();
@@ -0,0 +1,427 @@
+-- ============================================================
+-- 09_archive.sql — Archival tier for completed pickups
+-- Completed pickups older than N months move, with their items,
+-- weight records, payments and payment requests, into *_archive
+-- tables. Their contribution to lifetime totals is folded into
+-- archive_*_totals so reports stay correct while hot tables stay
+-- small. History pages read v_pickup_history / v_payment_history.
+-- Run by: python maintenance.py archive --months 12
+-- ============================================================
+
+-- ── Archive tables (same columns + archived_at) ───────────
+CREATE TABLE pickup_requests_archive  (LIKE pickup_requests);
+CREATE TABLE items_archive            (LIKE items);
+CREATE TABLE weight_records_archive   (LIKE weight_records);
+CREATE TABLE payments_archive         (LIKE payments);
+CREATE TABLE payment_requests_archive (LIKE payment_requests);
+
+ALTER TABLE pickup_requests_archive  ADD PRIMARY KEY (pickup_id),  ADD COLUMN archived_at TIMESTAMP DEFAULT NOW();
+ALTER TABLE items_archive            ADD PRIMARY KEY (item_id),    ADD COLUMN archived_at TIMESTAMP DEFAULT NOW();
+ALTER TABLE weight_records_archive   ADD PRIMARY KEY (weight_id),  ADD COLUMN archived_at TIMESTAMP DEFAULT NOW();
+ALTER TABLE payments_archive         ADD PRIMARY KEY (payment_id), ADD COLUMN archived_at TIMESTAMP DEFAULT NOW();
+ALTER TABLE payment_requests_archive ADD PRIMARY KEY (request_id), ADD COLUMN archived_at TIMESTAMP DEFAULT NOW();
+
+CREATE INDEX idx_pickup_arch_user       ON pickup_requests_archive(user_id);
+CREATE INDEX idx_pickup_arch_supervisor ON pickup_requests_archive(supervisor_id);
+CREATE INDEX idx_pickup_arch_driver     ON pickup_requests_archive(driver_id);
+CREATE INDEX idx_pickup_arch_collector  ON pickup_requests_archive(collector_id);
+CREATE INDEX idx_item_arch_pickup       ON items_archive(pickup_id);
+CREATE INDEX idx_weight_arch_item       ON weight_records_archive(item_id);
+CREATE INDEX idx_payment_arch_pickup    ON payments_archive(pickup_id);
+CREATE INDEX idx_pr_arch_pickup         ON payment_requests_archive(pickup_id);
+
+-- Batch membership of archived items is kept for batch history.
+ALTER TABLE batch_items
+    DROP CONSTRAINT fk_bitem_item,
+    DROP CONSTRAINT fk_bitem_pickup;
+
+
+-- ── Lifetime totals of archived rows ──────────────────────
+-- Only completed pickups are archived, so every archived pickup is completed.
+CREATE TABLE archive_user_totals (
+    user_id          INT PRIMARY KEY REFERENCES users(user_id),
+    pickups          BIGINT        NOT NULL DEFAULT 0,
+    total_weight_kg  DECIMAL(14,2) NOT NULL DEFAULT 0,
+    total_earnings   DECIMAL(14,2) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE archive_supervisor_totals (
+    supervisor_id    INT PRIMARY KEY REFERENCES staff(staff_id),
+    pickups          BIGINT        NOT NULL DEFAULT 0,
+    total_weight_kg  DECIMAL(14,2) NOT NULL DEFAULT 0,
+    total_paid_out   DECIMAL(14,2) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE archive_category_totals (
+    category_id      INT PRIMARY KEY REFERENCES categories(category_id),
+    items            BIGINT        NOT NULL DEFAULT 0,
+    total_weight_kg  DECIMAL(14,2) NOT NULL DEFAULT 0,   -- SUM(actual_weight_kg)
+    mercury_items    BIGINT        NOT NULL DEFAULT 0
+);
+
+
+-- ── Triggers: archiving is a move, not a delete ───────────
+-- archive_completed_pickups sets app.archiving so row-level audit and
+-- hazard-fact triggers skip the rows it moves (one ARCHIVE audit row instead).
+CREATE OR REPLACE FUNCTION fn_audit_pickups()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF current_setting('app.archiving', TRUE) = 'on' THEN RETURN NULL; END IF;
+    INSERT INTO audit_log (table_name, operation, record_id, old_values, new_values, changed_by)
+    VALUES (
+        'pickup_requests', TG_OP,
+        COALESCE(NEW.pickup_id, OLD.pickup_id),
+        CASE WHEN TG_OP = 'INSERT' THEN NULL ELSE row_to_json(OLD)::JSONB END,
+        CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE row_to_json(NEW)::JSONB END,
+        current_setting('app.current_user', TRUE)
+    );
+    RETURN COALESCE(NEW, OLD);
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION fn_audit_payments()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF current_setting('app.archiving', TRUE) = 'on' THEN RETURN NULL; END IF;
+    INSERT INTO audit_log (table_name, operation, record_id, old_values, new_values, changed_by)
+    VALUES (
+        'payments', TG_OP,
+        COALESCE(NEW.payment_id, OLD.payment_id),
+        CASE WHEN TG_OP = 'INSERT' THEN NULL ELSE row_to_json(OLD)::JSONB END,
+        CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE row_to_json(NEW)::JSONB END,
+        current_setting('app.current_user', TRUE)
+    );
+    RETURN COALESCE(NEW, OLD);
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION fn_fact_hazard_items()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF current_setting('app.archiving', TRUE) = 'on' THEN RETURN NULL; END IF;
+    IF TG_OP IN ('UPDATE','DELETE') THEN
+        PERFORM fn_apply_hazard_fact(
+            OLD.created_at::DATE,
+            (SELECT supervisor_id FROM pickup_requests WHERE pickup_id = OLD.pickup_id),
+            OLD.category_id, OLD.hazard_details, -1);
+    END IF;
+    IF TG_OP IN ('INSERT','UPDATE') THEN
+        PERFORM fn_apply_hazard_fact(
+            NEW.created_at::DATE,
+            (SELECT supervisor_id FROM pickup_requests WHERE pickup_id = NEW.pickup_id),
+            NEW.category_id, NEW.hazard_details, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+
+-- ── archive_completed_pickups ─────────────────────────────
+-- Moves up to p_batch_size completed pickups older than p_months.
+-- Skips pickups still in an open/processing batch or with a pending
+-- payment request. Call repeatedly until p_archived = 0.
+CREATE OR REPLACE PROCEDURE archive_completed_pickups(
+    IN  p_months     INT,
+    IN  p_batch_size INT,
+    OUT p_archived   INT
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_ids INT[];
+BEGIN
+    SELECT array_agg(c.pickup_id) INTO v_ids
+    FROM (
+        SELECT p.pickup_id
+        FROM   pickup_requests p
+        WHERE  p.status = 'completed'
+          AND  p.completed_time < NOW() - make_interval(months => p_months)
+          AND  NOT EXISTS (
+                   SELECT 1 FROM batch_items bi
+                   JOIN recycling_batches b ON b.batch_id = bi.batch_id
+                   WHERE bi.pickup_id = p.pickup_id AND b.status IN ('open','processing'))
+          AND  NOT EXISTS (
+                   SELECT 1 FROM payment_requests pr
+                   WHERE pr.pickup_id = p.pickup_id AND pr.status = 'pending')
+        ORDER  BY p.pickup_id
+        LIMIT  p_batch_size
+        FOR UPDATE SKIP LOCKED
+    ) c;
+
+    IF v_ids IS NULL THEN
+        p_archived := 0;
+        RETURN;
+    END IF;
+
+    PERFORM set_config('app.archiving', 'on', TRUE);
+
+    -- Fold into lifetime totals before the rows leave the hot tables
+    INSERT INTO archive_user_totals AS t (user_id, pickups, total_weight_kg, total_earnings)
+    SELECT user_id, COUNT(*), COALESCE(SUM(total_weight_kg), 0), COALESCE(SUM(total_amount), 0)
+    FROM   pickup_requests WHERE pickup_id = ANY(v_ids)
+    GROUP  BY user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET    pickups         = t.pickups         + EXCLUDED.pickups,
+           total_weight_kg = t.total_weight_kg + EXCLUDED.total_weight_kg,
+           total_earnings  = t.total_earnings  + EXCLUDED.total_earnings;
+
+    INSERT INTO archive_supervisor_totals AS t (supervisor_id, pickups, total_weight_kg, total_paid_out)
+    SELECT p.supervisor_id, COUNT(*), COALESCE(SUM(p.total_weight_kg), 0), COALESCE(SUM(py.paid), 0)
+    FROM   pickup_requests p
+    LEFT JOIN (
+        SELECT pickup_id, SUM(amount) AS paid FROM payments
+        WHERE  pickup_id = ANY(v_ids) AND payment_status = 'completed'
+        GROUP  BY pickup_id
+    ) py ON py.pickup_id = p.pickup_id
+    WHERE  p.pickup_id = ANY(v_ids) AND p.supervisor_id IS NOT NULL
+    GROUP  BY p.supervisor_id
+    ON CONFLICT (supervisor_id) DO UPDATE
+    SET    pickups         = t.pickups         + EXCLUDED.pickups,
+           total_weight_kg = t.total_weight_kg + EXCLUDED.total_weight_kg,
+           total_paid_out  = t.total_paid_out  + EXCLUDED.total_paid_out;
+
+    INSERT INTO archive_category_totals AS t (category_id, items, total_weight_kg, mercury_items)
+    SELECT category_id, COUNT(*), COALESCE(SUM(actual_weight_kg), 0),
+           COUNT(*) FILTER (WHERE (hazard_details->>'contains_mercury')::BOOLEAN = TRUE)
+    FROM   items WHERE pickup_id = ANY(v_ids)
+    GROUP  BY category_id
+    ON CONFLICT (category_id) DO UPDATE
+    SET    items           = t.items           + EXCLUDED.items,
+           total_weight_kg = t.total_weight_kg + EXCLUDED.total_weight_kg,
+           mercury_items   = t.mercury_items   + EXCLUDED.mercury_items;
+
+    -- Move rows, children first
+    WITH m AS (DELETE FROM payment_requests WHERE pickup_id = ANY(v_ids) RETURNING *)
+    INSERT INTO payment_requests_archive SELECT m.*, NOW() FROM m;
+
+    WITH m AS (DELETE FROM payments WHERE pickup_id = ANY(v_ids) RETURNING *)
+    INSERT INTO payments_archive SELECT m.*, NOW() FROM m;
+
+    WITH m AS (
+        DELETE FROM weight_records wr USING items i
+        WHERE  wr.item_id = i.item_id AND i.pickup_id = ANY(v_ids)
+        RETURNING wr.*
+    )
+    INSERT INTO weight_records_archive SELECT m.*, NOW() FROM m;
+
+    WITH m AS (DELETE FROM items WHERE pickup_id = ANY(v_ids) RETURNING *)
+    INSERT INTO items_archive SELECT m.*, NOW() FROM m;
+
+    WITH m AS (DELETE FROM pickup_requests WHERE pickup_id = ANY(v_ids) RETURNING *)
+    INSERT INTO pickup_requests_archive SELECT m.*, NOW() FROM m;
+
+    p_archived := array_length(v_ids, 1);
+
+    INSERT INTO audit_log (table_name, operation, record_id, new_values, changed_by)
+    VALUES ('pickup_requests', 'ARCHIVE', v_ids[1],
+            jsonb_build_object('pickup_ids', to_jsonb(v_ids), 'count', p_archived, 'older_than_months', p_months),
+            current_setting('app.current_user', TRUE));
+END;
+$$;
+
+
+-- ── History views: hot + archive ──────────────────────────
+CREATE OR REPLACE VIEW v_pickup_history AS
+SELECT v.*, FALSE AS is_archived
+FROM v_pickup_full v
+UNION ALL
+SELECT
+    p.pickup_id,
+    p.user_id,
+    u.full_name,
+    u.phone,
+    u.email,
+    p.preferred_date,
+    p.pickup_address,
+    p.status,
+    p.total_weight_kg,
+    p.total_amount,
+    p.payment_due_by,
+    p.payment_request_count,
+    p.notes,
+    p.request_date,
+    p.scheduled_time,
+    p.collected_at,
+    p.collector_confirmed,
+    p.collector_confirmed_at,
+    p.driver_confirmed,
+    p.driver_confirmed_at,
+    p.completed_time,
+    p.supervisor_id,
+    sup.full_name,
+    p.driver_id,
+    drv.full_name,
+    p.collector_id,
+    col.full_name,
+    v.vehicle_number,
+    v.vehicle_type,
+    rf.facility_name,
+    rf.location,
+    (SELECT COUNT(*) FROM items_archive i WHERE i.pickup_id = p.pickup_id),
+    FALSE,                  -- archived pickups are completed: never overdue
+    FALSE,                  -- ... and have no pending payment request
+    TRUE
+FROM pickup_requests_archive p
+JOIN  users u   ON p.user_id    = u.user_id
+LEFT JOIN staff sup ON p.supervisor_id = sup.staff_id
+LEFT JOIN staff drv ON p.driver_id     = drv.staff_id
+LEFT JOIN staff col ON p.collector_id  = col.staff_id
+LEFT JOIN vehicles v ON p.assigned_vehicle_id = v.vehicle_id
+LEFT JOIN recycling_facilities rf ON p.assigned_facility_id = rf.facility_id;
+
+
+CREATE OR REPLACE VIEW v_item_history AS
+SELECT d.*, FALSE AS is_archived
+FROM v_item_details d
+UNION ALL
+SELECT
+    i.item_id,
+    i.pickup_id,
+    i.item_description,
+    i.condition,
+    i.estimated_weight_kg,
+    i.actual_weight_kg,
+    i.hazard_details,
+    i.hazard_details->>'contains_mercury',
+    i.hazard_details->>'battery_count',
+    i.created_at,
+    c.category_name,
+    c.base_price_per_kg,
+    c.hazard_level,
+    c.recyclability_percentage,
+    c.material_composition,
+    u.full_name,
+    p.status,
+    p.supervisor_id,
+    ROUND(COALESCE(i.actual_weight_kg, i.estimated_weight_kg, 0) * c.base_price_per_kg, 2),
+    TRUE
+FROM items_archive i
+JOIN categories              c ON i.category_id = c.category_id
+JOIN pickup_requests_archive p ON i.pickup_id   = p.pickup_id
+JOIN users                   u ON p.user_id     = u.user_id;
+
+
+CREATE OR REPLACE VIEW v_payment_history AS
+SELECT py.*, FALSE AS is_archived
+FROM payments py
+UNION ALL
+SELECT payment_id, pickup_id, amount, payment_method, payment_status,
+       transaction_reference, processed_by, processed_at, notes, TRUE
+FROM payments_archive;
+
+
+-- ── Lifetime views include archived totals ────────────────
+CREATE OR REPLACE VIEW v_supervisor_team AS
+SELECT
+    sup.staff_id                                 AS supervisor_id,
+    sup.full_name                                AS supervisor_name,
+    sup.contact_number                           AS supervisor_contact,
+    sup.is_active                                AS supervisor_active,
+    -- team counts
+    COUNT(DISTINCT m.staff_id) FILTER (WHERE m.sub_role = 'driver')
+                                                 AS driver_count,
+    COUNT(DISTINCT m.staff_id) FILTER (WHERE m.sub_role = 'collector')
+                                                 AS collector_count,
+    COUNT(DISTINCT veh.vehicle_id)               AS vehicle_count,
+    -- pickup KPIs (hot rows + archived totals)
+    COUNT(DISTINCT p.pickup_id) + COALESCE(MAX(arc.pickups), 0)
+                                                 AS total_pickups,
+    COUNT(DISTINCT p.pickup_id) FILTER (WHERE p.status = 'completed') + COALESCE(MAX(arc.pickups), 0)
+                                                 AS completed_pickups,
+    COUNT(DISTINCT p.pickup_id) FILTER (WHERE p.status = 'collected')
+                                                 AS pending_payment,
+    COALESCE(SUM(p.total_weight_kg) FILTER (WHERE p.status = 'completed'), 0) + COALESCE(MAX(arc.total_weight_kg), 0)
+                                                 AS total_weight_kg,
+    COALESCE(SUM(py.amount) FILTER (WHERE py.payment_status = 'completed'), 0) + COALESCE(MAX(arc.total_paid_out), 0)
+                                                 AS total_paid_out
+FROM staff sup
+LEFT JOIN staff            m   ON m.supervisor_id = sup.staff_id
+LEFT JOIN vehicles         veh ON veh.supervisor_id = sup.staff_id
+LEFT JOIN pickup_requests  p   ON p.supervisor_id = sup.staff_id
+LEFT JOIN payments         py  ON py.pickup_id = p.pickup_id
+LEFT JOIN archive_supervisor_totals arc ON arc.supervisor_id = sup.staff_id
+WHERE sup.sub_role = 'supervisor'
+GROUP BY sup.staff_id, sup.full_name, sup.contact_number, sup.is_active;
+
+
+CREATE OR REPLACE VIEW v_category_statistics AS
+SELECT
+    c.category_id,
+    c.category_name,
+    c.base_price_per_kg,
+    c.hazard_level,
+    c.recyclability_percentage,
+    c.material_composition,
+    COUNT(i.item_id) + COALESCE(MAX(arc.items), 0)  AS total_items,
+    COALESCE(SUM(i.actual_weight_kg), 0) + COALESCE(MAX(arc.total_weight_kg), 0)
+                                                    AS total_weight_kg,
+    ROUND((COALESCE(SUM(i.actual_weight_kg), 0) + COALESCE(MAX(arc.total_weight_kg), 0))
+          * c.base_price_per_kg, 2)                 AS total_payout_value,
+    -- hazardous item count via JSONB
+    COUNT(i.item_id) FILTER (
+        WHERE (i.hazard_details->>'contains_mercury')::boolean = TRUE
+    ) + COALESCE(MAX(arc.mercury_items), 0)         AS mercury_items
+FROM categories c
+LEFT JOIN items i ON c.category_id = i.category_id
+LEFT JOIN archive_category_totals arc ON arc.category_id = c.category_id
+GROUP BY c.category_id, c.category_name, c.base_price_per_kg,
+         c.hazard_level, c.recyclability_percentage, c.material_composition;
+
+
+CREATE OR REPLACE VIEW v_user_activity AS
+SELECT
+    u.user_id,
+    u.full_name,
+    u.email,
+    u.city,
+    u.user_status,
+    u.is_active,
+    u.registered_at,
+    u.last_pickup_at,
+    COUNT(p.pickup_id) + COALESCE(MAX(arc.pickups), 0)                        AS total_pickups,
+    COUNT(p.pickup_id) FILTER (WHERE p.status = 'completed') + COALESCE(MAX(arc.pickups), 0)
+                                                                              AS completed_pickups,
+    COALESCE(SUM(p.total_weight_kg) FILTER (WHERE p.status='completed'), 0) + COALESCE(MAX(arc.total_weight_kg), 0)
+                                                                              AS total_weight,
+    COALESCE(SUM(p.total_amount)    FILTER (WHERE p.status='completed'), 0) + COALESCE(MAX(arc.total_earnings), 0)
+                                                                              AS total_earnings,
+    (SELECT COUNT(*) FROM warnings w WHERE w.target_user_id = u.user_id) AS warning_count
+FROM users u
+LEFT JOIN pickup_requests p ON u.user_id = p.user_id
+LEFT JOIN archive_user_totals arc ON arc.user_id = u.user_id
+GROUP BY u.user_id, u.full_name, u.email, u.city, u.user_status,
+         u.is_active, u.registered_at, u.last_pickup_at;
+
+
+-- ── get_supervisor_stats: include archived totals ─────────
+CREATE OR REPLACE FUNCTION get_supervisor_stats(p_supervisor_id INT)
+RETURNS TABLE (
+    total_pickups       BIGINT,
+    completed_pickups   BIGINT,
+    collected_unpaid    BIGINT,
+    total_weight_kg     DECIMAL,
+    total_paid_out      DECIMAL,
+    driver_count        BIGINT,
+    collector_count     BIGINT,
+    vehicle_count       BIGINT,
+    overdue_payments    BIGINT
+) LANGUAGE plpgsql STABLE AS $$
+DECLARE
+    v_arc archive_supervisor_totals%ROWTYPE;
+BEGIN
+    SELECT * INTO v_arc FROM archive_supervisor_totals WHERE supervisor_id = p_supervisor_id;
+
+    RETURN QUERY
+    SELECT
+        COUNT(p.pickup_id) + COALESCE(v_arc.pickups, 0),
+        COUNT(p.pickup_id) FILTER (WHERE p.status = 'completed') + COALESCE(v_arc.pickups, 0),
+        COUNT(p.pickup_id) FILTER (WHERE p.status = 'collected'),
+        COALESCE(SUM(p.total_weight_kg) FILTER (WHERE p.status = 'completed'), 0) + COALESCE(v_arc.total_weight_kg, 0),
+        COALESCE(SUM(py.amount) FILTER (WHERE py.payment_status = 'completed'), 0) + COALESCE(v_arc.total_paid_out, 0),
+        (SELECT COUNT(*) FROM staff WHERE supervisor_id = p_supervisor_id AND sub_role = 'driver' AND is_active),
+        (SELECT COUNT(*) FROM staff WHERE supervisor_id = p_supervisor_id AND sub_role = 'collector' AND is_active),
+        (SELECT COUNT(*) FROM vehicles WHERE supervisor_id = p_supervisor_id),
+        (SELECT COUNT(*) FROM v_overdue_payments WHERE supervisor_id = p_supervisor_id)
+    FROM pickup_requests  p
+    LEFT JOIN payments py ON py.pickup_id = p.pickup_id
+    WHERE p.supervisor_id = p_supervisor_id;
+END;
+$$;
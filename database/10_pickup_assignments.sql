@@ -0,0 +1,107 @@
+-- ============================================================
+-- 10_pickup_assignments.sql — Crew assignment index structure
+-- One row per (pickup, crew role), kept in sync with
+-- pickup_requests.driver_id / collector_id by trigger. Field pages
+-- read a staff member's active / done pickups with one range scan
+-- of a partial index, instead of BitmapOr over driver_id and
+-- collector_id plus a status filter.
+-- Rows are kept when a pickup is archived (field history spans both).
+-- ============================================================
+
+-- ── fn_assignment_phase ───────────────────────────────────
+-- Which field page a pickup belongs on, for each crew role:
+--   collector: field_assigned = active; picked_up/collected/completed = done
+--   driver:    field_assigned/picked_up = active; delivered/collected/completed = done
+CREATE OR REPLACE FUNCTION fn_assignment_phase(p_role TEXT, p_status TEXT)
+RETURNS TEXT LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE
+        WHEN p_role = 'collector' AND p_status = 'field_assigned'                         THEN 'active'
+        WHEN p_role = 'collector' AND p_status IN ('picked_up','collected','completed')   THEN 'done'
+        WHEN p_role = 'driver'    AND p_status IN ('field_assigned','picked_up')          THEN 'active'
+        WHEN p_role = 'driver'    AND p_status IN ('delivered','collected','completed')   THEN 'done'
+        ELSE 'other'
+    END
+$$;
+
+
+-- ── pickup_assignments ────────────────────────────────────
+CREATE TABLE pickup_assignments (
+    pickup_id       INT         NOT NULL,
+    role            VARCHAR(10) NOT NULL CHECK (role IN ('driver','collector')),
+    staff_id        INT         NOT NULL,
+    status          VARCHAR(30) NOT NULL,
+    scheduled_time  TIMESTAMP,
+    collected_at    TIMESTAMP,
+    total_weight_kg DECIMAL(10,2) DEFAULT 0,
+    phase           VARCHAR(10) GENERATED ALWAYS AS (fn_assignment_phase(role, status)) STORED,
+    PRIMARY KEY (pickup_id, role)
+);
+
+CREATE INDEX idx_assign_active ON pickup_assignments(staff_id, scheduled_time)
+    INCLUDE (pickup_id) WHERE phase = 'active';
+CREATE INDEX idx_assign_done   ON pickup_assignments(staff_id, collected_at DESC)
+    INCLUDE (pickup_id, total_weight_kg) WHERE phase = 'done';
+
+-- Backfill (hot + archived pickups)
+INSERT INTO pickup_assignments (pickup_id, role, staff_id, status, scheduled_time, collected_at, total_weight_kg)
+SELECT p.pickup_id, c.role, c.staff_id, p.status, p.scheduled_time, p.collected_at, p.total_weight_kg
+FROM (
+    SELECT pickup_id, driver_id, collector_id, status, scheduled_time, collected_at, total_weight_kg
+    FROM pickup_requests
+    UNION ALL
+    SELECT pickup_id, driver_id, collector_id, status, scheduled_time, collected_at, total_weight_kg
+    FROM pickup_requests_archive
+) p
+CROSS JOIN LATERAL (VALUES ('driver', p.driver_id), ('collector', p.collector_id)) AS c(role, staff_id)
+WHERE c.staff_id IS NOT NULL;
+
+
+-- ── trg_sync_pickup_assignments ───────────────────────────
+CREATE OR REPLACE FUNCTION fn_sync_pickup_assignments()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        -- Archiving moves the pickup; its crew rows stay for field history.
+        IF current_setting('app.archiving', TRUE) IS DISTINCT FROM 'on' THEN
+            DELETE FROM pickup_assignments WHERE pickup_id = OLD.pickup_id;
+        END IF;
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO pickup_assignments AS a
+        (pickup_id, role, staff_id, status, scheduled_time, collected_at, total_weight_kg)
+    SELECT NEW.pickup_id, c.role, c.staff_id, NEW.status, NEW.scheduled_time, NEW.collected_at, NEW.total_weight_kg
+    FROM (VALUES ('driver', NEW.driver_id), ('collector', NEW.collector_id)) AS c(role, staff_id)
+    WHERE c.staff_id IS NOT NULL
+    ON CONFLICT (pickup_id, role) DO UPDATE
+    SET    staff_id        = EXCLUDED.staff_id,
+           status          = EXCLUDED.status,
+           scheduled_time  = EXCLUDED.scheduled_time,
+           collected_at    = EXCLUDED.collected_at,
+           total_weight_kg = EXCLUDED.total_weight_kg;
+
+    IF TG_OP = 'UPDATE' AND (NEW.driver_id IS NULL OR NEW.collector_id IS NULL) THEN
+        DELETE FROM pickup_assignments
+        WHERE  pickup_id = NEW.pickup_id
+          AND  ((role = 'driver' AND NEW.driver_id IS NULL)
+             OR (role = 'collector' AND NEW.collector_id IS NULL));
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_sync_pickup_assignments
+AFTER INSERT OR DELETE ON pickup_requests
+FOR EACH ROW EXECUTE FUNCTION fn_sync_pickup_assignments();
+
+CREATE TRIGGER trg_sync_pickup_assignments_upd
+AFTER UPDATE OF driver_id, collector_id, status, scheduled_time, collected_at, total_weight_kg
+ON pickup_requests
+FOR EACH ROW
+WHEN (OLD.driver_id       IS DISTINCT FROM NEW.driver_id
+   OR OLD.collector_id    IS DISTINCT FROM NEW.collector_id
+   OR OLD.status          IS DISTINCT FROM NEW.status
+   OR OLD.scheduled_time  IS DISTINCT FROM NEW.scheduled_time
+   OR OLD.collected_at    IS DISTINCT FROM NEW.collected_at
+   OR OLD.total_weight_kg IS DISTINCT FROM NEW.total_weight_kg)
+EXECUTE FUNCTION fn_sync_pickup_assignments();
@@ -0,0 +1,104 @@
+-- ============================================================
+-- 11_facility_load_ledger.sql — Contention-free facility load
+-- Deliveries append a row to facility_load_ledger instead of
+-- updating the facility row, so concurrent deliveries to one
+-- facility no longer queue on its row lock until commit.
+-- recycling_facilities.current_load_kg becomes the compacted base;
+-- compact_facility_load() folds the ledger into it
+-- (python maintenance.py compact-load, e.g. every minute).
+-- Readers see base + ledger, so they are exact; the ledger size
+-- between compactions bounds their cost.
+-- ============================================================
+
+CREATE TABLE facility_load_ledger (
+    entry_id     BIGSERIAL PRIMARY KEY,
+    facility_id  INT           NOT NULL REFERENCES recycling_facilities(facility_id),
+    delta_kg     DECIMAL(12,2) NOT NULL,
+    pickup_id    INT,
+    recorded_at  TIMESTAMP     DEFAULT NOW()
+);
+
+CREATE INDEX idx_load_ledger_facility ON facility_load_ledger(facility_id) INCLUDE (delta_kg);
+
+-- Capacity is now checked by trg_update_facility_load; the base column
+-- alone no longer holds the load, and a compaction must not fail.
+ALTER TABLE recycling_facilities DROP CONSTRAINT chk_facility_load;
+
+
+-- ── v_facility_capacity: base + un-compacted ledger ───────
+CREATE OR REPLACE VIEW v_facility_capacity AS
+SELECT
+    f.facility_id,
+    f.facility_name,
+    f.location,
+    f.specialization,
+    f.capacity_kg,
+    l.load_kg::DECIMAL(10,2)                             AS current_load_kg,
+    f.capacity_kg - l.load_kg                            AS available_kg,
+    ROUND(l.load_kg / NULLIF(f.capacity_kg,0) * 100, 1)  AS utilisation_pct,
+    f.is_operational
+FROM recycling_facilities f
+CROSS JOIN LATERAL (
+    SELECT GREATEST(0, f.current_load_kg + COALESCE(SUM(d.delta_kg), 0)) AS load_kg
+    FROM   facility_load_ledger d
+    WHERE  d.facility_id = f.facility_id
+) l;
+
+
+CREATE OR REPLACE FUNCTION get_facility_available_capacity(p_facility_id INT)
+RETURNS DECIMAL(10,2) LANGUAGE sql STABLE AS $$
+    SELECT available_kg FROM v_facility_capacity WHERE facility_id = p_facility_id;
+$$;
+
+
+-- ── T4: trg_update_facility_load (append-only) ────────────
+-- The capacity check reads without locking, so simultaneous deliveries
+-- can overshoot capacity by at most the weight still in flight.
+CREATE OR REPLACE FUNCTION fn_update_facility_load()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+DECLARE
+    v_available DECIMAL;
+BEGIN
+    IF NEW.status = 'collected' AND OLD.status IS DISTINCT FROM 'collected'
+       AND NEW.assigned_facility_id IS NOT NULL THEN
+        SELECT available_kg INTO v_available
+        FROM   v_facility_capacity WHERE facility_id = NEW.assigned_facility_id;
+        IF NEW.total_weight_kg > v_available THEN
+            RAISE EXCEPTION 'Facility % is full: % kg available, pickup % weighs % kg.',
+                NEW.assigned_facility_id, v_available, NEW.pickup_id, NEW.total_weight_kg
+                USING ERRCODE = 'check_violation';
+        END IF;
+        INSERT INTO facility_load_ledger (facility_id, delta_kg, pickup_id)
+        VALUES (NEW.assigned_facility_id, NEW.total_weight_kg, NEW.pickup_id);
+
+    ELSIF NEW.status = 'cancelled' AND OLD.status = 'collected'
+          AND OLD.assigned_facility_id IS NOT NULL THEN
+        INSERT INTO facility_load_ledger (facility_id, delta_kg, pickup_id)
+        VALUES (OLD.assigned_facility_id, -OLD.total_weight_kg, OLD.pickup_id);
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+
+-- ── compact_facility_load ─────────────────────────────────
+-- Folds ledger rows visible to this transaction into the base load.
+-- Rows appended meanwhile stay for the next run.
+CREATE OR REPLACE PROCEDURE compact_facility_load(OUT p_entries INT)
+LANGUAGE plpgsql AS $$
+BEGIN
+    WITH moved AS (
+        DELETE FROM facility_load_ledger RETURNING facility_id, delta_kg
+    ), sums AS (
+        SELECT facility_id, SUM(delta_kg) AS delta, COUNT(*) AS n
+        FROM   moved GROUP BY facility_id
+    ), applied AS (
+        UPDATE recycling_facilities f
+        SET    current_load_kg = GREATEST(0, f.current_load_kg + s.delta)
+        FROM   sums s
+        WHERE  f.facility_id = s.facility_id
+        RETURNING 1
+    )
+    SELECT COALESCE(SUM(n), 0) INTO p_entries FROM sums;
+END;
+$$;
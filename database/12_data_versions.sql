@@ -0,0 +1,92 @@
+-- ============================================================
+-- 12_data_versions.sql — Data-version tokens for fragcache.py
+-- One sequence per data domain, bumped once per statement that
+-- touches one of its tables. Cached report fragments are keyed by
+-- the tokens of the domains they read, so any write makes the next
+-- view re-render. nextval() takes no row lock and is not rolled
+-- back, so bumping never blocks writers (a rolled-back write only
+-- costs one spurious re-render).
+-- Tokens move before the writing transaction commits; a page
+-- rendered in that window is cached under the new token with the
+-- old data until the next write or FRAGMENT_CACHE_TTL.
+-- ============================================================
+
+CREATE SEQUENCE data_version_pickups;    -- pickup_requests, items, weight_records
+CREATE SEQUENCE data_version_payments;   -- payments, payment_requests
+CREATE SEQUENCE data_version_people;     -- users, staff, vehicles, warnings
+CREATE SEQUENCE data_version_catalog;    -- categories, facility names
+CREATE SEQUENCE data_version_revenue;    -- system_revenue
+
+
+-- ── fn_bump_data_version(sequence) ────────────────────────
+CREATE OR REPLACE FUNCTION fn_bump_data_version()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM nextval(TG_ARGV[0]::regclass);
+    RETURN NULL;
+END;
+$$;
+
+
+-- ── Statement-level bump triggers ─────────────────────────
+CREATE TRIGGER trg_version_pickup_requests
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON pickup_requests
+FOR EACH STATEMENT EXECUTE FUNCTION fn_bump_data_version('data_version_pickups');
+
+CREATE TRIGGER trg_version_items
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON items
+FOR EACH STATEMENT EXECUTE FUNCTION fn_bump_data_version('data_version_pickups');
+
+CREATE TRIGGER trg_version_weight_records
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON weight_records
+FOR EACH STATEMENT EXECUTE FUNCTION fn_bump_data_version('data_version_pickups');
+
+CREATE TRIGGER trg_version_payments
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON payments
+FOR EACH STATEMENT EXECUTE FUNCTION fn_bump_data_version('data_version_payments');
+
+CREATE TRIGGER trg_version_payment_requests
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON payment_requests
+FOR EACH STATEMENT EXECUTE FUNCTION fn_bump_data_version('data_version_payments');
+
+CREATE TRIGGER trg_version_users
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON users
+FOR EACH STATEMENT EXECUTE FUNCTION fn_bump_data_version('data_version_people');
+
+CREATE TRIGGER trg_version_staff
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON staff
+FOR EACH STATEMENT EXECUTE FUNCTION fn_bump_data_version('data_version_people');
+
+CREATE TRIGGER trg_version_vehicles
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON vehicles
+FOR EACH STATEMENT EXECUTE FUNCTION fn_bump_data_version('data_version_people');
+
+CREATE TRIGGER trg_version_warnings
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON warnings
+FOR EACH STATEMENT EXECUTE FUNCTION fn_bump_data_version('data_version_people');
+
+CREATE TRIGGER trg_version_categories
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON categories
+FOR EACH STATEMENT EXECUTE FUNCTION fn_bump_data_version('data_version_catalog');
+
+-- Load compaction rewrites current_load_kg every minute; only name changes matter here.
+CREATE TRIGGER trg_version_facilities
+AFTER INSERT OR DELETE OR UPDATE OF facility_name ON recycling_facilities
+FOR EACH STATEMENT EXECUTE FUNCTION fn_bump_data_version('data_version_catalog');
+
+CREATE TRIGGER trg_version_system_revenue
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON system_revenue
+FOR EACH STATEMENT EXECUTE FUNCTION fn_bump_data_version('data_version_revenue');
+
+
+-- ── data_versions(): all tokens in one round trip ─────────
+CREATE OR REPLACE FUNCTION data_versions()
+RETURNS JSONB LANGUAGE sql VOLATILE AS $$
+    SELECT jsonb_build_object(
+        'pickups',  (SELECT last_value FROM data_version_pickups),
+        'payments', (SELECT last_value FROM data_version_payments),
+        'people',   (SELECT last_value FROM data_version_people),
+        'catalog',  (SELECT last_value FROM data_version_catalog),
+        'revenue',  (SELECT last_value FROM data_version_revenue)
+    );
+$$;
@@ -0,0 +1,163 @@
+-- ============================================================
+-- 13_trigger_conditions.sql — Column-conditional pickup triggers
+-- Every UPDATE of pickup_requests used to run all its row
+-- triggers, e.g. a payment_request_count bump did up to three staff
+-- lookups and two full JSON snapshots. Each trigger now fires
+-- only when the columns it cares about change: UPDATE OF limits
+-- which statements queue it, and WHEN skips the call entirely
+-- unless the value differs.
+-- Measure with scripts/bench_triggers.py.
+-- ============================================================
+
+
+-- ── T9: staff role checks (only for changed assignments) ──
+-- An UPDATE re-checks only the slots it changes, so a later
+-- sub_role change no longer blocks unrelated edits of old pickups.
+CREATE OR REPLACE FUNCTION fn_enforce_staff_roles()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+DECLARE
+    v_insert BOOLEAN := TG_OP = 'INSERT';
+BEGIN
+    IF NEW.supervisor_id IS NOT NULL
+       AND (v_insert OR NEW.supervisor_id IS DISTINCT FROM OLD.supervisor_id) THEN
+        IF NOT EXISTS (SELECT 1 FROM staff WHERE staff_id = NEW.supervisor_id AND sub_role = 'supervisor') THEN
+            RAISE EXCEPTION 'supervisor_id % must be a supervisor sub_role.', NEW.supervisor_id;
+        END IF;
+    END IF;
+    IF NEW.driver_id IS NOT NULL
+       AND (v_insert OR NEW.driver_id IS DISTINCT FROM OLD.driver_id) THEN
+        IF NOT EXISTS (SELECT 1 FROM staff WHERE staff_id = NEW.driver_id AND sub_role = 'driver') THEN
+            RAISE EXCEPTION 'driver_id % must be a driver sub_role.', NEW.driver_id;
+        END IF;
+    END IF;
+    IF NEW.collector_id IS NOT NULL
+       AND (v_insert OR NEW.collector_id IS DISTINCT FROM OLD.collector_id) THEN
+        IF NOT EXISTS (SELECT 1 FROM staff WHERE staff_id = NEW.collector_id AND sub_role = 'collector') THEN
+            RAISE EXCEPTION 'collector_id % must be a collector sub_role.', NEW.collector_id;
+        END IF;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER trg_enforce_staff_roles ON pickup_requests;
+
+CREATE TRIGGER trg_enforce_staff_roles
+BEFORE INSERT ON pickup_requests
+FOR EACH ROW EXECUTE FUNCTION fn_enforce_staff_roles();
+
+CREATE TRIGGER trg_enforce_staff_roles_upd
+BEFORE UPDATE OF supervisor_id, driver_id, collector_id ON pickup_requests
+FOR EACH ROW
+WHEN (OLD.supervisor_id IS DISTINCT FROM NEW.supervisor_id
+   OR OLD.driver_id     IS DISTINCT FROM NEW.driver_id
+   OR OLD.collector_id  IS DISTINCT FROM NEW.collector_id)
+EXECUTE FUNCTION fn_enforce_staff_roles();
+
+
+-- ── T3: updated_at (skip no-op updates) ───────────────────
+DROP TRIGGER trg_pickup_updated_at ON pickup_requests;
+
+CREATE TRIGGER trg_pickup_updated_at
+BEFORE UPDATE ON pickup_requests
+FOR EACH ROW
+WHEN (OLD.* IS DISTINCT FROM NEW.*)
+EXECUTE FUNCTION fn_pickup_updated_at();
+
+
+-- ── T1: audit (skip no-op updates) ────────────────────────
+-- Snapshots stay full rows; admin/logs shows them as-is.
+DROP TRIGGER trg_audit_pickups ON pickup_requests;
+
+CREATE TRIGGER trg_audit_pickups
+AFTER INSERT OR DELETE ON pickup_requests
+FOR EACH ROW EXECUTE FUNCTION fn_audit_pickups();
+
+CREATE TRIGGER trg_audit_pickups_upd
+AFTER UPDATE ON pickup_requests
+FOR EACH ROW
+WHEN (OLD.* IS DISTINCT FROM NEW.*)
+EXECUTE FUNCTION fn_audit_pickups();
+
+
+-- ── T4 + T8: status transitions (one trigger) ─────────────
+-- Facility load ledger on collected / cancelled-after-collected,
+-- user last_pickup_at and status on completed.
+CREATE OR REPLACE FUNCTION fn_pickup_status_change()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+DECLARE
+    v_available DECIMAL;
+BEGIN
+    IF NEW.status = 'collected' AND NEW.assigned_facility_id IS NOT NULL THEN
+        SELECT available_kg INTO v_available
+        FROM   v_facility_capacity WHERE facility_id = NEW.assigned_facility_id;
+        IF NEW.total_weight_kg > v_available THEN
+            RAISE EXCEPTION 'Facility % is full: % kg available, pickup % weighs % kg.',
+                NEW.assigned_facility_id, v_available, NEW.pickup_id, NEW.total_weight_kg
+                USING ERRCODE = 'check_violation';
+        END IF;
+        INSERT INTO facility_load_ledger (facility_id, delta_kg, pickup_id)
+        VALUES (NEW.assigned_facility_id, NEW.total_weight_kg, NEW.pickup_id);
+
+    ELSIF NEW.status = 'cancelled' AND OLD.status = 'collected'
+          AND OLD.assigned_facility_id IS NOT NULL THEN
+        INSERT INTO facility_load_ledger (facility_id, delta_kg, pickup_id)
+        VALUES (OLD.assigned_facility_id, -OLD.total_weight_kg, OLD.pickup_id);
+
+    ELSIF NEW.status = 'completed' THEN
+        UPDATE users
+        SET    last_pickup_at = NOW(),
+               user_status    = calculate_user_status(NEW.user_id)
+        WHERE  user_id = NEW.user_id;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER trg_update_facility_load ON pickup_requests;
+DROP TRIGGER trg_user_status_on_pickup_complete ON pickup_requests;
+DROP FUNCTION fn_update_facility_load();
+DROP FUNCTION fn_user_status_on_pickup_complete();
+
+CREATE TRIGGER trg_pickup_status_change
+AFTER UPDATE OF status ON pickup_requests
+FOR EACH ROW
+WHEN (OLD.status IS DISTINCT FROM NEW.status
+      AND NEW.status IN ('collected', 'cancelled', 'completed'))
+EXECUTE FUNCTION fn_pickup_status_change();
+
+
+-- ── T6: pickup totals (only on real weight changes) ───────
+-- One pass over the pickup's items, and no pickup UPDATE (with its
+-- own triggers) when the totals come out the same.
+CREATE OR REPLACE FUNCTION fn_recalculate_pickup_totals()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+DECLARE
+    v_total_weight DECIMAL(10,2);
+    v_total_amount DECIMAL(10,2);
+BEGIN
+    SELECT COALESCE(SUM(actual_weight_kg), 0), COALESCE(SUM(calculate_item_value(item_id)), 0)
+    INTO   v_total_weight, v_total_amount
+    FROM   items WHERE pickup_id = NEW.pickup_id;
+
+    UPDATE pickup_requests
+    SET    total_weight_kg = v_total_weight,
+           total_amount    = v_total_amount
+    WHERE  pickup_id = NEW.pickup_id
+      AND  (total_weight_kg, total_amount) IS DISTINCT FROM (v_total_weight, v_total_amount);
+
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER trg_recalculate_pickup_totals ON items;
+
+CREATE TRIGGER trg_recalculate_pickup_totals
+AFTER INSERT ON items
+FOR EACH ROW EXECUTE FUNCTION fn_recalculate_pickup_totals();
+
+CREATE TRIGGER trg_recalculate_pickup_totals_upd
+AFTER UPDATE OF actual_weight_kg ON items
+FOR EACH ROW
+WHEN (OLD.actual_weight_kg IS DISTINCT FROM NEW.actual_weight_kg)
+EXECUTE FUNCTION fn_recalculate_pickup_totals();
@@ -0,0 +1,267 @@
+-- ============================================================
+-- 14_batch_aggregates.sql — Maintained batch totals
+-- v_batch_full used to join batch_items and system_revenue in
+-- one GROUP BY. That multiplied recorded_revenue by the item
+-- count, and the view re-summed item weights per batch on
+-- every read. The totals now live on recycling_batches and
+-- triggers keep them current:
+--   batch_items     weight_kg / est_value snapshot of the item
+--                   (kept in step with items and category prices)
+--   batch_items     → item_count, pickup_count, live_weight_kg, est_value
+--   system_revenue  → recorded_revenue
+-- Items of archived pickups keep their last snapshot.
+-- rebuild_batch_aggregates() recomputes everything, e.g. after
+-- loading with triggers off.
+-- ============================================================
+
+ALTER TABLE recycling_batches
+    ADD COLUMN item_count       INT           NOT NULL DEFAULT 0,
+    ADD COLUMN pickup_count     INT           NOT NULL DEFAULT 0,
+    ADD COLUMN live_weight_kg   DECIMAL(12,2) NOT NULL DEFAULT 0,
+    ADD COLUMN est_value        DECIMAL(14,2) NOT NULL DEFAULT 0,   -- at category base prices
+    ADD COLUMN recorded_revenue DECIMAL(14,2) NOT NULL DEFAULT 0;   -- sum of system_revenue
+
+ALTER TABLE batch_items
+    ADD COLUMN weight_kg  DECIMAL(10,2) NOT NULL DEFAULT 0,   -- COALESCE(actual, estimated, 0)
+    ADD COLUMN est_value  DECIMAL(12,2) NOT NULL DEFAULT 0;   -- weight_kg * base_price_per_kg
+
+-- Items per (batch, pickup); a batch's pickup_count is its row count.
+CREATE TABLE batch_pickup_counts (
+    batch_id   INT NOT NULL REFERENCES recycling_batches(batch_id) ON DELETE CASCADE,
+    pickup_id  INT NOT NULL,
+    items      INT NOT NULL,
+    PRIMARY KEY (batch_id, pickup_id)
+);
+
+CREATE INDEX idx_bitem_item       ON batch_items(item_id);
+CREATE INDEX idx_batch_supervisor ON recycling_batches(supervisor_id, batch_id);
+
+
+-- ── rebuild_batch_aggregates ──────────────────────────────
+CREATE OR REPLACE FUNCTION rebuild_batch_aggregates()
+RETURNS VOID LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE batch_items bi
+    SET    weight_kg = w.weight_kg,
+           est_value = ROUND(w.weight_kg * c.base_price_per_kg, 2)
+    FROM   items i
+    JOIN   categories c ON c.category_id = i.category_id
+    CROSS  JOIN LATERAL (SELECT COALESCE(i.actual_weight_kg, i.estimated_weight_kg, 0) AS weight_kg) w
+    WHERE  i.item_id = bi.item_id
+      AND  (bi.weight_kg, bi.est_value) IS DISTINCT FROM
+           (w.weight_kg, ROUND(w.weight_kg * c.base_price_per_kg, 2));
+
+    DELETE FROM batch_pickup_counts;
+    INSERT INTO batch_pickup_counts (batch_id, pickup_id, items)
+    SELECT batch_id, pickup_id, COUNT(*) FROM batch_items GROUP BY batch_id, pickup_id;
+
+    UPDATE recycling_batches b
+    SET    item_count       = COALESCE(i.item_count, 0),
+           pickup_count     = COALESCE(i.pickup_count, 0),
+           live_weight_kg   = COALESCE(i.weight_kg, 0),
+           est_value        = COALESCE(i.est_value, 0),
+           recorded_revenue = COALESCE(r.revenue, 0)
+    FROM   recycling_batches b2
+    LEFT   JOIN (SELECT batch_id, COUNT(*) AS item_count, COUNT(DISTINCT pickup_id) AS pickup_count,
+                        SUM(weight_kg) AS weight_kg, SUM(est_value) AS est_value
+                 FROM batch_items GROUP BY batch_id) i ON i.batch_id = b2.batch_id
+    LEFT   JOIN (SELECT batch_id, SUM(total_value) AS revenue
+                 FROM system_revenue GROUP BY batch_id) r ON r.batch_id = b2.batch_id
+    WHERE  b.batch_id = b2.batch_id;
+END;
+$$;
+
+SELECT rebuild_batch_aggregates();
+
+
+-- ── batch_items: snapshot the item on insert ──────────────
+CREATE OR REPLACE FUNCTION fn_batch_item_snapshot()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    SELECT COALESCE(i.actual_weight_kg, i.estimated_weight_kg, 0),
+           ROUND(COALESCE(i.actual_weight_kg, i.estimated_weight_kg, 0) * c.base_price_per_kg, 2)
+    INTO   NEW.weight_kg, NEW.est_value
+    FROM   items i
+    JOIN   categories c ON c.category_id = i.category_id
+    WHERE  i.item_id = NEW.item_id;
+    NEW.weight_kg := COALESCE(NEW.weight_kg, 0);
+    NEW.est_value := COALESCE(NEW.est_value, 0);
+    RETURN NEW;
+END;
+$$;
+
+CREATE TRIGGER trg_batch_item_snapshot
+BEFORE INSERT OR UPDATE OF item_id ON batch_items
+FOR EACH ROW EXECUTE FUNCTION fn_batch_item_snapshot();
+
+
+-- ── batch_items → recycling_batches ───────────────────────
+CREATE OR REPLACE FUNCTION apply_batch_item(
+    p_batch_id  INT,
+    p_pickup_id INT,
+    p_weight    DECIMAL,
+    p_value     DECIMAL,
+    p_sign      INT       -- +1 joins the batch, -1 leaves it
+) RETURNS VOID LANGUAGE plpgsql AS $$
+DECLARE
+    v_items   INT;
+    v_pickups INT := 0;
+BEGIN
+    IF p_sign > 0 THEN
+        INSERT INTO batch_pickup_counts AS c (batch_id, pickup_id, items)
+        VALUES (p_batch_id, p_pickup_id, 1)
+        ON CONFLICT (batch_id, pickup_id) DO UPDATE SET items = c.items + 1
+        RETURNING items INTO v_items;
+        IF v_items = 1 THEN v_pickups := 1; END IF;
+    ELSE
+        UPDATE batch_pickup_counts SET items = items - 1
+        WHERE  batch_id = p_batch_id AND pickup_id = p_pickup_id
+        RETURNING items INTO v_items;
+        IF v_items = 0 THEN
+            DELETE FROM batch_pickup_counts WHERE batch_id = p_batch_id AND pickup_id = p_pickup_id;
+            v_pickups := -1;
+        END IF;
+    END IF;
+
+    UPDATE recycling_batches
+    SET    item_count     = item_count     + p_sign,
+           pickup_count   = pickup_count   + v_pickups,
+           live_weight_kg = live_weight_kg + p_sign * p_weight,
+           est_value      = est_value      + p_sign * p_value
+    WHERE  batch_id = p_batch_id;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION fn_batch_items_aggregate()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW.batch_id = OLD.batch_id AND NEW.pickup_id = OLD.pickup_id THEN
+        -- Only the snapshot moved (item reweighed or repriced)
+        UPDATE recycling_batches
+        SET    live_weight_kg = live_weight_kg + NEW.weight_kg - OLD.weight_kg,
+               est_value      = est_value      + NEW.est_value - OLD.est_value
+        WHERE  batch_id = NEW.batch_id;
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_batch_item(OLD.batch_id, OLD.pickup_id, OLD.weight_kg, OLD.est_value, -1);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM apply_batch_item(NEW.batch_id, NEW.pickup_id, NEW.weight_kg, NEW.est_value, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_batch_items_aggregate
+AFTER INSERT OR DELETE ON batch_items
+FOR EACH ROW EXECUTE FUNCTION fn_batch_items_aggregate();
+
+CREATE TRIGGER trg_batch_items_aggregate_upd
+AFTER UPDATE OF batch_id, pickup_id, weight_kg, est_value ON batch_items
+FOR EACH ROW
+WHEN ((OLD.batch_id, OLD.pickup_id, OLD.weight_kg, OLD.est_value)
+      IS DISTINCT FROM (NEW.batch_id, NEW.pickup_id, NEW.weight_kg, NEW.est_value))
+EXECUTE FUNCTION fn_batch_items_aggregate();
+
+
+-- ── items / categories → batch_items snapshots ────────────
+-- Only items that sit in a batch touch anything (idx_bitem_item).
+CREATE OR REPLACE FUNCTION fn_batch_item_reweigh()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE batch_items bi
+    SET    weight_kg = COALESCE(NEW.actual_weight_kg, NEW.estimated_weight_kg, 0),
+           est_value = ROUND(COALESCE(NEW.actual_weight_kg, NEW.estimated_weight_kg, 0) * c.base_price_per_kg, 2)
+    FROM   categories c
+    WHERE  bi.item_id = NEW.item_id AND c.category_id = NEW.category_id;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_batch_item_reweigh
+AFTER UPDATE OF actual_weight_kg, estimated_weight_kg, category_id ON items
+FOR EACH ROW
+WHEN (COALESCE(OLD.actual_weight_kg, OLD.estimated_weight_kg, 0)
+          IS DISTINCT FROM COALESCE(NEW.actual_weight_kg, NEW.estimated_weight_kg, 0)
+      OR OLD.category_id IS DISTINCT FROM NEW.category_id)
+EXECUTE FUNCTION fn_batch_item_reweigh();
+
+CREATE OR REPLACE FUNCTION fn_batch_item_reprice()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE batch_items bi
+    SET    est_value = ROUND(bi.weight_kg * NEW.base_price_per_kg, 2)
+    FROM   items i
+    WHERE  i.category_id = NEW.category_id AND bi.item_id = i.item_id;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_batch_item_reprice
+AFTER UPDATE OF base_price_per_kg ON categories
+FOR EACH ROW
+WHEN (OLD.base_price_per_kg IS DISTINCT FROM NEW.base_price_per_kg)
+EXECUTE FUNCTION fn_batch_item_reprice();
+
+
+-- ── system_revenue → recorded_revenue ─────────────────────
+CREATE OR REPLACE FUNCTION fn_batch_revenue_aggregate()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE recycling_batches SET recorded_revenue = recorded_revenue - OLD.total_value
+        WHERE  batch_id = OLD.batch_id;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        UPDATE recycling_batches SET recorded_revenue = recorded_revenue + NEW.total_value
+        WHERE  batch_id = NEW.batch_id;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_batch_revenue_aggregate
+AFTER INSERT OR DELETE ON system_revenue
+FOR EACH ROW EXECUTE FUNCTION fn_batch_revenue_aggregate();
+
+CREATE TRIGGER trg_batch_revenue_aggregate_upd
+AFTER UPDATE OF batch_id, weight_kg, price_per_kg ON system_revenue
+FOR EACH ROW
+WHEN (OLD.batch_id IS DISTINCT FROM NEW.batch_id OR OLD.total_value IS DISTINCT FROM NEW.total_value)
+EXECUTE FUNCTION fn_batch_revenue_aggregate();
+
+
+-- ── get_batch_pickup_count: read the maintained count ─────
+CREATE OR REPLACE FUNCTION get_batch_pickup_count(p_batch_id INT)
+RETURNS BIGINT LANGUAGE sql STABLE AS $$
+    SELECT pickup_count::BIGINT FROM recycling_batches WHERE batch_id = p_batch_id;
+$$;
+
+
+-- ── v_batch_full: one row per batch, no aggregation ───────
+DROP VIEW v_batch_full;
+CREATE VIEW v_batch_full AS
+SELECT
+    b.batch_id,
+    b.batch_name,
+    b.status,
+    b.created_date,
+    b.processing_start_date,
+    b.processing_end_date,
+    b.total_weight_kg,
+    b.recovery_rate_percentage,
+    b.total_revenue,
+    b.notes,
+    rf.facility_name,
+    rf.location              AS facility_location,
+    sup.full_name            AS supervisor_name,
+    b.supervisor_id,
+    b.item_count,
+    b.pickup_count,
+    b.recorded_revenue,
+    b.live_weight_kg,        -- live until processing sets total_weight_kg
+    b.est_value
+FROM recycling_batches  b
+JOIN recycling_facilities rf ON b.facility_id  = rf.facility_id
+LEFT JOIN staff         sup  ON b.supervisor_id = sup.staff_id;
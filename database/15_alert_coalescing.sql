@@ -0,0 +1,150 @@
+-- ============================================================
+-- 15_alert_coalescing.sql — Coalesced admin alerts
+-- A repeat of an open alert (same alert_type, related_table,
+-- related_id) seen again within the coalescing window bumps
+-- occurrence_count and last_seen_at on that alert. It no
+-- longer inserts a new row, so a supervisor ignoring a pickup
+-- gives one critical alert "x40", not forty.
+-- Window: app.alert_coalesce_window (default 1 day), e.g.
+--   ALTER DATABASE ewaste_db SET app.alert_coalesce_window = '6 hours';
+-- The active list is ordered by alert_severity_rank(severity),
+-- served by idx_alert_active_rank.
+-- ============================================================
+
+ALTER TABLE admin_alerts
+    ADD COLUMN occurrence_count INT NOT NULL DEFAULT 1,
+    ADD COLUMN last_seen_at     TIMESTAMP;
+
+UPDATE admin_alerts SET last_seen_at = COALESCE(created_at, NOW());
+ALTER TABLE admin_alerts
+    ALTER COLUMN last_seen_at SET DEFAULT NOW(),
+    ALTER COLUMN last_seen_at SET NOT NULL;
+
+
+-- ── alert_severity_rank ───────────────────────────────────
+CREATE OR REPLACE FUNCTION alert_severity_rank(p_severity VARCHAR)
+RETURNS INT LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE p_severity
+               WHEN 'critical' THEN 1
+               WHEN 'high'     THEN 2
+               WHEN 'medium'   THEN 3
+               ELSE 4
+           END;
+$$;
+
+CREATE INDEX idx_alert_active_rank ON admin_alerts (alert_severity_rank(severity), last_seen_at DESC)
+    WHERE is_resolved = FALSE;
+CREATE INDEX idx_alert_open_target ON admin_alerts (alert_type, related_table, related_id)
+    WHERE is_resolved = FALSE;
+
+
+-- ── raise_admin_alert ─────────────────────────────────────
+-- Insert an alert, or fold it into the open one for the same
+-- target seen within the window. Severity only escalates; the
+-- title, description and payload become the latest ones.
+-- Returns the alert_id either way.
+CREATE OR REPLACE FUNCTION raise_admin_alert(
+    p_alert_type    VARCHAR(60),
+    p_severity      VARCHAR(10),
+    p_title         TEXT,
+    p_description   TEXT,
+    p_related_table VARCHAR(50),
+    p_related_id    INT,
+    p_payload       JSONB DEFAULT '{}'
+) RETURNS INT LANGUAGE plpgsql AS $$
+DECLARE
+    v_window   INTERVAL := COALESCE(NULLIF(current_setting('app.alert_coalesce_window', TRUE), ''), '1 day');
+    v_alert_id INT;
+BEGIN
+    IF p_related_id IS NOT NULL THEN
+        -- Serialise raisers of the same target so two repeats cannot both insert
+        PERFORM pg_advisory_xact_lock(hashtextextended(
+            p_alert_type || '/' || COALESCE(p_related_table, '') || '/' || p_related_id, 0));
+
+        UPDATE admin_alerts
+        SET    occurrence_count = occurrence_count + 1,
+               last_seen_at     = NOW(),
+               severity         = CASE WHEN alert_severity_rank(p_severity) < alert_severity_rank(severity)
+                                       THEN p_severity ELSE severity END,
+               title            = p_title,
+               description      = p_description,
+               payload          = COALESCE(p_payload, payload)
+        WHERE  alert_id = (
+                   SELECT alert_id FROM admin_alerts
+                   WHERE  alert_type = p_alert_type
+                     AND  related_table = p_related_table
+                     AND  related_id = p_related_id
+                     AND  is_resolved = FALSE
+                     AND  last_seen_at >= NOW() - v_window
+                   ORDER  BY last_seen_at DESC
+                   LIMIT  1)
+        RETURNING alert_id INTO v_alert_id;
+    END IF;
+
+    IF v_alert_id IS NULL THEN
+        INSERT INTO admin_alerts (alert_type, severity, title, description, related_table, related_id, payload)
+        VALUES (p_alert_type, p_severity, p_title, p_description, p_related_table, p_related_id,
+                COALESCE(p_payload, '{}'))
+        RETURNING alert_id INTO v_alert_id;
+    END IF;
+    RETURN v_alert_id;
+END;
+$$;
+
+
+-- ── T7: trg_payment_request_alert (coalesced per pickup) ──
+-- Keyed on the pickup rather than the request: every request is
+-- a new row, so per-request alerts could never coalesce.
+CREATE OR REPLACE FUNCTION fn_payment_request_alert()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+DECLARE
+    v_hours_overdue FLOAT;
+    v_alert_type    VARCHAR(60);
+    v_severity      VARCHAR(10);
+    v_title         TEXT;
+    v_desc          TEXT;
+BEGIN
+    SELECT EXTRACT(EPOCH FROM (NOW() - p.payment_due_by)) / 3600
+    INTO   v_hours_overdue
+    FROM   pickup_requests p WHERE p.pickup_id = NEW.pickup_id;
+
+    IF NEW.is_duplicate THEN
+        v_alert_type := 'duplicate_payment_request';
+        v_severity   := 'critical';
+        v_title      := 'Duplicate Payment Request — Pickup #' || NEW.pickup_id;
+        v_desc       := 'User has submitted another payment request for an already-pending payment. Supervisor may be ignoring it.';
+    ELSE
+        v_alert_type := 'payment_request_submitted';
+        v_severity   := CASE WHEN v_hours_overdue > 48 THEN 'high' ELSE 'medium' END;
+        v_title      := 'Payment Request — Pickup #' || NEW.pickup_id;
+        v_desc       := 'User has requested payment. Overdue by ' || ROUND(v_hours_overdue::NUMERIC, 1) || ' hours.';
+    END IF;
+
+    PERFORM raise_admin_alert(
+        v_alert_type, v_severity, v_title, v_desc,
+        'pickup_requests', NEW.pickup_id,
+        jsonb_build_object(
+            'pickup_id',     NEW.pickup_id,
+            'request_id',    NEW.request_id,
+            'user_id',       NEW.user_id,
+            'supervisor_id', NEW.supervisor_id,
+            'hours_overdue', ROUND(v_hours_overdue::NUMERIC, 1),
+            'is_duplicate',  NEW.is_duplicate,
+            'request_count', (
+                SELECT payment_request_count FROM pickup_requests WHERE pickup_id = NEW.pickup_id
+            )
+        ));
+
+    NEW.admin_alerted := TRUE;
+    RETURN NEW;
+END;
+$$;
+
+
+-- ── v_admin_alerts_active ─────────────────────────────────
+-- Same columns plus the two new ones at the end.
+CREATE OR REPLACE VIEW v_admin_alerts_active AS
+SELECT *
+FROM admin_alerts
+WHERE is_resolved = FALSE
+ORDER BY alert_severity_rank(severity), last_seen_at DESC;
@@ -0,0 +1,82 @@
+-- ============================================================
+-- 16_shard_directory.sql — City shards
+-- Operations split by city: a city's users, their pickups (with
+-- items, weights, payments, archives) and its regional staff,
+-- facilities and vehicles live on one shard. Every shard has
+-- the full schema and its own copy of the reference data
+-- (categories, pricing_rules).
+-- The directory tables are read from the directory shard
+-- (DB_DEFAULT_SHARD) only; see shards.py.
+-- configure_shard_ids() interleaves the id sequences, so ids
+-- stay unique across shards and rows can move between them
+-- unchanged (python maintenance.py shard-init / move-city).
+-- ============================================================
+
+-- ── Directory ─────────────────────────────────────────────
+CREATE TABLE shard_directory (
+    city        VARCHAR(50) PRIMARY KEY,          -- lower(trim(users.city))
+    shard       VARCHAR(40) NOT NULL,
+    state       VARCHAR(10) NOT NULL DEFAULT 'active'
+                CHECK (state IN ('active','moving')),   -- moving = writes refused
+    moving_to   VARCHAR(40),
+    updated_at  TIMESTAMP   DEFAULT NOW()
+);
+
+-- Where each login lives, so /login knows which shard to ask.
+CREATE TABLE account_directory (
+    username    VARCHAR(50) PRIMARY KEY,
+    shard       VARCHAR(40) NOT NULL
+);
+
+
+-- ── Regional staff and facilities ─────────────────────────
+-- NULL = not tied to a city; stays put when a city moves.
+-- Drivers and collectors follow their supervisor, vehicles
+-- their supervisor.
+ALTER TABLE staff                ADD COLUMN city VARCHAR(50);
+ALTER TABLE recycling_facilities ADD COLUMN city VARCHAR(50);
+
+CREATE INDEX idx_user_city     ON users (lower(trim(city)));
+CREATE INDEX idx_staff_city    ON staff (lower(trim(city)));
+CREATE INDEX idx_facility_city ON recycling_facilities (lower(trim(city)));
+
+
+-- ── configure_shard_ids ───────────────────────────────────
+-- Shard p_shard_no of p_shard_count (1-based) hands out ids
+-- p_shard_no, p_shard_no + count, ... from every sequence in
+-- the schema, starting above anything already issued.
+-- Returns how many sequences it set.
+CREATE OR REPLACE FUNCTION configure_shard_ids(p_shard_no INT, p_shard_count INT)
+RETURNS INT LANGUAGE plpgsql AS $$
+DECLARE
+    r       RECORD;
+    v_max   BIGINT;
+    v_last  BIGINT;
+    v_next  BIGINT;
+    v_count INT := 0;
+BEGIN
+    IF p_shard_count < 1 OR p_shard_no NOT BETWEEN 1 AND p_shard_count THEN
+        RAISE EXCEPTION 'Shard number % out of range 1..%.', p_shard_no, p_shard_count;
+    END IF;
+
+    FOR r IN
+        SELECT s.oid::regclass AS seq, t.oid::regclass AS tbl, a.attname AS col
+        FROM   pg_class s
+        JOIN   pg_depend d    ON d.classid = 'pg_class'::regclass AND d.objid = s.oid
+                             AND d.refclassid = 'pg_class'::regclass AND d.deptype IN ('a', 'i')
+        JOIN   pg_class t     ON t.oid = d.refobjid
+        JOIN   pg_attribute a ON a.attrelid = t.oid AND a.attnum = d.refobjsubid
+        WHERE  s.relkind = 'S' AND s.relnamespace = 'public'::regnamespace
+    LOOP
+        -- Archived rows left the table but their ids were issued: the sequence remembers.
+        EXECUTE format('SELECT COALESCE(MAX(%I), 0) FROM %s', r.col, r.tbl) INTO v_max;
+        EXECUTE format('SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END FROM %s', r.seq)
+        INTO v_last;
+        v_next := GREATEST(v_max, v_last) + 1;
+        v_next := v_next + (((p_shard_no - v_next) % p_shard_count) + p_shard_count) % p_shard_count;
+        EXECUTE format('ALTER SEQUENCE %s INCREMENT BY %s RESTART WITH %s', r.seq, p_shard_count, v_next);
+        v_count := v_count + 1;
+    END LOOP;
+    RETURN v_count;
+END;
+$$;
@@ -0,0 +1,228 @@
+-- ============================================================
+-- 17_batch_items_archive.sql — Archived batch membership
+-- 09 dropped fk_bitem_item / fk_bitem_pickup so batch_items could
+-- keep rows whose item was archived, which left every row
+-- unchecked. Those rows now move to batch_items_archive with
+-- their pickup (checked against the archive tables at commit),
+-- and the foreign keys are back on batch_items. Batch totals
+-- still count archived rows: the aggregate trigger skips the move.
+-- Batch history reads v_batch_item_history.
+-- ============================================================
+
+-- ── batch_items_archive ───────────────────────────────────
+CREATE TABLE batch_items_archive (LIKE batch_items);
+
+ALTER TABLE batch_items_archive
+    ADD PRIMARY KEY (batch_item_id),
+    ADD COLUMN archived_at TIMESTAMP DEFAULT NOW(),
+    ADD CONSTRAINT fk_bitem_arch_batch
+        FOREIGN KEY (batch_id)  REFERENCES recycling_batches(batch_id),
+    ADD CONSTRAINT fk_bitem_arch_item
+        FOREIGN KEY (item_id)   REFERENCES items_archive(item_id)             DEFERRABLE INITIALLY DEFERRED,
+    ADD CONSTRAINT fk_bitem_arch_pickup
+        FOREIGN KEY (pickup_id) REFERENCES pickup_requests_archive(pickup_id) DEFERRABLE INITIALLY DEFERRED;
+
+CREATE INDEX idx_bitem_arch_batch ON batch_items_archive(batch_id);
+CREATE INDEX idx_bitem_arch_item  ON batch_items_archive(item_id);
+
+
+-- ── Archiving is a move: batch totals stay as they are ────
+CREATE OR REPLACE FUNCTION fn_batch_items_aggregate()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF current_setting('app.archiving', TRUE) = 'on' THEN RETURN NULL; END IF;
+    IF TG_OP = 'UPDATE' AND NEW.batch_id = OLD.batch_id AND NEW.pickup_id = OLD.pickup_id THEN
+        -- Only the snapshot moved (item reweighed or repriced)
+        UPDATE recycling_batches
+        SET    live_weight_kg = live_weight_kg + NEW.weight_kg - OLD.weight_kg,
+               est_value      = est_value      + NEW.est_value - OLD.est_value
+        WHERE  batch_id = NEW.batch_id;
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_batch_item(OLD.batch_id, OLD.pickup_id, OLD.weight_kg, OLD.est_value, -1);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM apply_batch_item(NEW.batch_id, NEW.pickup_id, NEW.weight_kg, NEW.est_value, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+
+-- ── Move rows of already archived items, restore the FKs ──
+SELECT set_config('app.archiving', 'on', TRUE);
+
+WITH m AS (
+    DELETE FROM batch_items bi
+    WHERE  NOT EXISTS (SELECT 1 FROM items i WHERE i.item_id = bi.item_id)
+      AND  EXISTS (SELECT 1 FROM items_archive a WHERE a.item_id = bi.item_id)
+    RETURNING bi.*
+)
+INSERT INTO batch_items_archive SELECT m.*, NOW() FROM m;
+
+SELECT set_config('app.archiving', 'off', TRUE);
+
+ALTER TABLE batch_items
+    ADD CONSTRAINT fk_bitem_item
+        FOREIGN KEY (item_id) REFERENCES items(item_id),
+    ADD CONSTRAINT fk_bitem_pickup
+        FOREIGN KEY (pickup_id) REFERENCES pickup_requests(pickup_id);
+
+
+-- ── rebuild_batch_aggregates: hot and archived rows ───────
+CREATE OR REPLACE FUNCTION rebuild_batch_aggregates()
+RETURNS VOID LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE batch_items bi
+    SET    weight_kg = w.weight_kg,
+           est_value = ROUND(w.weight_kg * c.base_price_per_kg, 2)
+    FROM   items i
+    JOIN   categories c ON c.category_id = i.category_id
+    CROSS  JOIN LATERAL (SELECT COALESCE(i.actual_weight_kg, i.estimated_weight_kg, 0) AS weight_kg) w
+    WHERE  i.item_id = bi.item_id
+      AND  (bi.weight_kg, bi.est_value) IS DISTINCT FROM
+           (w.weight_kg, ROUND(w.weight_kg * c.base_price_per_kg, 2));
+
+    DELETE FROM batch_pickup_counts;
+    INSERT INTO batch_pickup_counts (batch_id, pickup_id, items)
+    SELECT batch_id, pickup_id, COUNT(*)
+    FROM   (SELECT batch_id, pickup_id FROM batch_items
+            UNION ALL
+            SELECT batch_id, pickup_id FROM batch_items_archive) bi
+    GROUP  BY batch_id, pickup_id;
+
+    UPDATE recycling_batches b
+    SET    item_count       = COALESCE(i.item_count, 0),
+           pickup_count     = COALESCE(i.pickup_count, 0),
+           live_weight_kg   = COALESCE(i.weight_kg, 0),
+           est_value        = COALESCE(i.est_value, 0),
+           recorded_revenue = COALESCE(r.revenue, 0)
+    FROM   recycling_batches b2
+    LEFT   JOIN (SELECT batch_id, COUNT(*) AS item_count, COUNT(DISTINCT pickup_id) AS pickup_count,
+                        SUM(weight_kg) AS weight_kg, SUM(est_value) AS est_value
+                 FROM (SELECT batch_id, pickup_id, weight_kg, est_value FROM batch_items
+                       UNION ALL
+                       SELECT batch_id, pickup_id, weight_kg, est_value FROM batch_items_archive) a
+                 GROUP BY batch_id) i ON i.batch_id = b2.batch_id
+    LEFT   JOIN (SELECT batch_id, SUM(total_value) AS revenue
+                 FROM system_revenue GROUP BY batch_id) r ON r.batch_id = b2.batch_id
+    WHERE  b.batch_id = b2.batch_id;
+END;
+$$;
+
+
+-- ── v_batch_item_history ──────────────────────────────────
+CREATE OR REPLACE VIEW v_batch_item_history AS
+SELECT bi.*, FALSE AS is_archived
+FROM   batch_items bi
+UNION ALL
+SELECT batch_item_id, batch_id, item_id, pickup_id, added_by, added_at, processing_notes,
+       weight_kg, est_value, TRUE
+FROM   batch_items_archive;
+
+
+-- ── archive_completed_pickups ─────────────────────────────
+-- As in 09, and batch_items rows of the pickups move to batch_items_archive.
+-- Moves up to p_batch_size completed pickups older than p_months.
+-- Skips pickups still in an open/processing batch or with a pending
+-- payment request. Call repeatedly until p_archived = 0.
+CREATE OR REPLACE PROCEDURE archive_completed_pickups(
+    IN  p_months     INT,
+    IN  p_batch_size INT,
+    OUT p_archived   INT
+) LANGUAGE plpgsql AS $$
+DECLARE
+    v_ids INT[];
+BEGIN
+    SELECT array_agg(c.pickup_id) INTO v_ids
+    FROM (
+        SELECT p.pickup_id
+        FROM   pickup_requests p
+        WHERE  p.status = 'completed'
+          AND  p.completed_time < NOW() - make_interval(months => p_months)
+          AND  NOT EXISTS (
+                   SELECT 1 FROM batch_items bi
+                   JOIN recycling_batches b ON b.batch_id = bi.batch_id
+                   WHERE bi.pickup_id = p.pickup_id AND b.status IN ('open','processing'))
+          AND  NOT EXISTS (
+                   SELECT 1 FROM payment_requests pr
+                   WHERE pr.pickup_id = p.pickup_id AND pr.status = 'pending')
+        ORDER  BY p.pickup_id
+        LIMIT  p_batch_size
+        FOR UPDATE SKIP LOCKED
+    ) c;
+
+    IF v_ids IS NULL THEN
+        p_archived := 0;
+        RETURN;
+    END IF;
+
+    PERFORM set_config('app.archiving', 'on', TRUE);
+
+    -- Fold into lifetime totals before the rows leave the hot tables
+    INSERT INTO archive_user_totals AS t (user_id, pickups, total_weight_kg, total_earnings)
+    SELECT user_id, COUNT(*), COALESCE(SUM(total_weight_kg), 0), COALESCE(SUM(total_amount), 0)
+    FROM   pickup_requests WHERE pickup_id = ANY(v_ids)
+    GROUP  BY user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET    pickups         = t.pickups         + EXCLUDED.pickups,
+           total_weight_kg = t.total_weight_kg + EXCLUDED.total_weight_kg,
+           total_earnings  = t.total_earnings  + EXCLUDED.total_earnings;
+
+    INSERT INTO archive_supervisor_totals AS t (supervisor_id, pickups, total_weight_kg, total_paid_out)
+    SELECT p.supervisor_id, COUNT(*), COALESCE(SUM(p.total_weight_kg), 0), COALESCE(SUM(py.paid), 0)
+    FROM   pickup_requests p
+    LEFT JOIN (
+        SELECT pickup_id, SUM(amount) AS paid FROM payments
+        WHERE  pickup_id = ANY(v_ids) AND payment_status = 'completed'
+        GROUP  BY pickup_id
+    ) py ON py.pickup_id = p.pickup_id
+    WHERE  p.pickup_id = ANY(v_ids) AND p.supervisor_id IS NOT NULL
+    GROUP  BY p.supervisor_id
+    ON CONFLICT (supervisor_id) DO UPDATE
+    SET    pickups         = t.pickups         + EXCLUDED.pickups,
+           total_weight_kg = t.total_weight_kg + EXCLUDED.total_weight_kg,
+           total_paid_out  = t.total_paid_out  + EXCLUDED.total_paid_out;
+
+    INSERT INTO archive_category_totals AS t (category_id, items, total_weight_kg, mercury_items)
+    SELECT category_id, COUNT(*), COALESCE(SUM(actual_weight_kg), 0),
+           COUNT(*) FILTER (WHERE (hazard_details->>'contains_mercury')::BOOLEAN = TRUE)
+    FROM   items WHERE pickup_id = ANY(v_ids)
+    GROUP  BY category_id
+    ON CONFLICT (category_id) DO UPDATE
+    SET    items           = t.items           + EXCLUDED.items,
+           total_weight_kg = t.total_weight_kg + EXCLUDED.total_weight_kg,
+           mercury_items   = t.mercury_items   + EXCLUDED.mercury_items;
+
+    -- Move rows, children first (batch_items references items and pickups)
+    WITH m AS (DELETE FROM batch_items WHERE pickup_id = ANY(v_ids) RETURNING *)
+    INSERT INTO batch_items_archive SELECT m.*, NOW() FROM m;
+
+    WITH m AS (DELETE FROM payment_requests WHERE pickup_id = ANY(v_ids) RETURNING *)
+    INSERT INTO payment_requests_archive SELECT m.*, NOW() FROM m;
+
+    WITH m AS (DELETE FROM payments WHERE pickup_id = ANY(v_ids) RETURNING *)
+    INSERT INTO payments_archive SELECT m.*, NOW() FROM m;
+
+    WITH m AS (
+        DELETE FROM weight_records wr USING items i
+        WHERE  wr.item_id = i.item_id AND i.pickup_id = ANY(v_ids)
+        RETURNING wr.*
+    )
+    INSERT INTO weight_records_archive SELECT m.*, NOW() FROM m;
+
+    WITH m AS (DELETE FROM items WHERE pickup_id = ANY(v_ids) RETURNING *)
+    INSERT INTO items_archive SELECT m.*, NOW() FROM m;
+
+    WITH m AS (DELETE FROM pickup_requests WHERE pickup_id = ANY(v_ids) RETURNING *)
+    INSERT INTO pickup_requests_archive SELECT m.*, NOW() FROM m;
+
+    p_archived := array_length(v_ids, 1);
+
+    INSERT INTO audit_log (table_name, operation, record_id, new_values, changed_by)
+    VALUES ('pickup_requests', 'ARCHIVE', v_ids[1],
+            jsonb_build_object('pickup_ids', to_jsonb(v_ids), 'count', p_archived, 'older_than_months', p_months),
+            current_setting('app.current_user', TRUE));
+END;
+$$;
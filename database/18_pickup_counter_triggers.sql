@@ -0,0 +1,30 @@
+-- ============================================================
+-- 18_pickup_counter_triggers.sql — Counter bumps skip updated_at / audit
+-- 13 made trg_pickup_updated_at and trg_audit_pickups_upd skip
+-- no-op updates, but a payment_request_count bump is not a no-op,
+-- so each one still stamped updated_at and wrote a full audit
+-- snapshot. Both now compare the rows without the counter (and
+-- without updated_at, which the BEFORE trigger itself sets).
+-- Columns added later are compared too.
+-- ============================================================
+
+-- ── T3: updated_at ────────────────────────────────────────
+DROP TRIGGER trg_pickup_updated_at ON pickup_requests;
+
+CREATE TRIGGER trg_pickup_updated_at
+BEFORE UPDATE ON pickup_requests
+FOR EACH ROW
+WHEN (to_jsonb(OLD) - 'payment_request_count' - 'updated_at'
+      IS DISTINCT FROM to_jsonb(NEW) - 'payment_request_count' - 'updated_at')
+EXECUTE FUNCTION fn_pickup_updated_at();
+
+
+-- ── T1: audit ─────────────────────────────────────────────
+DROP TRIGGER trg_audit_pickups_upd ON pickup_requests;
+
+CREATE TRIGGER trg_audit_pickups_upd
+AFTER UPDATE ON pickup_requests
+FOR EACH ROW
+WHEN (to_jsonb(OLD) - 'payment_request_count' - 'updated_at'
+      IS DISTINCT FROM to_jsonb(NEW) - 'payment_request_count' - 'updated_at')
+EXECUTE FUNCTION fn_audit_pickups();
@@ -0,0 +1,50 @@
+-- ============================================================
+-- 19_alert_sources.sql — Every alert goes through raise_admin_alert
+-- fire_staff still inserted into admin_alerts directly, so its
+-- alerts skipped coalescing. It now calls raise_admin_alert (15).
+-- Since 15, payment-request alerts point at the pickup
+-- (related_table 'pickup_requests', related_id pickup_id) rather
+-- than the request, so repeats for one pickup coalesce; the
+-- request_id is in the payload. Alerts raised before 15 keep
+-- 'payment_requests' / request_id.
+-- ============================================================
+
+-- ── fire_staff ────────────────────────────────────────────
+-- Admin soft-deletes a staff member. Disables their account.
+CREATE OR REPLACE PROCEDURE fire_staff(
+    IN  p_staff_id  INT,
+    IN  p_admin_account_id INT,
+    IN  p_reason    TEXT,
+    OUT p_success   BOOLEAN
+) LANGUAGE plpgsql AS $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM staff WHERE staff_id = p_staff_id AND is_active = TRUE) THEN
+        RAISE EXCEPTION 'Staff % not found or already inactive.', p_staff_id;
+    END IF;
+
+    UPDATE staff
+    SET    is_active    = FALSE,
+           is_available = FALSE,
+           fired_at     = NOW(),
+           fired_by     = p_admin_account_id
+    WHERE  staff_id = p_staff_id;
+
+    -- Disable login
+    UPDATE accounts SET is_active = FALSE WHERE staff_id = p_staff_id;
+
+    -- Log to audit
+    INSERT INTO audit_log (table_name, operation, record_id, new_values, changed_by)
+    VALUES ('staff', 'FIRE', p_staff_id,
+            jsonb_build_object('staff_id', p_staff_id, 'fired_by', p_admin_account_id, 'reason', p_reason),
+            (SELECT username FROM accounts WHERE account_id = p_admin_account_id));
+
+    -- Create admin alert
+    PERFORM raise_admin_alert(
+        'staff_fired', 'medium', 'Staff Member Fired',
+        'A staff member was deactivated.',
+        'staff', p_staff_id,
+        jsonb_build_object('staff_id', p_staff_id, 'reason', p_reason, 'fired_by', p_admin_account_id));
+
+    p_success := TRUE;
+END;
+$$;
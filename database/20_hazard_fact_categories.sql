@@ -0,0 +1,61 @@
+-- ============================================================
+-- 20_hazard_fact_categories.sql — Hazard facts follow category levels
+-- fact_hazard_daily counts an item by its category's hazard_level
+-- (>= 3 hazardous, >= 4 high hazard) as of when the item was
+-- written, so changing a category's level left its facts stale.
+-- trg_fact_hazard_category rebuilds that category's facts on
+-- every day from hot and archived items.
+-- rebuild_hazard_facts() (all categories) is there for loads with
+-- triggers off; it also runs once below to fix earlier edits.
+-- ============================================================
+
+-- ── rebuild_hazard_facts ──────────────────────────────────
+-- Same rules as fn_apply_hazard_fact. Archived items still count
+-- (archiving skips the fact triggers).
+CREATE OR REPLACE FUNCTION rebuild_hazard_facts(p_category_id INT DEFAULT NULL)
+RETURNS VOID LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM fact_hazard_daily
+    WHERE  p_category_id IS NULL OR category_id = p_category_id;
+
+    INSERT INTO fact_hazard_daily (day, supervisor_id, category_id, hazardous_items,
+                                   mercury_items, total_batteries, high_hazard_items)
+    SELECT i.created_at::DATE, p.supervisor_id, i.category_id,
+           COUNT(*),
+           COUNT(*) FILTER (WHERE COALESCE((i.hazard_details->>'contains_mercury')::BOOLEAN, FALSE)),
+           SUM(COALESCE((i.hazard_details->>'battery_count')::INT, 0)),
+           COUNT(*) FILTER (WHERE c.hazard_level >= 4)
+    FROM (SELECT pickup_id, category_id, created_at, hazard_details FROM items
+          UNION ALL
+          SELECT pickup_id, category_id, created_at, hazard_details FROM items_archive) i
+    JOIN (SELECT pickup_id, supervisor_id FROM pickup_requests
+          UNION ALL
+          SELECT pickup_id, supervisor_id FROM pickup_requests_archive) p ON p.pickup_id = i.pickup_id
+    JOIN categories c ON c.category_id = i.category_id
+    WHERE p.supervisor_id IS NOT NULL
+      AND (p_category_id IS NULL OR i.category_id = p_category_id)
+      AND (COALESCE(c.hazard_level, 0) >= 3
+           OR COALESCE((i.hazard_details->>'contains_mercury')::BOOLEAN, FALSE))
+    GROUP BY 1, 2, 3;
+END;
+$$;
+
+SELECT rebuild_hazard_facts();
+
+
+-- ────────────────────────────────────────────────────────────
+-- T13: trg_fact_hazard_category
+-- ────────────────────────────────────────────────────────────
+CREATE OR REPLACE FUNCTION fn_fact_hazard_category()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM rebuild_hazard_facts(NEW.category_id);
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_fact_hazard_category
+AFTER UPDATE OF hazard_level ON categories
+FOR EACH ROW
+WHEN (OLD.hazard_level IS DISTINCT FROM NEW.hazard_level)
+EXECUTE FUNCTION fn_fact_hazard_category();
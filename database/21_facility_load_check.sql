@@ -0,0 +1,69 @@
+-- ============================================================
+-- 21_facility_load_check.sql — Facility capacity as an invariant
+-- 11 dropped chk_facility_load and checked capacity in the status
+-- trigger without a lock, so two deliveries committing together
+-- could both pass and overfill the facility.
+-- trg_facility_load_check now checks every ledger row that adds
+-- load: it locks the facility row (FOR NO KEY UPDATE), then
+-- requires base + ledger + delta <= capacity_kg. Deliveries to one
+-- facility therefore queue from the check to their commit;
+-- cancellations (negative deltas) take no lock.
+-- ============================================================
+
+-- ── T14: trg_facility_load_check ──────────────────────────
+-- The lock orders the readers: each sees the rows appended by the
+-- one before it, which has committed by the time the lock is free.
+CREATE OR REPLACE FUNCTION fn_facility_load_check()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+DECLARE
+    v_capacity  DECIMAL;
+    v_load      DECIMAL;
+BEGIN
+    SELECT capacity_kg, current_load_kg INTO v_capacity, v_load
+    FROM   recycling_facilities
+    WHERE  facility_id = NEW.facility_id
+    FOR NO KEY UPDATE;
+
+    SELECT GREATEST(0, v_load + COALESCE(SUM(delta_kg), 0)) INTO v_load
+    FROM   facility_load_ledger
+    WHERE  facility_id = NEW.facility_id;
+
+    IF v_load + NEW.delta_kg > v_capacity THEN
+        RAISE EXCEPTION 'Facility % is full: % kg available, pickup % weighs % kg.',
+            NEW.facility_id, v_capacity - v_load, NEW.pickup_id, NEW.delta_kg
+            USING ERRCODE = 'check_violation';
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+CREATE TRIGGER trg_facility_load_check
+BEFORE INSERT ON facility_load_ledger
+FOR EACH ROW
+WHEN (NEW.delta_kg > 0)
+EXECUTE FUNCTION fn_facility_load_check();
+
+
+-- ── T4 + T8: status transitions ───────────────────────────
+-- As in 13, minus the unlocked capacity read.
+CREATE OR REPLACE FUNCTION fn_pickup_status_change()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF NEW.status = 'collected' AND NEW.assigned_facility_id IS NOT NULL THEN
+        INSERT INTO facility_load_ledger (facility_id, delta_kg, pickup_id)
+        VALUES (NEW.assigned_facility_id, NEW.total_weight_kg, NEW.pickup_id);
+
+    ELSIF NEW.status = 'cancelled' AND OLD.status = 'collected'
+          AND OLD.assigned_facility_id IS NOT NULL THEN
+        INSERT INTO facility_load_ledger (facility_id, delta_kg, pickup_id)
+        VALUES (OLD.assigned_facility_id, -OLD.total_weight_kg, OLD.pickup_id);
+
+    ELSIF NEW.status = 'completed' THEN
+        UPDATE users
+        SET    last_pickup_at = NOW(),
+               user_status    = calculate_user_status(NEW.user_id)
+        WHERE  user_id = NEW.user_id;
+    END IF;
+    RETURN NEW;
+END;
+$$;
@@ -1,5 +1,6 @@
 -- ============================================================
--- 08_sample_data.sql — Demo Data
+-- sample_data.sql — Demo Data (python migrate.py seed; not a migration)
+-- Facilities, staff, vehicles, users and accounts for one shard.
 -- All passwords: password123
 -- Hashes generated with werkzeug pbkdf2:sha256
 -- ============================================================
@@ -11,24 +12,6 @@ INSERT INTO recycling_facilities (facility_name, location, capacity_kg, speciali
 ('MetalHub Gazipur',   'Gazipur Industrial',   80000, 'metals'),
 ('SafeDispose Sylhet', 'Sylhet City',          20000, 'hazardous');
 
--- ── Categories ────────────────────────────────────────────
-INSERT INTO categories (category_name, description, base_price_per_kg, hazard_level, recyclability_percentage, material_composition) VALUES
-('Laptops',      'Portable computers',          38, 2, 72.0, '{"copper_pct":8,"aluminum_pct":35,"plastics_pct":25,"gold_ppm":150}'),
-('Smartphones',  'Mobile phones & tablets',     45, 2, 68.0, '{"copper_pct":15,"gold_ppm":350,"silver_ppm":1500,"cobalt_pct":5}'),
-('Batteries',    'All battery types',           55, 4, 45.0, '{"lithium_pct":7,"cobalt_pct":12,"nickel_pct":15}'),
-('CRT Monitors', 'Old tube monitors/TVs',       15, 5, 30.0, '{"lead_pct":4,"glass_pct":65,"copper_pct":3}'),
-('Printers',     'Inkjet and laser printers',   22, 2, 55.0, '{"plastics_pct":60,"copper_pct":5,"steel_pct":20}'),
-('Cables & PCB', 'Wiring and circuit boards',   60, 3, 80.0, '{"copper_pct":25,"gold_ppm":500,"tin_pct":5}'),
-('Refrigerators','Fridges and ACs',             18, 3, 65.0, '{"steel_pct":55,"copper_pct":8,"aluminum_pct":10}'),
-('Zero-Value',   'Items with no recyclable value', 0, 1, 5.0, '{}');
-
--- ── Pricing Rules ─────────────────────────────────────────
-INSERT INTO pricing_rules (category_id, min_weight_kg, max_weight_kg, price_per_kg, bonus_percentage, effective_from) VALUES
-(1, 5.0,  NULL, 42, 5,  '2025-01-01'),  -- Laptop bulk bonus
-(2, 0.5,  NULL, 50, 10, '2025-01-01'),  -- Smartphone bonus
-(3, 10.0, NULL, 65, 15, '2025-01-01'),  -- Battery bulk
-(6, 1.0,  NULL, 70, 0,  '2025-01-01');  -- PCB standard
-
 -- ── Staff: 2 supervisors ──────────────────────────────────
 INSERT INTO staff (full_name, sub_role, contact_number) VALUES
 ('Rahman Hossain', 'supervisor', '01711-000001'),  -- staff_id=1
@@ -2,9 +2,18 @@
 db.py — PostgreSQL connection and query helpers
 """
 import os
+import re
+import json
+import time
+import itertools
+import threading
 import psycopg2
+import psycopg2.pool
 import psycopg2.extras
+import psycopg2.extensions
+from collections import OrderedDict
 from contextlib import contextmanager
+from contextvars import ContextVar
 
 DB_CONFIG = {
     'host':     os.environ.get('DB_HOST', 'localhost'),
@@ -14,39 +23,361 @@ DB_CONFIG = {
     'port':     int(os.environ.get('DB_PORT', 5432)),
 }
 
+# City shards: DB_SHARDS='{"dhaka": {"host": "db1"}, "ctg": {"host": "db2", "port": 5433}}'.
+# Keys a shard omits come from DB_CONFIG. Unset = one shard, 'default', which is DB_CONFIG.
+# DB_DEFAULT_SHARD (else the first listed) also holds the directory (see shards.py).
+SHARDS = {name: dict(DB_CONFIG, **cfg)
+          for name, cfg in json.loads(os.environ.get('DB_SHARDS') or '{}').items()} \
+         or {'default': DB_CONFIG}
+DEFAULT_SHARD = os.environ.get('DB_DEFAULT_SHARD') or next(iter(SHARDS))
+if DEFAULT_SHARD not in SHARDS:
+    raise ValueError(f'DB_DEFAULT_SHARD {DEFAULT_SHARD!r} is not in DB_SHARDS')
+
+# Optional read-only replica of the default shard. Unset DB_REPLICA_HOST = everything goes to primary.
+REPLICA_CONFIG = {
+    'host':     os.environ.get('DB_REPLICA_HOST'),
+    'dbname':   os.environ.get('DB_REPLICA_NAME', DB_CONFIG['dbname']),
+    'user':     os.environ.get('DB_REPLICA_USER', DB_CONFIG['user']),
+    'password': os.environ.get('DB_REPLICA_PASSWORD', DB_CONFIG['password']),
+    'port':     int(os.environ.get('DB_REPLICA_PORT', DB_CONFIG['port'])),
+    'connect_timeout': int(os.environ.get('DB_REPLICA_CONNECT_TIMEOUT', 2)),
+} if os.environ.get('DB_REPLICA_HOST') else None
+
+REPLICA_MAX_LAG         = float(os.environ.get('DB_REPLICA_MAX_LAG', 5))        # seconds
+REPLICA_RETRY_AFTER     = float(os.environ.get('DB_REPLICA_RETRY_AFTER', 30))   # seconds
+REPLICA_LAG_CHECK_EVERY = float(os.environ.get('DB_REPLICA_LAG_CHECK_EVERY', 2))
+READ_YOUR_WRITES_WINDOW = float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', 10))
+
+# Primary connection pool; each pooled connection keeps its own prepared statements.
+POOL_MIN           = int(os.environ.get('DB_POOL_MIN', 1))
+POOL_MAX           = int(os.environ.get('DB_POOL_MAX', 20))
+POOL_TIMEOUT       = float(os.environ.get('DB_POOL_TIMEOUT', 10))      # seconds to wait for a free connection
+PREPARE_CACHE_SIZE = int(os.environ.get('DB_PREPARE_CACHE_SIZE', 64))  # per connection; 0 = off
+UNPREPARABLE_MAX   = int(os.environ.get('DB_UNPREPARABLE_MAX', 1024))  # process-wide
+
+_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+# Process-wide replica health: skip it until `down_until` after a failure or lag spike.
+_replica_state = {'down_until': 0.0, 'lag_checked_at': 0.0}
+
+# Per-request routing state (reset by begin_request at the start of every request).
+_pin_primary = ContextVar('pin_primary', default=False)
+_wrote       = ContextVar('wrote', default=False)
+_shard       = ContextVar('shard', default=None)
+
+
+def begin_request(pin_primary=False, shard=None):
+    """Reset routing state; pin_primary=True sends this request's reads to the primary,
+    shard picks the database every query of this request goes to (default shard if None)."""
+    _pin_primary.set(bool(pin_primary))
+    _wrote.set(False)
+    set_shard(shard)
+
+def set_shard(name):
+    if name is not None and name not in SHARDS:
+        raise KeyError(f'unknown shard {name!r}')
+    _shard.set(name)
+
+def current_shard():
+    return _shard.get() or DEFAULT_SHARD
+
+@contextmanager
+def use_shard(name):
+    """Run the enclosed queries against shard `name`."""
+    if name not in SHARDS:
+        raise KeyError(f'unknown shard {name!r}')
+    token = _shard.set(name)
+    try:
+        yield
+    finally:
+        _shard.reset(token)
+
+def mark_write():
+    """Record a mutation: later reads in this request go to the primary."""
+    _wrote.set(True)
+    _pin_primary.set(True)
+
+def wrote_during_request():
+    return _wrote.get()
+
+def _replica_down(seconds):
+    _replica_state['down_until'] = time.monotonic() + seconds
+
+def _replica_lag_ok(conn):
+    """Check replay lag at most every REPLICA_LAG_CHECK_EVERY seconds."""
+    now = time.monotonic()
+    if now - _replica_state['lag_checked_at'] < REPLICA_LAG_CHECK_EVERY:
+        return True
+    with conn.cursor() as cur:
+        cur.execute(_LAG_SQL)
+        lag = float(cur.fetchone()[0] or 0)
+    _replica_state['lag_checked_at'] = now
+    if lag > REPLICA_MAX_LAG:
+        _replica_down(REPLICA_LAG_CHECK_EVERY)
+        return False
+    return True
+
+def _connect_replica():
+    """Return a read-only replica connection, or None to fall back to the primary."""
+    if REPLICA_CONFIG is None or _pin_primary.get() or current_shard() != DEFAULT_SHARD:
+        return None
+    if time.monotonic() < _replica_state['down_until']:
+        return None
+    try:
+        conn = psycopg2.connect(**REPLICA_CONFIG)
+        conn.set_session(readonly=True)
+        if _replica_lag_ok(conn):
+            return conn
+        conn.close()
+    except psycopg2.Error as e:
+        print(f'[db] replica unavailable, using primary: {e}')
+        _replica_down(REPLICA_RETRY_AFTER)
+    return None
+
+# ── Prepared statements ───────────────────────────────────
+# Statements run through _execute are PREPAREd once per pooled connection
+# (keyed by SQL text) and EXECUTEd afterwards, skipping parse/analyze and,
+# once Postgres switches to a generic plan, planning. LRU-evicted with
+# DEALLOCATE. CALL cannot be prepared; procedures instead benefit from
+# plpgsql's own per-session plan cache now that sessions are reused.
+_PREPARABLE  = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|VALUES)\b', re.I)
+_PLACEHOLDER = re.compile(r'%%|%s|%\(')
+_names       = itertools.count(1)
+_unpreparable = OrderedDict()   # LRU of SQL texts Postgres refused to PREPARE (e.g. untyped parameters)
+_stats_lock  = threading.Lock()
+_prep_stats  = {'hits': 0, 'misses': 0, 'evictions': 0, 'failures': 0}
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """Connection with an LRU of its server-side prepared statements: sql -> (name, nparams)."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = OrderedDict()
+
+def _count(key):
+    with _stats_lock:
+        _prep_stats[key] += 1
+
+def _is_unpreparable(sql):
+    if sql not in _unpreparable:
+        return False
+    with _stats_lock:
+        if sql in _unpreparable:
+            _unpreparable.move_to_end(sql)
+    return True
+
+def _mark_unpreparable(sql):
+    with _stats_lock:
+        _unpreparable[sql] = True
+        _unpreparable.move_to_end(sql)
+        if len(_unpreparable) > UNPREPARABLE_MAX:
+            _unpreparable.popitem(last=False)
+
+def _to_positional(sql):
+    """'... %s ... %%' -> ('... $1 ... %', 1); None for named (%(x)s) parameters."""
+    n = 0
+    def sub(m):
+        nonlocal n
+        if m.group() == '%%':
+            return '%'
+        if m.group() == '%(':
+            raise ValueError
+        n += 1
+        return f'${n}'
+    try:
+        return _PLACEHOLDER.sub(sub, sql), n
+    except ValueError:
+        return None
+
+def _prepare(cur, sql):
+    conn = cur.connection
+    converted = _to_positional(sql)
+    if converted is None:
+        _mark_unpreparable(sql)
+        return None
+    text, nparams = converted
+    name = f'ps_{next(_names)}'
+    try:
+        cur.execute(f'SAVEPOINT _prep; PREPARE {name} AS {text}; RELEASE SAVEPOINT _prep')
+    except psycopg2.Error:
+        cur.execute('ROLLBACK TO SAVEPOINT _prep; RELEASE SAVEPOINT _prep')
+        _mark_unpreparable(sql)
+        _count('failures')
+        return None
+    conn.prepared[sql] = (name, nparams)
+    if len(conn.prepared) > PREPARE_CACHE_SIZE:
+        _, (old, _n) = conn.prepared.popitem(last=False)
+        cur.execute(f'DEALLOCATE {old}')
+        _count('evictions')
+    return name, nparams
+
+def _execute(cur, sql, params):
+    cache = getattr(cur.connection, 'prepared', None)
+    if cache is None or PREPARE_CACHE_SIZE <= 0 or not _PREPARABLE.match(sql) or _is_unpreparable(sql):
+        cur.execute(sql, params)
+        return
+    entry = cache.get(sql)
+    if entry is not None:
+        cache.move_to_end(sql)
+        _count('hits')
+    else:
+        entry = _prepare(cur, sql)
+        if entry is None:
+            cur.execute(sql, params)
+            return
+        _count('misses')
+    name, nparams = entry
+    cur.execute(f'EXECUTE {name} ({", ".join(["%s"] * nparams)})' if nparams else f'EXECUTE {name}',
+                params)
+
+def _reset_prepared(conn):
+    """After a schema change ('cached plan must not change result type') start over."""
+    conn.prepared.clear()
+    with conn.cursor() as cur:
+        cur.execute('DEALLOCATE ALL')
+
+
+# ── Connection pool ───────────────────────────────────────
+# One pool per shard, created on first use, with its own checkout counters.
+_pool_state = {'pools': {}, 'pid': None}
+_pool_lock  = threading.Lock()
+
+def _pool(shard):
+    """Process-wide pool of `shard`, rebuilt in a forked worker (sockets must not be shared)."""
+    if _pool_state['pid'] != os.getpid():
+        with _pool_lock:
+            if _pool_state['pid'] != os.getpid():
+                _pool_state['pools'] = {}
+                _pool_state['pid']   = os.getpid()
+    entry = _pool_state['pools'].get(shard)
+    if entry is None:
+        with _pool_lock:
+            entry = _pool_state['pools'].get(shard)
+            if entry is None:
+                entry = (psycopg2.pool.ThreadedConnectionPool(
+                             POOL_MIN, POOL_MAX, connection_factory=PreparingConnection, **SHARDS[shard]),
+                         threading.BoundedSemaphore(POOL_MAX),
+                         {'in_use': 0, 'peak_in_use': 0, 'waiting': 0, 'checkouts': 0, 'timeouts': 0})
+                _pool_state['pools'][shard] = entry
+    return entry
+
+def _pool_get(shard):
+    pool, slots, stats = _pool(shard)
+    with _stats_lock:
+        stats['waiting'] += 1
+    acquired = slots.acquire(timeout=POOL_TIMEOUT)
+    with _stats_lock:
+        stats['waiting'] -= 1
+        stats['timeouts'] += not acquired
+    if not acquired:
+        raise psycopg2.pool.PoolError(f'no free database connection on {shard} after {POOL_TIMEOUT}s')
+    try:
+        conn = pool.getconn()
+    except Exception:
+        slots.release()
+        raise
+    with _stats_lock:
+        stats['checkouts'] += 1
+        stats['in_use'] += 1
+        stats['peak_in_use'] = max(stats['peak_in_use'], stats['in_use'])
+    return conn
+
+def _pool_put(shard, conn):
+    pool, slots, stats = _pool(shard)
+    try:
+        broken = conn.closed or (conn.get_transaction_status()
+                                 == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN)
+        pool.putconn(conn, close=bool(broken))
+    finally:
+        with _stats_lock:
+            stats['in_use'] -= 1
+        slots.release()
+
 @contextmanager
-def get_conn():
-    conn = psycopg2.connect(**DB_CONFIG)
+def _connection(readonly=False):
+    shard  = current_shard()
+    conn   = _connect_replica() if readonly else None
+    pooled = conn is None
+    if pooled:
+        conn = _pool_get(shard)
     conn.autocommit = False
     try:
         yield conn
         conn.commit()
-    except Exception:
-        conn.rollback()
+    except Exception as e:
+        try:
+            conn.rollback()
+            if pooled and getattr(e, 'pgcode', None) == '0A000':
+                _reset_prepared(conn)
+        except psycopg2.Error:
+            pass            # broken connection: _pool_put discards it
         raise
     finally:
-        conn.close()
+        if pooled:
+            _pool_put(shard, conn)
+        else:
+            conn.close()
+
+@contextmanager
+def get_conn(readonly=False):
+    """A connection for the caller's own transaction, committed on exit. Taking a primary
+    one counts as a write (this session's reads stay on the primary for a while); plain
+    reads go through execute_query / execute_one."""
+    if not readonly:
+        mark_write()
+    with _connection(readonly) as conn:
+        yield conn
+
+def db_metrics():
+    with _stats_lock:
+        prepared = dict(_prep_stats)
+    total = prepared['hits'] + prepared['misses']
+    prepared['hit_rate'] = round(prepared['hits'] / total, 3) if total else None
+    prepared['cache_size'] = PREPARE_CACHE_SIZE
+    prepared['unpreparable'] = len(_unpreparable)
+    with _stats_lock:
+        pools = {name: dict(stats, max=POOL_MAX) for name, (_, _, stats) in list(_pool_state['pools'].items())}
+    pool = pools.get(DEFAULT_SHARD, {'max': POOL_MAX, 'in_use': 0, 'peak_in_use': 0,
+                                     'waiting': 0, 'checkouts': 0, 'timeouts': 0})
+    return {'prepared': prepared, 'pool': pool,
+            **({'shards': pools} if len(SHARDS) > 1 else {})}
 
 def _cursor(conn):
     return conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-def execute_query(sql, params=None):
-    with get_conn() as conn:
+_WRITE_TAGS = {'INSERT', 'UPDATE', 'DELETE', 'MERGE'}
+
+def _note_write(cur):
+    """An INSERT ... RETURNING run through execute_one / execute_query is a write too."""
+    if (cur.statusmessage or '').split(' ', 1)[0] in _WRITE_TAGS:
+        mark_write()
+
+def execute_query(sql, params=None, readonly=False):
+    """readonly=True allows the query to be served by the replica."""
+    with _connection(readonly) as conn:
         with _cursor(conn) as cur:
-            cur.execute(sql, params or ())
+            _execute(cur, sql, params or ())
+            _note_write(cur)
             return [dict(r) for r in cur.fetchall()]
 
-def execute_one(sql, params=None):
-    with get_conn() as conn:
+def execute_one(sql, params=None, readonly=False):
+    with _connection(readonly) as conn:
         with _cursor(conn) as cur:
-            cur.execute(sql, params or ())
+            _execute(cur, sql, params or ())
+            _note_write(cur)
             row = cur.fetchone()
             return dict(row) if row else None
 
 def execute_update(sql, params=None):
-    with get_conn() as conn:
+    mark_write()
+    with _connection() as conn:
         with _cursor(conn) as cur:
-            cur.execute(sql, params or ())
+            _execute(cur, sql, params or ())
             return cur.rowcount
 
 def set_app_user(conn, username):
@@ -60,7 +391,8 @@ def call_proc(name, params, username=None):
     params must include None placeholders for OUT parameters.
     Returns a dict of all OUT parameter values (or empty dict).
     """
-    with get_conn() as conn:
+    mark_write()
+    with _connection() as conn:
         if username:
             set_app_user(conn, username)
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
@@ -73,8 +405,8 @@ def call_proc(name, params, username=None):
             except Exception:
                 return {}
 
-def call_func(name, params):
+def call_func(name, params, readonly=False):
     """Call a set-returning function; returns list of dicts."""
     placeholders = ','.join(['%s'] * len(params))
     sql = f"SELECT * FROM {name}({placeholders})"
-    return execute_query(sql, params)
+    return execute_query(sql, params, readonly=readonly)
@@ -0,0 +1,81 @@
+"""
+db_async.py — asyncio counterparts of db.py's query helpers (psycopg 3)
+
+Used by asgi.py for the JSON endpoints: one event loop multiplexes many
+concurrent pollers over a small AsyncConnectionPool, instead of tying up a
+WSGI worker (and a connection) per request. Same shards (one pool each,
+picked by db.current_shard()), same %s placeholders and dict rows as db.py. psycopg 3 prepares a statement
+server-side once it has run DB_ASYNC_PREPARE_THRESHOLD times on a connection.
+"""
+import os
+import asyncio
+from psycopg.rows import dict_row
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+from db import SHARDS, DEFAULT_SHARD, current_shard
+
+POOL_MIN          = int(os.environ.get('DB_ASYNC_POOL_MIN', 2))
+POOL_MAX          = int(os.environ.get('DB_ASYNC_POOL_MAX', 20))
+POOL_TIMEOUT      = float(os.environ.get('DB_ASYNC_POOL_TIMEOUT', 10))    # seconds to wait for a connection
+PREPARE_THRESHOLD = int(os.environ.get('DB_ASYNC_PREPARE_THRESHOLD', 2))
+
+_pools = {}
+_pool_lock = asyncio.Lock()
+
+
+async def _configure(conn):
+    conn.prepare_threshold = PREPARE_THRESHOLD
+
+async def _open(shard):
+    async with _pool_lock:
+        if shard not in _pools:
+            pool = AsyncConnectionPool(make_conninfo(**SHARDS[shard]), min_size=POOL_MIN, max_size=POOL_MAX,
+                                       timeout=POOL_TIMEOUT, configure=_configure, open=False,
+                                       kwargs={'autocommit': True, 'row_factory': dict_row},
+                                       name=f'ewaste-async-{shard}')
+            await pool.open()
+            _pools[shard] = pool
+    return _pools[shard]
+
+async def open_pool():
+    """Open every shard's pool (ASGI lifespan startup); later calls are no-ops."""
+    for shard in SHARDS:
+        await _open(shard)
+
+async def close_pool():
+    async with _pool_lock:
+        for pool in _pools.values():
+            await pool.close()
+        _pools.clear()
+
+async def _pool():
+    shard = current_shard()
+    return _pools.get(shard) or await _open(shard)
+
+async def execute_query(sql, params=None):
+    pool = await _pool()
+    async with pool.connection() as conn:
+        cur = await conn.execute(sql, params or ())
+        return await cur.fetchall()
+
+async def execute_one(sql, params=None):
+    pool = await _pool()
+    async with pool.connection() as conn:
+        cur = await conn.execute(sql, params or ())
+        return await cur.fetchone()
+
+async def call_func(name, params):
+    """Call a set-returning function; returns list of dicts."""
+    placeholders = ','.join(['%s'] * len(params))
+    return await execute_query(f"SELECT * FROM {name}({placeholders})", params)
+
+def _metrics(pool):
+    stats = pool.get_stats()
+    return {'max': POOL_MAX, 'open': True, 'size': stats.get('pool_size', 0),
+            'idle': stats.get('pool_available', 0), 'waiting': stats.get('requests_waiting', 0),
+            'requests': stats.get('requests_num', 0), 'timeouts': stats.get('requests_errors', 0)}
+
+def pool_metrics():
+    pools = {shard: _metrics(pool) for shard, pool in list(_pools.items())}
+    first = pools.get(DEFAULT_SHARD, {'max': POOL_MAX, 'open': False})
+    return dict(first, shards=pools) if len(SHARDS) > 1 else first
@@ -0,0 +1,239 @@
+"""
+fragcache.py — Cache for rendered template fragments (admin reports / history)
+
+A fragment is keyed by its name plus the data-version token of every domain it
+reads (database/12_data_versions.sql bumps a sequence per domain on each write),
+so a hit means the SQL and the rendering can both be skipped, and any write to
+those tables makes the next view re-render.
+
+Two tiers, both LRU and size-bounded:
+  - per-process: an OrderedDict of up to FRAGMENT_CACHE_LOCAL_BYTES
+  - shared:      a SQLite file at FRAGMENT_CACHE_PATH (stand-in for a shared
+                 cache server), up to FRAGMENT_CACHE_SHARED_BYTES, visible to
+                 every worker on the host. FRAGMENT_CACHE_PATH='' disables it.
+Entries also expire after FRAGMENT_CACHE_TTL seconds (0 disables the cache),
+which bounds how long a fragment rendered just before a write commits can stay.
+
+Keys are per shard (db.current_shard()); a fan_out fragment reads every shard
+(shards.fan_out) and is keyed on all of their versions.
+
+A cache failure is a miss, never a page error.
+"""
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from markupsafe import Markup
+from db import execute_one, current_shard
+import shards
+
+LOCAL_BYTES  = int(os.environ.get('FRAGMENT_CACHE_LOCAL_BYTES', 8 * 1024 * 1024))
+SHARED_BYTES = int(os.environ.get('FRAGMENT_CACHE_SHARED_BYTES', 64 * 1024 * 1024))
+SHARED_PATH  = os.environ.get('FRAGMENT_CACHE_PATH',
+                              os.path.join(tempfile.gettempdir(), 'ewaste_fragcache.sqlite3'))
+TTL_SECONDS  = float(os.environ.get('FRAGMENT_CACHE_TTL', 300))
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frontend', 'templates')
+
+
+def _template_stamp():
+    # Part of every key, so a deploy with changed templates never serves old HTML.
+    latest = 0
+    for root, _, files in os.walk(TEMPLATE_DIR):
+        for f in files:
+            latest = max(latest, os.path.getmtime(os.path.join(root, f)))
+    return str(int(latest))
+
+_STAMP = _template_stamp()
+_metrics = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'local_evictions': 0,
+            'shared_evictions': 0, 'errors': 0, 'last_error': None}
+_metrics_lock = threading.Lock()
+
+def _count(name, n=1):
+    with _metrics_lock:
+        _metrics[name] += n
+
+def _error(e):
+    with _metrics_lock:
+        _metrics['errors']    += 1
+        _metrics['last_error'] = str(e)
+    print(f'[fragcache] {e}')
+
+
+class LocalLRU:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes     = 0
+        self._entries  = OrderedDict()    # key -> (body, expires_at)
+        self._lock     = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, body, expires_at):
+        size = len(body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (body, expires_at)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                _count('local_evictions')
+
+    def _drop(self, key):
+        body, _ = self._entries.pop(key)
+        self.bytes -= len(body)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedStore:
+    """SQLite-backed LRU shared by all workers on the host."""
+
+    def __init__(self, path, max_bytes):
+        self.path      = path
+        self.max_bytes = max_bytes
+        self._local    = threading.local()     # sqlite connections are per thread
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=2, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute("""CREATE TABLE IF NOT EXISTS fragments (
+                                key        TEXT PRIMARY KEY,
+                                body       TEXT NOT NULL,
+                                size       INTEGER NOT NULL,
+                                expires_at REAL NOT NULL,
+                                used_at    REAL NOT NULL)""")
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_fragments_used ON fragments(used_at)')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        """(body, expires_at), or None."""
+        conn = self._conn()
+        row  = conn.execute('SELECT body, expires_at FROM fragments WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[1] < now:
+            conn.execute('DELETE FROM fragments WHERE key = ?', (key,))
+            return None
+        conn.execute('UPDATE fragments SET used_at = ? WHERE key = ?', (now, key))
+        return row
+
+    def set(self, key, body, expires_at):
+        size = len(body.encode())
+        if size > self.max_bytes:
+            return
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR REPLACE INTO fragments VALUES (?, ?, ?, ?, ?)',
+                         (key, body, size, expires_at, time.time()))
+            excess = conn.execute('SELECT COALESCE(SUM(size), 0) FROM fragments').fetchone()[0] - self.max_bytes
+            if excess > 0:
+                victims = []
+                for victim, vsize in conn.execute('SELECT key, size FROM fragments ORDER BY used_at'):
+                    if excess <= 0:
+                        break
+                    victims.append((victim,))
+                    excess -= vsize
+                conn.executemany('DELETE FROM fragments WHERE key = ?', victims)
+                _count('shared_evictions', len(victims))
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+
+    def stats(self):
+        count, size = self._conn().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM fragments').fetchone()
+        return {'entries': count, 'bytes': size, 'max_bytes': self.max_bytes, 'path': self.path}
+
+
+LOCAL  = LocalLRU(LOCAL_BYTES)
+SHARED = SharedStore(SHARED_PATH, SHARED_BYTES) if SHARED_PATH else None
+
+
+class Fragments:
+    """Per-request helper; reads all version tokens once, on first use."""
+
+    def __init__(self, fan_out=False):
+        self.fan_out   = fan_out
+        self._scope    = '*' if fan_out else current_shard()
+        self._versions = None
+
+    def versions(self):
+        """{domain: token}; with fan_out the token joins every shard's version."""
+        if self._versions is None:
+            # From the primary: a replica's view of a sequence advances in steps of 32.
+            def read():
+                row = execute_one('SELECT data_versions() AS v')
+                return row['v'] if row else {}
+            per_shard = list(shards.fan_out(read).values()) if self.fan_out else [read()]
+            domains = {d for v in per_shard for d in v}
+            self._versions = {d: '/'.join(str(v.get(d, 0)) for v in per_shard) for d in domains}
+        return self._versions
+
+    def get(self, name, domains, render):
+        """Cached HTML of fragment `name`, which reads the given data domains;
+        render() runs the queries and returns the HTML on a miss."""
+        if TTL_SECONDS <= 0:
+            return Markup(render())
+        versions = self.versions()
+        key = ':'.join([name, _STAMP, self._scope] + [f'{d}{versions.get(d, 0)}' for d in domains])
+
+        body = LOCAL.get(key)
+        if body is not None:
+            _count('local_hits')
+            return Markup(body)
+        if SHARED is not None:
+            entry = None
+            try:
+                entry = SHARED.get(key)
+            except sqlite3.Error as e:
+                _error(e)
+            if entry is not None:
+                _count('shared_hits')
+                body, expires_at = entry
+                LOCAL.set(key, body, expires_at)       # keep the original expiry, not a fresh TTL
+                return Markup(body)
+
+        _count('misses')
+        body = str(render())
+        expires_at = time.time() + TTL_SECONDS
+        LOCAL.set(key, body, expires_at)
+        if SHARED is not None:
+            try:
+                SHARED.set(key, body, expires_at)
+            except sqlite3.Error as e:
+                _error(e)
+        return Markup(body)
+
+
+def metrics():
+    with _metrics_lock:
+        out = dict(_metrics)
+    out['local'] = {'entries': len(LOCAL), 'bytes': LOCAL.bytes, 'max_bytes': LOCAL.max_bytes}
+    try:
+        out['shared'] = SHARED.stats() if SHARED is not None else None
+    except sqlite3.Error as e:
+        out['shared'] = {'error': str(e)}
+    out['ttl_seconds'] = TTL_SECONDS
+    return out
@@ -0,0 +1,158 @@
+"""
+maintenance.py — Periodic database maintenance jobs (run from cron)
+
+Usage:
+    python maintenance.py archive [--months 12] [--batch-size 500]
+        Move completed pickups older than N months (with items, weights,
+        payments and payment requests) into the *_archive tables.
+        One transaction per batch, so it can run alongside live traffic.
+
+    python maintenance.py compact-load [--every SECONDS]
+        Fold facility_load_ledger into recycling_facilities.current_load_kg.
+        With --every, keep running and compact on that interval.
+
+    python maintenance.py score-weights [--days N] [--dry-run]
+        Score weighings for inflated weights (weight_anomaly.py) and raise
+        'weight_anomaly' admin alerts for outlying items and collectors.
+
+    python maintenance.py shard-init
+        Interleave id sequences across DB_SHARDS and register each shard's
+        cities and usernames in the directory (shards.py). Rerun after adding
+        a shard.
+
+    python maintenance.py move-city CITY --to SHARD [--dry-run] [--grace S]
+        Move a city's users, pickups and regional staff to another shard.
+        Its writes are refused while it moves.
+
+With DB_SHARDS set, archive / compact-load / score-weights run on every shard
+in turn (or just --shard NAME), skipping a shard a city is being moved off.
+"""
+import sys
+import time
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from db import SHARDS, call_proc, use_shard
+import shards
+
+
+def cmd_archive(args):
+    total, started = 0, time.monotonic()
+    while True:
+        result = call_proc('archive_completed_pickups',
+                           (args.months, args.batch_size, None), username='maintenance')
+        moved = result.get('p_archived') or 0
+        total += moved
+        if moved:
+            print(f'[maintenance] archived {moved} pickup(s) ({total} so far)')
+        if moved < args.batch_size:
+            break
+    print(f'[maintenance] archive done: {total} pickup(s) in {time.monotonic() - started:.1f}s')
+    return 0
+
+def cmd_compact_load(args):
+    while True:
+        for name in [args.shard] if args.shard else SHARDS:
+            if shards.moving_out(name):
+                print(f'[maintenance] {name}: a city is moving off it, skipped this round')
+                continue
+            with use_shard(name):
+                result = call_proc('compact_facility_load', (None,), username='maintenance')
+            print(f"[maintenance] compacted {result.get('p_entries') or 0} facility load entries"
+                  + (f' on {name}' if len(SHARDS) > 1 else ''))
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+def cmd_score_weights(args):
+    import weight_anomaly                 # needs NumPy; only this job does
+    result = weight_anomaly.run(days=args.days, item_z=args.item_z, collector_z=args.collector_z,
+                                min_records=args.min_records, max_item_alerts=args.max_item_alerts,
+                                dry_run=args.dry_run)
+    print(f"[maintenance] scored {result['records']} weighings: {result['flagged_items']} item(s), "
+          f"{result['flagged_collectors']} collector(s) flagged, {result['alerts']} alert(s) raised "
+          f"(fetch {result['fetch_s']}s, score {result['score_s']}s, insert {result['insert_s']}s)")
+    return 0
+
+def cmd_shard_init(args):
+    conflicts = shards.init_shards()
+    for c in conflicts:
+        print(f'[maintenance] conflict: {c}')
+    return 1 if conflicts else 0
+
+def cmd_move_city(args):
+    try:
+        result = shards.move_city(args.city, args.to, dry_run=args.dry_run, grace=args.grace)
+    except shards.MoveError as e:
+        print(f'[maintenance] cannot move {args.city}: {e}')
+        return 1
+    for table, n in result['rows'].items():
+        if n:
+            print(f'[maintenance]   {table}: {n}')
+    if result['moved']:
+        print(f"[maintenance] moved {args.city} from {result['source']} to {result['target']} "
+              f"in {result['seconds']}s")
+    else:
+        print(f"[maintenance] dry run: would move {args.city} from {result['source']} to {result['target']}")
+    return 0
+
+def per_shard(func):
+    """Run a job on each shard (or --shard) in turn; the worst exit code wins.
+    A shard a city is being moved off is skipped: the job's writes could be lost."""
+    def run(args):
+        codes = [0]
+        for name in [args.shard] if args.shard else SHARDS:
+            if shards.moving_out(name):
+                print(f'[maintenance] shard {name}: a city is moving off it, skipped')
+                continue
+            if len(SHARDS) > 1:
+                print(f'[maintenance] shard {name}')
+            with use_shard(name):
+                codes.append(func(args))
+        return max(codes)
+    return run
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='E-waste database maintenance jobs.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('archive', help='archive completed pickups older than --months')
+    p.add_argument('--months', type=int, default=12)
+    p.add_argument('--batch-size', type=int, default=500)
+    p.set_defaults(func=per_shard(cmd_archive))
+
+    p = sub.add_parser('compact-load', help='fold the facility load ledger into current_load_kg')
+    p.add_argument('--every', type=float, default=0, help='repeat every N seconds')
+    p.set_defaults(func=cmd_compact_load)
+
+    p = sub.add_parser('score-weights', help='flag anomalous item / collector weights')
+    p.add_argument('--days', type=int, default=None, help='only weighings from the last N days')
+    p.add_argument('--item-z', type=float, default=3.5)
+    p.add_argument('--collector-z', type=float, default=1.5)
+    p.add_argument('--min-records', type=int, default=20)
+    p.add_argument('--max-item-alerts', type=int, default=200)
+    p.add_argument('--dry-run', action='store_true', help='score without raising alerts')
+    p.set_defaults(func=per_shard(cmd_score_weights))
+
+    p = sub.add_parser('shard-init', help='interleave ids and fill the shard directory')
+    p.set_defaults(func=cmd_shard_init)
+
+    p = sub.add_parser('move-city', help='move a city to another shard')
+    p.add_argument('city')
+    p.add_argument('--to', required=True, choices=list(SHARDS))
+    p.add_argument('--dry-run', action='store_true', help='check and count rows only')
+    p.add_argument('--grace', type=float, default=None,
+                   help='seconds to wait after marking the city moving (default SHARD_DIRECTORY_TTL + 1)')
+    p.set_defaults(func=cmd_move_city)
+
+    for name in ('archive', 'compact-load', 'score-weights'):
+        sub.choices[name].add_argument('--shard', choices=list(SHARDS), default=None,
+                                       help='only this shard (default: every shard)')
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""
+migrate.py — Versioned schema migrations for database/*.sql
+
+Every numbered file in database/ (01_tables.sql, 06b_extra.sql, 09_....sql)
+is a migration, applied once in file-name order and recorded with its
+checksum in schema_migrations. Applied files must never be edited; add a
+new numbered file instead. Data to load, not schema, lives in database/seed/
+and is loaded by `seed`, never by `up`.
+
+Usage:
+    python migrate.py status     # applied / pending / modified files
+    python migrate.py up         # apply pending files (one transaction each)
+    python migrate.py seed       # categories and pricing rules on every shard, demo
+                                 # accounts on the default one (skips tables with rows)
+    python migrate.py baseline --to 07_triggers.sql
+                                 # mark files up to and including that one applied
+                                 # without running them (databases built earlier
+                                 # with the psql loop); then run `up` for the rest
+    python migrate.py verify     # exit 1 if an applied file changed on disk
+
+With DB_SHARDS set, every command runs on each shard in turn (--shard NAME
+for one); every shard carries the full schema.
+"""
+import os
+import re
+import sys
+import time
+import hashlib
+import argparse
+import psycopg2
+import psycopg2.errors
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from db import SHARDS, DEFAULT_SHARD, use_shard, execute_query
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database')
+SEED_DIR       = os.path.join(MIGRATIONS_DIR, 'seed')
+MIGRATION_FILE = re.compile(r'^\d+[a-z]?_[\w-]+\.sql$')
+LOCK_KEY       = 7300029   # pg_advisory_lock key shared by every runner
+
+CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version     VARCHAR(100) PRIMARY KEY,   -- file name, e.g. 04_views.sql
+        checksum    CHAR(64)     NOT NULL,      -- sha256 of the file contents
+        applied_at  TIMESTAMP    DEFAULT NOW(),
+        duration_ms INT
+    )
+"""
+
+
+class MigrationError(Exception):
+    pass
+
+
+def discover():
+    """Return [(version, path)] for every migration file, in apply order."""
+    names = sorted(n for n in os.listdir(MIGRATIONS_DIR) if MIGRATION_FILE.match(n))
+    return [(n, os.path.join(MIGRATIONS_DIR, n)) for n in names]
+
+def checksum(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def applied_versions(conn):
+    """{version: checksum} of applied migrations ({} if never migrated)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return {}
+        cur.execute("SELECT version, checksum FROM schema_migrations")
+        return dict(cur.fetchall())
+
+def plan(conn):
+    """Split migrations into (pending, modified) lists of (version, path)."""
+    applied = applied_versions(conn)
+    pending, modified = [], []
+    for version, path in discover():
+        if version not in applied:
+            pending.append((version, path))
+        elif applied[version].strip() != checksum(path):
+            modified.append((version, path))
+    return pending, modified
+
+def check_schema_version():
+    """
+    Startup check: one query per shard on a pooled connection, no DDL. Raises
+    MigrationError when a database is missing migrations that exist on disk.
+    """
+    for shard in SHARDS:
+        where = f' on shard {shard}' if len(SHARDS) > 1 else ''
+        try:
+            with use_shard(shard):
+                applied = {r['version'] for r in execute_query("SELECT version FROM schema_migrations")}
+        except psycopg2.errors.UndefinedTable:
+            raise MigrationError(
+                f'Database{where} is not under migration control. '
+                'Run "python migrate.py up" (new database) or "python migrate.py baseline --to <last file run>".')
+        missing = [v for v, _ in discover() if v not in applied]
+        if missing:
+            raise MigrationError(
+                f'{len(missing)} pending migration(s){where}: {", ".join(missing)}. Run "python migrate.py up".')
+
+
+def _locked(conn):
+    """Hold the session advisory lock so concurrent runners apply files once."""
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+        cur.execute(CREATE_TABLE_SQL)
+    conn.autocommit = False
+
+def _unlock(conn):
+    conn.rollback()
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+
+def _record(cur, version, path, duration_ms=None):
+    cur.execute(
+        "INSERT INTO schema_migrations (version, checksum, duration_ms) VALUES (%s,%s,%s)",
+        (version, checksum(path), duration_ms))
+
+def _has_unmanaged_schema(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('pickup_requests') IS NOT NULL")
+        return cur.fetchone()[0]
+
+def cmd_status(conn):
+    applied = applied_versions(conn)
+    pending, modified = plan(conn)
+    pending, modified = {v for v, _ in pending}, {v for v, _ in modified}
+    for version, _ in discover():
+        state = 'pending' if version in pending else 'MODIFIED' if version in modified else 'applied'
+        print(f'  {state:<8} {version}')
+    print(f'{len(applied)} applied, {len(pending)} pending, {len(modified)} modified')
+    return 0
+
+def cmd_verify(conn):
+    _, modified = plan(conn)
+    for version, _ in modified:
+        print(f'[migrate] checksum mismatch: {version} was edited after it was applied')
+    return 1 if modified else 0
+
+def cmd_up(conn):
+    _locked(conn)
+    try:
+        # Re-plan under the lock: another runner may have just finished.
+        pending, modified = plan(conn)
+        if modified:
+            raise MigrationError('Applied migration(s) changed on disk: '
+                                 + ', '.join(v for v, _ in modified))
+        if pending and pending[0][0] == discover()[0][0] and _has_unmanaged_schema(conn):
+            raise MigrationError('Schema exists but schema_migrations is empty; '
+                                 'run "python migrate.py baseline --to <last file run>" first.')
+        for version, path in pending:
+            with open(path) as f:
+                sql = f.read()
+            started = time.monotonic()
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                _record(cur, version, path, int((time.monotonic() - started) * 1000))
+            conn.commit()
+            print(f'[migrate] applied {version}')
+        if not pending:
+            print('[migrate] up to date')
+    finally:
+        _unlock(conn)
+    return 0
+
+def cmd_baseline(conn, to):
+    """Record pending files up to and including `to` as applied; later ones stay pending."""
+    if to not in {v for v, _ in discover()}:
+        raise MigrationError(f'--to {to}: no such migration file')
+    _locked(conn)
+    try:
+        pending, _ = plan(conn)
+        with conn.cursor() as cur:
+            for version, path in pending:
+                if version > to:
+                    break
+                _record(cur, version, path)
+                print(f'[migrate] marked {version} as applied')
+        conn.commit()
+    finally:
+        _unlock(conn)
+    return 0
+
+def _load(conn, name, probe):
+    """Run seed/<name> unless table `probe` already has rows."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT EXISTS (SELECT 1 FROM {probe})")
+        if cur.fetchone()[0]:
+            print(f'[migrate] {probe} already has rows, {name} skipped')
+            return
+        with open(os.path.join(SEED_DIR, name)) as f:
+            cur.execute(f.read())
+    conn.commit()
+    print(f'[migrate] loaded {name}')
+
+def cmd_seed(conn, demo=True):
+    """Load reference data and, with `demo`, the demo accounts into a migrated database."""
+    pending, _ = plan(conn)
+    if pending:
+        raise MigrationError(f'{len(pending)} pending migration(s); run "python migrate.py up" first.')
+    _load(conn, 'reference_data.sql', 'categories')
+    if demo:
+        _load(conn, 'sample_data.sql', 'accounts')
+    return 0
+
+COMMANDS = {'status': cmd_status, 'up': cmd_up, 'baseline': cmd_baseline, 'verify': cmd_verify,
+            'seed': cmd_seed}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply database/*.sql migrations.')
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('--shard', choices=sorted(SHARDS), help='only this shard (default: all)')
+    parser.add_argument('--to', metavar='VERSION',
+                        help='baseline: last file the database already has (e.g. 07_triggers.sql)')
+    args = parser.parse_args(argv)
+    if args.command == 'baseline' and not args.to:
+        parser.error('baseline needs --to VERSION, the last file already run on the database')
+    status = 0
+    for shard in [args.shard] if args.shard else SHARDS:
+        if len(SHARDS) > 1:
+            print(f'[migrate] shard {shard}')
+        conn = psycopg2.connect(**SHARDS[shard])
+        try:
+            if args.command == 'baseline':
+                status = cmd_baseline(conn, args.to) or status
+            elif args.command == 'seed':
+                status = cmd_seed(conn, demo=shard == (args.shard or DEFAULT_SHARD)) or status
+            else:
+                status = COMMANDS[args.command](conn) or status
+        except MigrationError as e:
+            print(f'[migrate] {e}')
+            return 1
+        finally:
+            conn.close()
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+passwords.py — Password hashing and verification off the request thread
+
+Hashes are computed in a process pool of PASSWORD_WORKERS processes, so a
+login storm burns CPU there instead of holding a request thread and the GIL.
+The queue is bounded: at most PASSWORD_MAX_QUEUE jobs wait for a free
+process. A job that finds no slot within PASSWORD_QUEUE_TIMEOUT seconds
+raises Busy, and the route asks the user to retry rather than piling up.
+PASSWORD_WORKERS=0 hashes inline (development, Windows).
+
+Each server process has its own pool. PASSWORD_WORKERS defaults to the CPU
+count divided by WEB_CONCURRENCY (the server worker count gunicorn and
+uvicorn read; 1 if unset), so the pools on one host share its cores rather
+than each claiming all of them.
+
+PASSWORD_HASH_METHOD sets the parameters for new hashes, as a werkzeug method
+string, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'; unset = werkzeug's
+default. After a successful login with a hash made with other parameters,
+the account is rehashed in the background.
+"""
+import os
+import time
+import threading
+import contextvars
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+
+WORKERS       = int(os.environ.get('PASSWORD_WORKERS')
+                    or max((os.cpu_count() or 2) // int(os.environ.get('WEB_CONCURRENCY') or 1), 1))
+MAX_QUEUE     = int(os.environ.get('PASSWORD_MAX_QUEUE', 64))
+QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_QUEUE_TIMEOUT', 2))     # seconds to wait for a slot
+JOB_TIMEOUT   = float(os.environ.get('PASSWORD_JOB_TIMEOUT', 30))
+HASH_METHOD   = os.environ.get('PASSWORD_HASH_METHOD') or None
+
+
+class Busy(Exception):
+    """Every process is busy and the queue is full."""
+
+
+# ── Worker-side functions (run in the pool; module-level so they pickle) ──
+def _verify(pwhash, password):
+    started = time.perf_counter()
+    return check_password_hash(pwhash, password), time.perf_counter() - started
+
+def _hash(password, method):
+    started = time.perf_counter()
+    kw = {'method': method} if method else {}
+    return generate_password_hash(password, **kw), time.perf_counter() - started
+
+
+# ── Pool ──────────────────────────────────────────────────
+_slots   = threading.BoundedSemaphore(max(WORKERS, 1) + MAX_QUEUE)
+_lock    = threading.Lock()
+_state   = {'pool': None, 'pid': None, 'method': None}
+_metrics = {'submitted': 0, 'completed': 0, 'rejected': 0, 'failed': 0, 'in_flight': 0,
+            'peak_in_flight': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0,
+            'run_ms_total': 0.0, 'rehashed': 0}
+
+def _pool():
+    # forkserver: workers start from a clean process, not a fork of a threaded app worker.
+    with _lock:
+        if _state['pool'] is None or _state['pid'] != os.getpid():
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            _state['pool'] = ProcessPoolExecutor(max_workers=WORKERS, mp_context=ctx)
+            _state['pid']  = os.getpid()
+            # werkzeug fills in default parameters; learn the exact prefix new hashes get.
+            _state['method'] = _state['pool'].submit(_hash, 'calibration', HASH_METHOD)
+        return _state['pool']
+
+def _release(future=None):
+    """Give back a queue slot; also the done-callback of every submitted job."""
+    with _lock:
+        _metrics['in_flight'] -= 1
+    _slots.release()
+
+def _run(fn, *args):
+    if WORKERS <= 0:
+        return fn(*args)[0]
+    if not _slots.acquire(timeout=QUEUE_TIMEOUT):
+        with _lock:
+            _metrics['rejected'] += 1
+        raise Busy('password workers are saturated')
+    started = time.perf_counter()
+    with _lock:
+        _metrics['submitted'] += 1
+        _metrics['in_flight'] += 1
+        _metrics['peak_in_flight'] = max(_metrics['peak_in_flight'], _metrics['in_flight'])
+    future = None
+    try:
+        future = _pool().submit(fn, *args)
+        # The slot is freed when the job ends, not when we stop waiting for it:
+        # a job that timed out still holds a process until it finishes.
+        future.add_done_callback(_release)
+        result, run_s = future.result(timeout=JOB_TIMEOUT)
+    except BrokenProcessPool:
+        with _lock:
+            _metrics['failed'] += 1
+            _state['pool'] = None                  # recreated on the next call
+        raise Busy('password worker pool restarted')
+    except FutureTimeout:
+        with _lock:
+            _metrics['failed'] += 1
+        raise Busy(f'password job took over {JOB_TIMEOUT:g}s')
+    finally:
+        if future is None:                         # never submitted
+            _release()
+    wait_ms = max((time.perf_counter() - started - run_s) * 1000, 0)
+    with _lock:
+        _metrics['completed']     += 1
+        _metrics['wait_ms_total'] += wait_ms
+        _metrics['wait_ms_max']    = max(_metrics['wait_ms_max'], wait_ms)
+        _metrics['run_ms_total']  += run_s * 1000
+    return result
+
+
+# ── API ───────────────────────────────────────────────────
+def verify(pwhash, password):
+    """check_password_hash in the pool. Raises Busy."""
+    return _run(_verify, pwhash, password)
+
+def hash_password(password):
+    """generate_password_hash with PASSWORD_HASH_METHOD, in the pool. Raises Busy."""
+    return _run(_hash, password, HASH_METHOD)
+
+def current_method():
+    """Method prefix new hashes get, e.g. 'scrypt:32768:8:1'; None while still being worked out."""
+    if WORKERS <= 0:
+        if _state['method'] is None:
+            _state['method'] = _hash('calibration', HASH_METHOD)[0].split('$', 1)[0]
+        return _state['method']
+    _pool()
+    future = _state['method']
+    if not future.done() or future.exception() is not None:
+        return None
+    return future.result()[0].split('$', 1)[0]
+
+def needs_rehash(pwhash):
+    method = current_method()
+    return method is not None and pwhash.split('$', 1)[0] != method
+
+def rehash_in_background(account_id, old_hash, password):
+    """Store a hash with the current parameters, unless the password changed meanwhile."""
+    def work():
+        from db import execute_update              # not at module level: pool workers import this file
+        try:
+            execute_update("UPDATE accounts SET password_hash=%s WHERE account_id=%s AND password_hash=%s",
+                           (hash_password(password), account_id, old_hash))
+            with _lock:
+                _metrics['rehashed'] += 1
+        except Exception as e:                      # best effort; retried on the next login
+            print(f'[passwords] rehash of account {account_id} failed: {e}')
+    # Run in a copy of the request's context, so the UPDATE goes to the account's shard.
+    threading.Thread(target=contextvars.copy_context().run, args=(work,),
+                     name='password-rehash', daemon=True).start()
+
+def metrics():
+    with _lock:
+        m = dict(_metrics)
+    done, wait_ms, run_ms = m['completed'], m.pop('wait_ms_total'), m.pop('run_ms_total')
+    m['wait_ms_avg'] = round(wait_ms / done, 1) if done else None
+    m['run_ms_avg']  = round(run_ms / done, 1) if done else None
+    m['wait_ms_max'] = round(m['wait_ms_max'], 1)
+    m.update(workers=WORKERS, max_queue=MAX_QUEUE, queued=max(m['in_flight'] - WORKERS, 0),
+             method=HASH_METHOD or 'werkzeug default')
+    return m
@@ -0,0 +1,105 @@
+"""
+queries.py — SQL of the app's hot statements
+
+app.py runs these and scripts/plan_check.py EXPLAINs the very same strings, so
+a plan check always tests what the page sends. Statements that routes build
+from filters are split into a base (ending in WHERE 1=1, filters appended as
+" AND col=%s") and the ORDER BY / LIMIT tail.
+"""
+
+# ── Login / user pages ────────────────────────────────────
+LOGIN = (
+    "SELECT a.*, s.sub_role, COALESCE(u.city, s.city, sup.city) AS city FROM accounts a "
+    "LEFT JOIN users u   ON a.user_id = u.user_id "
+    "LEFT JOIN staff s   ON a.staff_id = s.staff_id "
+    "LEFT JOIN staff sup ON s.supervisor_id = sup.staff_id "
+    "WHERE a.username = %s AND a.is_active = TRUE")
+
+USER_STATS = """
+    SELECT
+        COUNT(*) FILTER (WHERE status='pending')             AS pending_count,
+        COUNT(*) FILTER (WHERE status IN ('supervisor_assigned','field_assigned')) AS assigned_count,
+        COUNT(*) FILTER (WHERE status='collected')           AS collected_count,
+        COUNT(*) FILTER (WHERE status='completed')           AS completed_count,
+        COALESCE(SUM(total_weight_kg) FILTER (WHERE status='completed'),0) AS total_weight,
+        COALESCE(SUM(total_amount)    FILTER (WHERE status='completed'),0) AS total_earned
+    FROM pickup_requests WHERE user_id=%s"""
+
+USER_RECENT   = "SELECT * FROM v_pickup_full WHERE user_id=%s ORDER BY pickup_id DESC LIMIT 5"
+USER_PICKUPS  = "SELECT * FROM v_pickup_full WHERE user_id=%s ORDER BY pickup_id DESC"
+USER_PICKUP   = "SELECT * FROM v_pickup_history WHERE pickup_id=%s AND user_id=%s"
+PICKUP_ITEMS  = "SELECT * FROM v_item_history WHERE pickup_id=%s"
+USER_HISTORY  = "SELECT * FROM v_pickup_history WHERE user_id=%s ORDER BY pickup_id DESC"
+
+USER_PAYMENTS = """
+    SELECT py.*, p.pickup_address, p.total_weight_kg, p.collected_at
+    FROM v_payment_history py
+    JOIN v_pickup_history p ON py.pickup_id = p.pickup_id
+    WHERE p.user_id = %s AND py.payment_status = 'completed'
+    ORDER BY py.processed_at DESC"""
+
+# ── Field staff ───────────────────────────────────────────
+# pickup_assignments.phase encodes the per-role active/done status sets
+FIELD_STATS = """
+    SELECT
+        COUNT(*) FILTER (WHERE phase='active' AND scheduled_time::date = CURRENT_DATE) AS today_count,
+        COUNT(*) FILTER (WHERE phase='active') AS pending_count,
+        COUNT(*) FILTER (WHERE phase='done')   AS done_count,
+        COALESCE(SUM(total_weight_kg) FILTER (WHERE phase='done'), 0) AS total_weight
+    FROM pickup_assignments
+    WHERE staff_id=%s AND phase IN ('active','done')"""
+
+FIELD_OPEN = """
+    SELECT v.* FROM pickup_assignments a
+    JOIN v_pickup_full v ON v.pickup_id = a.pickup_id
+    WHERE a.staff_id=%s AND a.phase='active'
+    ORDER BY a.scheduled_time ASC LIMIT 10"""
+
+FIELD_HISTORY = """
+    SELECT v.* FROM pickup_assignments a
+    JOIN v_pickup_history v ON v.pickup_id = a.pickup_id
+    WHERE a.staff_id=%s AND a.phase='done'
+    ORDER BY a.collected_at DESC LIMIT 100"""
+
+# ── Supervisor ────────────────────────────────────────────
+SUP_NEEDS_ASSIGNMENT = \
+    "SELECT * FROM v_pickup_full WHERE supervisor_id=%s AND status='supervisor_assigned' ORDER BY preferred_date ASC"
+
+SUP_IN_PROGRESS = """
+    SELECT * FROM v_pickup_full
+    WHERE supervisor_id=%s AND status IN ('field_assigned','picked_up','delivered')
+    ORDER BY scheduled_time ASC"""
+
+SUP_COLLECTED = \
+    "SELECT * FROM v_pickup_full WHERE supervisor_id=%s AND status='collected' ORDER BY collected_at ASC"
+
+SUP_PAY_REQUESTS = \
+    "SELECT * FROM v_payment_requests_full WHERE supervisor_id=%s AND status='pending' ORDER BY requested_at DESC"
+
+SUP_HISTORY = """
+    SELECT * FROM v_pickup_history
+    WHERE supervisor_id=%s AND status IN ('collected','completed')
+    ORDER BY collected_at DESC LIMIT 100"""
+
+# ── Admin ─────────────────────────────────────────────────
+ADMIN_RECENT_PICKUPS = "SELECT * FROM v_pickup_full ORDER BY pickup_id DESC LIMIT 8"
+ADMIN_ALERTS_ACTIVE  = "SELECT * FROM v_admin_alerts_active LIMIT 10"
+ADMIN_OVERDUE        = "SELECT * FROM v_overdue_payments LIMIT 10"
+ADMIN_HISTORY        = "SELECT * FROM v_pickup_history ORDER BY pickup_id DESC LIMIT 200"
+
+ADMIN_PICKUPS       = "SELECT * FROM v_pickup_full WHERE 1=1"
+ADMIN_PICKUPS_ORDER = " ORDER BY pickup_id DESC"
+
+ALERTS       = "SELECT * FROM admin_alerts WHERE 1=1"
+ALERTS_ORDER = " ORDER BY alert_severity_rank(severity), last_seen_at DESC LIMIT %s OFFSET %s"   # idx_alert_active_rank
+
+# resolved_by first, then one " AND col = %s" per criterion
+RESOLVE_ALERTS = "UPDATE admin_alerts SET is_resolved=TRUE, resolved_at=NOW(), resolved_by=%s WHERE is_resolved=FALSE"
+
+AUDIT_LOG       = "SELECT * FROM audit_log WHERE 1=1"
+AUDIT_LOG_ORDER = " ORDER BY changed_at DESC LIMIT %s OFFSET %s"
+
+# ── Reports (run on every shard) ──────────────────────────
+REPORT_SUPERVISORS = "SELECT * FROM v_supervisor_team ORDER BY total_pickups DESC"
+REPORT_CATEGORIES  = "SELECT * FROM v_category_statistics WHERE total_items>0 ORDER BY total_payout_value DESC"
+REPORT_TOP_USERS   = "SELECT * FROM v_user_activity WHERE total_pickups>0 ORDER BY total_earnings DESC LIMIT 15"
@@ -0,0 +1,111 @@
+"""
+scripts/bench_api_concurrency.py — Concurrent pollers against the JSON API
+
+Logs in once, then opens N keep-alive connections that each poll an /api
+endpoint back to back for --seconds, for every N in --levels. Prints
+throughput, p50/p95 latency and errors per level, so the WSGI server
+(python app.py, or gunicorn) and the ASGI one (uvicorn asgi:application)
+can be compared at the concurrency where each starts failing.
+Uses a minimal asyncio HTTP/1.1 client, so it needs nothing beyond the stdlib.
+
+Usage:
+    python app.py                                         # :5000, sync
+    uvicorn asgi:application --port 8000                  # async /api
+    python scripts/bench_api_concurrency.py --url http://localhost:5000 --url http://localhost:8000
+    python scripts/bench_api_concurrency.py --url http://localhost:8000 --levels 100,1000,3000 \\
+        --path /api/supervisor-stats/1
+
+Raise `ulimit -n` above the largest level first.
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+import urllib.parse
+import urllib.request
+import http.cookiejar
+
+
+def login(base, username, password):
+    """Session cookie header value for the account, via the HTML login form."""
+    jar    = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    data   = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+    opener.open(base + '/login', data, timeout=10).read()
+    cookies = '; '.join(f'{c.name}={c.value}' for c in jar)
+    if 'session=' not in cookies:
+        raise SystemExit(f'[bench] login to {base} failed')
+    return cookies
+
+async def poller(host, port, request, deadline, latencies, errors):
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), 10)
+            started = time.monotonic()
+            writer.write(request)
+            await writer.drain()
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 30)
+            status = int(head.split(b' ', 2)[1])
+            length, close = 0, False
+            for line in head.split(b'\r\n')[1:]:
+                name, _, value = line.partition(b':')
+                if name.lower() == b'content-length':
+                    length = int(value)
+                elif name.lower() == b'connection' and value.strip().lower() == b'close':
+                    close = True
+            await reader.readexactly(length)
+            if status == 200:
+                latencies.append(time.monotonic() - started)
+            else:
+                errors[status] = errors.get(status, 0) + 1
+            if close:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+async def run_level(base, path, cookie, n, seconds):
+    url  = urllib.parse.urlsplit(base)
+    host = url.hostname
+    port = url.port or 80
+    request = (f'GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\nCookie: {cookie}\r\n'
+               f'Connection: keep-alive\r\n\r\n').encode()
+    latencies, errors = [], {}
+    deadline = time.monotonic() + seconds
+    await asyncio.gather(*(poller(host, port, request, deadline, latencies, errors) for _ in range(n)))
+    return latencies, errors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent polling benchmark for /api endpoints.')
+    parser.add_argument('--url', action='append', help='server base URL (repeatable)')
+    parser.add_argument('--path', default='/api/facility-capacity/1')
+    parser.add_argument('--levels', default='50,200,1000,2000')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='password123')
+    args = parser.parse_args(argv)
+
+    print(f"{'server':<24} {'conns':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8}  errors")
+    for base in args.url or ['http://localhost:5000']:
+        base = base.rstrip('/')
+        cookie = login(base, args.username, args.password)
+        for n in (int(x) for x in args.levels.split(',')):
+            latencies, errors = asyncio.run(run_level(base, args.path, cookie, n, args.seconds))
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000 if latencies else 0
+            p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+            err = ', '.join(f'{k}: {v}' for k, v in sorted(errors.items(), key=str)) or '-'
+            print(f'{base:<24} {n:>6} {len(latencies) / args.seconds:>9.0f} {p50:>8.1f} {p95:>8.1f}  {err}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+scripts/bench_facility_load.py — 200 parallel deliveries to one facility
+
+Each worker opens its own connection, waits on a barrier, then runs
+CALL deliver_pickup(...) for a distinct picked_up pickup at the same facility
+and holds the transaction open for --hold-ms (the rest of a request) before
+finishing. Transactions are rolled back unless --commit, so the run is
+repeatable on a seeded database.
+
+Modes:
+    ledger    current schema (append to facility_load_ledger; since 21 the
+              capacity check locks the facility row too)
+    hot-row   additionally updates the facility row in the same transaction,
+              reproducing the old trg_update_facility_load lock
+    both      run hot-row then ledger
+
+Needs max_connections above --concurrency.
+
+Usage:
+    python scripts/seed_dataset.py
+    python scripts/bench_facility_load.py --concurrency 200 --hold-ms 50
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import statistics
+import psycopg2
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(ROOT, '.env'))
+
+from db import DB_CONFIG
+
+HOT_ROW_SQL = "UPDATE recycling_facilities SET current_load_kg = current_load_kg WHERE facility_id = %s"
+
+
+def pick_deliveries(cfg, n):
+    """The facility with the most picked_up pickups, and n of them with their drivers."""
+    conn = psycopg2.connect(**cfg)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT assigned_facility_id FROM pickup_requests
+                WHERE status = 'picked_up' AND collector_confirmed AND assigned_facility_id IS NOT NULL
+                GROUP BY assigned_facility_id ORDER BY COUNT(*) DESC LIMIT 1""")
+            row = cur.fetchone()
+            if not row:
+                return None, []
+            cur.execute("""
+                SELECT pickup_id, driver_id FROM pickup_requests
+                WHERE status = 'picked_up' AND collector_confirmed AND assigned_facility_id = %s
+                ORDER BY pickup_id LIMIT %s""", (row[0], n))
+            return row[0], cur.fetchall()
+    finally:
+        conn.close()
+
+def deliver(cfg, barrier, facility_id, pickup_id, driver_id, mode, hold, commit):
+    conn = psycopg2.connect(**cfg)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT set_config('app.current_user', 'bench', FALSE)")
+            conn.commit()
+            barrier.wait()
+            started = time.perf_counter()
+            cur.execute("CALL deliver_pickup(%s, %s, NULL)", (pickup_id, driver_id))
+            if mode == 'hot-row':
+                cur.execute(HOT_ROW_SQL, (facility_id,))
+            if hold:
+                cur.execute("SELECT pg_sleep(%s)", (hold,))
+            conn.commit() if commit else conn.rollback()
+            return time.perf_counter() - started, None
+    except psycopg2.Error as e:
+        conn.rollback()
+        return None, str(e).strip().splitlines()[0]
+    finally:
+        conn.close()
+
+def run(cfg, mode, facility_id, deliveries, hold, commit):
+    barrier = threading.Barrier(len(deliveries))
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(deliveries)) as pool:
+        futures = [pool.submit(deliver, cfg, barrier, facility_id, pid, did, mode, hold, commit)
+                   for pid, did in deliveries]
+        results = [f.result() for f in futures]
+    wall = time.perf_counter() - started
+    latencies = sorted(r[0] * 1000 for r in results if r[0] is not None)
+    errors = [r[1] for r in results if r[1]]
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f'{mode:<8} {len(latencies):>4} ok {len(errors):>3} err  wall {wall:6.2f}s  '
+              f'p50 {statistics.median(latencies):8.1f}ms  p95 {p95:8.1f}ms  max {latencies[-1]:8.1f}ms')
+    for e in sorted(set(errors))[:3]:
+        print(f'         error: {e}')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent deliveries to one facility.')
+    parser.add_argument('--dbname', default=os.environ.get('PLAN_DB_NAME', 'ewaste_plan'))
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--hold-ms', type=float, default=50)
+    parser.add_argument('--mode', choices=('ledger', 'hot-row', 'both'), default='both')
+    parser.add_argument('--commit', action='store_true', help='keep the deliveries (single run only)')
+    args = parser.parse_args(argv)
+
+    cfg = dict(DB_CONFIG, dbname=args.dbname)
+    facility_id, deliveries = pick_deliveries(cfg, args.concurrency)
+    if not deliveries:
+        print('[bench] no picked_up pickups to deliver; run scripts/seed_dataset.py first')
+        return 1
+    print(f'{len(deliveries)} parallel deliveries to facility {facility_id}, '
+          f'{args.hold_ms:.0f}ms held per transaction\n')
+    modes = ('hot-row', 'ledger') if args.mode == 'both' else (args.mode,)
+    for mode in modes:
+        run(cfg, mode, facility_id, deliveries, args.hold_ms / 1000, args.commit and len(modes) == 1)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
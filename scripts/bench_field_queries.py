@@ -0,0 +1,106 @@
+"""
+scripts/bench_field_queries.py — Field-staff page queries: OR scans vs pickup_assignments
+
+Compares the old driver_id OR collector_id queries on v_pickup_full with the
+pickup_assignments range scans now used by field_dashboard, field_assignments
+and field_history, for a random sample of drivers and collectors.
+
+Usage (10k field staff, 5M pickups):
+    python scripts/seed_dataset.py --dbname ewaste_bench --set pickups=5000000 --set field_staff=5000
+    python scripts/bench_field_queries.py --dbname ewaste_bench --staff 200
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(ROOT, '.env'))
+
+from db import DB_CONFIG
+
+ACTIVE = {'collector': ('field_assigned',), 'driver': ('field_assigned', 'picked_up')}
+DONE   = {'collector': ('picked_up', 'collected', 'completed'),
+          'driver':    ('delivered', 'collected', 'completed')}
+
+# (page, old query, new query); old queries take (sid, sid, statuses), new take (sid,)
+QUERIES = [
+    ('dashboard stats', """
+        SELECT COUNT(*) FILTER (WHERE status = ANY(%(active)s)) AS pending_count,
+               COUNT(*) FILTER (WHERE status = ANY(%(done)s))   AS done_count,
+               COALESCE(SUM(total_weight_kg) FILTER (WHERE status = ANY(%(done)s)), 0)
+        FROM v_pickup_full WHERE driver_id=%(sid)s OR collector_id=%(sid)s""", """
+        SELECT COUNT(*) FILTER (WHERE phase='active') AS pending_count,
+               COUNT(*) FILTER (WHERE phase='done')   AS done_count,
+               COALESCE(SUM(total_weight_kg) FILTER (WHERE phase='done'), 0)
+        FROM pickup_assignments WHERE staff_id=%(sid)s AND phase IN ('active','done')"""),
+    ('assignments', """
+        SELECT * FROM v_pickup_full
+        WHERE (driver_id=%(sid)s OR collector_id=%(sid)s) AND status = ANY(%(active)s)
+        ORDER BY scheduled_time ASC""", """
+        SELECT v.* FROM pickup_assignments a
+        JOIN v_pickup_full v ON v.pickup_id = a.pickup_id
+        WHERE a.staff_id=%(sid)s AND a.phase='active'
+        ORDER BY a.scheduled_time ASC"""),
+    ('history', """
+        SELECT * FROM v_pickup_history
+        WHERE (driver_id=%(sid)s OR collector_id=%(sid)s) AND status = ANY(%(done)s)
+        ORDER BY collected_at DESC LIMIT 100""", """
+        SELECT v.* FROM pickup_assignments a
+        JOIN v_pickup_history v ON v.pickup_id = a.pickup_id
+        WHERE a.staff_id=%(sid)s AND a.phase='done'
+        ORDER BY a.collected_at DESC LIMIT 100"""),
+]
+
+
+def measure(cur, sql, params):
+    cur.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql, params)
+    doc = cur.fetchone()[0]
+    result = (json.loads(doc) if isinstance(doc, str) else doc)[0]
+    plan = result['Plan']
+    return result['Execution Time'], plan.get('Shared Hit Blocks', 0) + plan.get('Shared Read Blocks', 0)
+
+def summary(samples):
+    ms = sorted(s[0] for s in samples)
+    p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+    return statistics.median(ms), p95, statistics.mean(s[1] for s in samples)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark field-staff page queries.')
+    parser.add_argument('--dbname', default=os.environ.get('BENCH_DB_NAME', 'ewaste_bench'))
+    parser.add_argument('--staff', type=int, default=200, help='random field staff to sample')
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(**dict(DB_CONFIG, dbname=args.dbname))
+    conn.set_session(readonly=True)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM pickup_requests")
+            pickups = cur.fetchone()[0]
+            cur.execute("""SELECT staff_id, sub_role FROM staff
+                           WHERE sub_role IN ('driver','collector') ORDER BY random() LIMIT %s""",
+                        (args.staff,))
+            staff = cur.fetchall()
+            print(f'{pickups:,} pickups, {len(staff)} sampled field staff\n')
+            print(f"{'page':<16} {'query':<5} {'median ms':>10} {'p95 ms':>9} {'buffers':>9}")
+            for page, old_sql, new_sql in QUERIES:
+                old, new = [], []
+                for sid, role in staff:
+                    params = {'sid': sid, 'active': list(ACTIVE[role]), 'done': list(DONE[role])}
+                    measure(cur, old_sql, params); old.append(measure(cur, old_sql, params))
+                    measure(cur, new_sql, params); new.append(measure(cur, new_sql, params))
+                for label, samples in (('old', old), ('new', new)):
+                    med, p95, buf = summary(samples)
+                    print(f'{page:<16} {label:<5} {med:>10.2f} {p95:>9.2f} {buf:>9,.0f}')
+    finally:
+        conn.rollback()
+        conn.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+scripts/bench_login.py — Login storm: N simultaneous sign-ins
+
+Fires --concurrency login POSTs at once (each on its own connection), for
+--rounds rounds, and reports logins/s, p50/p95/max latency and the status
+mix: 302 = signed in, 503 = password workers saturated (see passwords.py),
+anything else = failure. Compare a server started with PASSWORD_WORKERS=0
+(inline hashing, the old behaviour) against the default process pool, and
+read /api/passwords for queue wait and per-hash run time.
+Uses a minimal asyncio HTTP/1.1 client, so it needs nothing beyond the stdlib.
+
+Usage:
+    PASSWORD_WORKERS=0 python app.py          # or gunicorn -w 4 app:app
+    python scripts/bench_login.py --url http://localhost:5000 --concurrency 500
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+import urllib.parse
+
+
+async def login(host, port, netloc, body, start):
+    await start.wait()
+    started = time.monotonic()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), 30)
+        writer.write((f'POST /login HTTP/1.1\r\nHost: {netloc}\r\n'
+                      f'Content-Type: application/x-www-form-urlencoded\r\n'
+                      f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n').encode() + body)
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), 120)
+        await reader.read()
+        writer.close()
+        return int(status_line.split(b' ', 2)[1]), time.monotonic() - started
+    except (OSError, asyncio.TimeoutError, ValueError, IndexError) as e:
+        return type(e).__name__, time.monotonic() - started
+
+async def storm(base, username, password, n):
+    url  = urllib.parse.urlsplit(base)
+    body = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+    start = asyncio.Event()
+    tasks = [asyncio.create_task(login(url.hostname, url.port or 80, url.netloc, body, start))
+             for _ in range(n)]
+    await asyncio.sleep(0)
+    started = time.monotonic()
+    start.set()
+    results = await asyncio.gather(*tasks)
+    return results, time.monotonic() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent login benchmark.')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='password123')
+    args = parser.parse_args(argv)
+
+    print(f"{'round':>5} {'wall s':>7} {'logins/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}  status")
+    for r in range(1, args.rounds + 1):
+        results, wall = asyncio.run(storm(args.url.rstrip('/'), args.username, args.password, args.concurrency))
+        ok = sorted(t * 1000 for status, t in results if status == 302)
+        counts = {}
+        for status, _ in results:
+            counts[status] = counts.get(status, 0) + 1
+        mix = ', '.join(f'{k}: {v}' for k, v in sorted(counts.items(), key=str))
+        if ok:
+            p95 = ok[min(len(ok) - 1, int(len(ok) * 0.95))]
+            print(f'{r:>5} {wall:>7.2f} {len(ok) / wall:>9.1f} {statistics.median(ok):>8.0f} '
+                  f'{p95:>8.0f} {ok[-1]:>8.0f}  {mix}')
+        else:
+            print(f'{r:>5} {wall:>7.2f} {0:>9.1f} {"-":>8} {"-":>8} {"-":>8}  {mix}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
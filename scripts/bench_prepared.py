@@ -0,0 +1,83 @@
+"""
+scripts/bench_prepared.py — Planning time saved by db.py's prepared statement cache
+
+Runs v_pickup_full lookups (by pickup_id, by supervisor) as plain text queries
+and through db._execute (PREPARE once, then EXECUTE) on one connection, and
+reports wall time per query plus the server's Planning Time from EXPLAIN ANALYZE.
+
+Usage:
+    python scripts/seed_dataset.py                      # once
+    python scripts/bench_prepared.py --iterations 2000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(ROOT, '.env'))
+
+import db
+
+QUERIES = [
+    ('pickup by id',     "SELECT * FROM v_pickup_full WHERE pickup_id=%s", 'pickup_id'),
+    ('supervisor queue', "SELECT * FROM v_pickup_full WHERE supervisor_id=%s AND status='supervisor_assigned' "
+                         "ORDER BY preferred_date ASC", 'supervisor_id'),
+]
+
+
+def planning_ms(cur, sql, params):
+    cur.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql, params)
+    doc = cur.fetchone()[0]
+    return (json.loads(doc) if isinstance(doc, str) else doc)[0]['Planning Time']
+
+def run(cur, execute, sql, ids, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        execute(cur, sql, (random.choice(ids),))
+        cur.fetchall()
+    return (time.perf_counter() - started) * 1000 / iterations
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark prepared vs text v_pickup_full queries.')
+    parser.add_argument('--dbname', default=os.environ.get('PLAN_DB_NAME', 'ewaste_plan'))
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(connection_factory=db.PreparingConnection,
+                            **dict(db.DB_CONFIG, dbname=args.dbname))
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pickup_id FROM pickup_requests ORDER BY random() LIMIT 1000")
+            samples = {'pickup_id': [r[0] for r in cur.fetchall()]}
+            cur.execute("SELECT DISTINCT supervisor_id FROM pickup_requests WHERE supervisor_id IS NOT NULL")
+            samples['supervisor_id'] = [r[0] for r in cur.fetchall()]
+
+            print(f"{'query':<18} {'mode':<9} {'ms/query':>9} {'planning ms':>12}")
+            for label, sql, key in QUERIES:
+                ids = samples[key]
+                text_ms = run(cur, lambda c, s, p: c.execute(s, p), sql, ids, args.iterations)
+                text_plan = statistics.mean(planning_ms(cur, sql, (random.choice(ids),)) for _ in range(50))
+
+                prep_ms = run(cur, db._execute, sql, ids, args.iterations)
+                name, _ = conn.prepared[sql]
+                prep_plan = statistics.mean(planning_ms(cur, f'EXECUTE {name} (%s)', (random.choice(ids),))
+                                            for _ in range(50))
+
+                print(f'{label:<18} {"text":<9} {text_ms:>9.3f} {text_plan:>12.3f}')
+                print(f'{label:<18} {"prepared":<9} {prep_ms:>9.3f} {prep_plan:>12.3f}')
+                conn.rollback()
+        print(f'\nprepared-statement counters: {db.db_metrics()["prepared"]}')
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+scripts/bench_triggers.py — Per-trigger cost of typical pickup/item UPDATEs
+
+Runs each workload below as single-row UPDATEs under EXPLAIN (ANALYZE, FORMAT
+JSON), which reports time and calls for every trigger the statement fired
+(including FK checks), and prints the average cost per UPDATE of each trigger.
+Everything runs in one transaction that is rolled back, so the dataset is
+left as it was. Run it before and after `python migrate.py up` to compare
+trigger sets.
+
+Usage:
+    python scripts/seed_dataset.py                      # once
+    python scripts/bench_triggers.py --rows 500
+    python scripts/bench_triggers.py --only request_count --only item_weight
+"""
+import os
+import sys
+import json
+import argparse
+import psycopg2
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(ROOT, '.env'))
+
+from db import DB_CONFIG
+
+# name -> (sample query returning parameter rows, UPDATE run once per row)
+WORKLOADS = {
+    'request_count': (
+        "SELECT pickup_id FROM pickup_requests WHERE status = 'collected' ORDER BY random() LIMIT %s",
+        "UPDATE pickup_requests SET payment_request_count = payment_request_count + 1 WHERE pickup_id = %s"),
+    'noop_notes': (
+        "SELECT pickup_id FROM pickup_requests ORDER BY random() LIMIT %s",
+        "UPDATE pickup_requests SET notes = notes WHERE pickup_id = %s"),
+    'edit_notes': (
+        "SELECT pickup_id FROM pickup_requests ORDER BY random() LIMIT %s",
+        "UPDATE pickup_requests SET notes = md5(random()::text) WHERE pickup_id = %s"),
+    'reassign_driver': (
+        """SELECT d.staff_id, p.pickup_id
+           FROM (SELECT pickup_id, driver_id FROM pickup_requests
+                 WHERE status = 'field_assigned' ORDER BY random() LIMIT %s) p
+           CROSS JOIN LATERAL (SELECT staff_id FROM staff
+                               WHERE sub_role = 'driver' AND staff_id <> p.driver_id LIMIT 1) d""",
+        "UPDATE pickup_requests SET driver_id = %s WHERE pickup_id = %s"),
+    'complete': (
+        "SELECT pickup_id FROM pickup_requests WHERE status = 'collected' ORDER BY random() LIMIT %s",
+        "UPDATE pickup_requests SET status = 'completed', completed_time = NOW() WHERE pickup_id = %s"),
+    'item_weight': (
+        "SELECT item_id FROM items WHERE actual_weight_kg IS NOT NULL ORDER BY random() LIMIT %s",
+        "UPDATE items SET actual_weight_kg = actual_weight_kg + 0.1 WHERE item_id = %s"),
+    'item_weight_noop': (
+        "SELECT item_id FROM items WHERE actual_weight_kg IS NOT NULL ORDER BY random() LIMIT %s",
+        "UPDATE items SET actual_weight_kg = actual_weight_kg WHERE item_id = %s"),
+}
+
+
+def run(cur, sample_sql, update_sql, rows):
+    cur.execute(sample_sql, (rows,))
+    params = cur.fetchall()
+    per_trigger = defaultdict(lambda: [0.0, 0])      # name -> [ms, calls]
+    total_ms = 0.0
+    for p in params:
+        cur.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + update_sql, p)
+        doc  = cur.fetchone()[0]
+        plan = (json.loads(doc) if isinstance(doc, str) else doc)[0]
+        total_ms += plan['Execution Time']
+        for t in plan.get('Triggers', []):
+            entry = per_trigger[t['Trigger Name']]
+            entry[0] += t['Time']
+            entry[1] += t['Calls']
+    return len(params), total_ms, per_trigger
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure trigger overhead per UPDATE.')
+    parser.add_argument('--dbname', default=os.environ.get('PLAN_DB_NAME', 'ewaste_plan'))
+    parser.add_argument('--rows', type=int, default=200, help='UPDATEs per workload')
+    parser.add_argument('--only', action='append', choices=sorted(WORKLOADS))
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(**dict(DB_CONFIG, dbname=args.dbname))
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT set_config('app.current_user', 'bench', TRUE)")
+            for name in args.only or WORKLOADS:
+                sample_sql, update_sql = WORKLOADS[name]
+                cur.execute('SAVEPOINT workload')
+                n, total_ms, per_trigger = run(cur, sample_sql, update_sql, args.rows)
+                cur.execute('ROLLBACK TO SAVEPOINT workload')
+                if not n:
+                    print(f'{name}: no sample rows\n')
+                    continue
+                trig_ms = sum(ms for ms, _ in per_trigger.values())
+                print(f'{name}  ({n} updates)  {total_ms / n:.3f} ms/update, '
+                      f'{trig_ms / n:.3f} ms in triggers')
+                for trig, (ms, calls) in sorted(per_trigger.items(), key=lambda kv: -kv[1][0]):
+                    print(f'    {trig:<40} {ms / n:>8.3f} ms  {calls / n:>5.2f} calls/update')
+                print()
+    finally:
+        conn.rollback()
+        conn.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
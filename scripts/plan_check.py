@@ -0,0 +1,231 @@
+"""
+scripts/plan_check.py — Query-plan regression checks for the app's hot statements
+
+Runs EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) for every statement in CATALOG
+(the SQL app.py runs, from queries.py, with parameters taken from the data) against a database
+loaded by scripts/seed_dataset.py. A check fails when its plan seq-scans a
+table it must reach through an index, or exceeds its estimated-cost or
+shared-buffer budget. Exit code 1 on any failure, so run it before deploy.
+
+Budgets are tuned for seed_dataset.py --scale 1. After an intentional change
+re-read the numbers with --show and adjust the budget in the same commit.
+
+Usage:
+    python scripts/plan_check.py                     # all checks, ewaste_plan
+    python scripts/plan_check.py --only user_         # checks whose name starts with user_
+    python scripts/plan_check.py --show               # also print each plan tree
+"""
+import os
+import sys
+import json
+import argparse
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(ROOT, '.env'))
+
+from db import DB_CONFIG
+import queries
+
+DEFAULT_DBNAME = os.environ.get('PLAN_DB_NAME', 'ewaste_plan')
+
+# Large tables: a seq scan on one of these in a per-entity page is a regression.
+HOT = ('pickup_requests', 'items', 'weight_records', 'payments', 'payment_requests',
+       'pickup_requests_archive', 'items_archive', 'payments_archive',
+       'batch_items', 'audit_log', 'accounts', 'users', 'pickup_assignments', 'admin_alerts')
+
+# Parameter values picked from the data: the busiest user / staff, newest rows.
+SAMPLES = [
+    "SELECT user_id FROM pickup_requests GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1",
+    "SELECT pickup_id, user_id AS pickup_user_id FROM pickup_requests ORDER BY pickup_id DESC LIMIT 1",
+    """SELECT pickup_id AS archived_pickup_id, user_id AS archived_user_id
+       FROM pickup_requests_archive ORDER BY pickup_id DESC LIMIT 1""",
+    """SELECT supervisor_id FROM pickup_requests WHERE supervisor_id IS NOT NULL
+       GROUP BY supervisor_id ORDER BY COUNT(*) DESC LIMIT 1""",
+    """SELECT driver_id FROM pickup_requests WHERE driver_id IS NOT NULL
+       GROUP BY driver_id ORDER BY COUNT(*) DESC LIMIT 1""",
+    "SELECT username FROM accounts ORDER BY account_id DESC LIMIT 1",
+    "SELECT split_part(full_name, ' ', 3) AS search_term FROM users ORDER BY user_id DESC LIMIT 1",
+    "SELECT account_id AS admin_account_id FROM accounts WHERE role = 'admin' ORDER BY account_id LIMIT 1",
+    """SELECT alert_type, related_table AS alert_table, related_id AS alert_related_id
+       FROM admin_alerts WHERE is_resolved = FALSE AND related_id IS NOT NULL
+       ORDER BY alert_id DESC LIMIT 1""",
+]
+
+
+def check(name, sql, params=(), seq_ok=(), max_cost=None, max_buffers=None, writes=False):
+    """params are SAMPLES column names; seq_ok lists HOT tables allowed to be seq-scanned.
+    writes=True for an UPDATE: it really runs under EXPLAIN ANALYZE and is rolled back."""
+    return {'name': name, 'sql': sql, 'params': params, 'writes': writes,
+            'no_seq_scan': tuple(t for t in HOT if t not in seq_ok),
+            'max_cost': max_cost, 'max_buffers': max_buffers}
+
+CATALOG = [
+    # ── login / user pages ────────────────────────────────
+    check('login', queries.LOGIN,
+          ('username',), max_cost=50, max_buffers=20),
+    check('user_dashboard_stats', queries.USER_STATS,
+          ('user_id',), max_cost=2_000, max_buffers=2_000),
+    check('user_recent', queries.USER_RECENT,
+          ('user_id',), max_cost=5_000, max_buffers=2_000),
+    check('user_pickups', queries.USER_PICKUPS,
+          ('user_id',), max_cost=40_000, max_buffers=20_000),
+    check('user_pickup_detail', queries.USER_PICKUP,
+          ('pickup_id', 'pickup_user_id'), max_cost=200, max_buffers=100),
+    check('user_archived_pickup_detail', queries.USER_PICKUP,
+          ('archived_pickup_id', 'archived_user_id'), max_cost=200, max_buffers=100),
+    check('user_pickup_items', queries.PICKUP_ITEMS,
+          ('pickup_id',), max_cost=200, max_buffers=100),
+    check('user_history', queries.USER_HISTORY,
+          ('user_id',), max_cost=40_000, max_buffers=20_000),
+    check('user_payments', queries.USER_PAYMENTS,
+          ('user_id',), max_cost=40_000, max_buffers=20_000),
+
+    # ── field staff ───────────────────────────────────────
+    check('field_dashboard_stats', queries.FIELD_STATS,
+          ('driver_id',), max_cost=2_000, max_buffers=1_000),
+    check('field_open_assignments', queries.FIELD_OPEN,
+          ('driver_id',), max_cost=1_000, max_buffers=500),
+    check('field_history', queries.FIELD_HISTORY,
+          ('driver_id',), max_cost=10_000, max_buffers=5_000),
+
+    # ── supervisor ────────────────────────────────────────
+    check('sup_stats', "SELECT * FROM get_supervisor_stats(%s)",        # db.call_func's form
+          ('supervisor_id',), max_buffers=60_000),
+    check('sup_needs_assignment', queries.SUP_NEEDS_ASSIGNMENT,
+          ('supervisor_id',), max_cost=20_000, max_buffers=10_000),
+    check('sup_in_progress', queries.SUP_IN_PROGRESS,
+          ('supervisor_id',), max_cost=20_000, max_buffers=10_000),
+    check('sup_collected', queries.SUP_COLLECTED,
+          ('supervisor_id',), max_cost=20_000, max_buffers=10_000),
+    check('sup_pay_requests', queries.SUP_PAY_REQUESTS,
+          ('supervisor_id',), max_cost=20_000, max_buffers=10_000),
+    check('sup_history', queries.SUP_HISTORY,
+          ('supervisor_id',), max_cost=60_000, max_buffers=30_000),
+
+    # ── admin (filters appended the way the routes append them) ──
+    check('admin_recent_pickups', queries.ADMIN_RECENT_PICKUPS,
+          max_cost=200, max_buffers=200),
+    check('admin_alerts_active', queries.ADMIN_ALERTS_ACTIVE,
+          max_cost=2_000, max_buffers=500),
+    check('admin_alerts_page', queries.ALERTS + " AND is_resolved=FALSE" + queries.ALERTS_ORDER,
+          ('page_limit', 'page_offset'), max_cost=2_000, max_buffers=500),
+    check('admin_alerts_resolve_target',
+          queries.RESOLVE_ALERTS + " AND alert_type = %s AND related_table = %s AND related_id = %s",
+          ('admin_account_id', 'alert_type', 'alert_table', 'alert_related_id'),
+          max_cost=100, max_buffers=100, writes=True),
+    check('admin_overdue', queries.ADMIN_OVERDUE,
+          max_cost=20_000, max_buffers=20_000),
+    check('admin_pending_pickups', queries.ADMIN_PICKUPS + " AND status=%s" + queries.ADMIN_PICKUPS_ORDER,
+          ('pending_status',), max_cost=60_000, max_buffers=60_000),
+    check('admin_history', queries.ADMIN_HISTORY,
+          max_cost=5_000, max_buffers=5_000),
+    check('admin_logs', queries.AUDIT_LOG + queries.AUDIT_LOG_ORDER,
+          ('log_limit', 'page_offset'), max_cost=100, max_buffers=100),
+    check('admin_search', "SELECT * FROM search_pickups(%s, 26, 0)",
+          ('search_term',), max_buffers=20_000),
+
+    # ── SQL report functions (no page calls them yet) ─────
+    check('revenue_by_period', "SELECT * FROM get_revenue_by_period(12)",
+          max_buffers=5_000),
+    check('hazard_by_supervisor', "SELECT * FROM get_hazardous_items_by_supervisor()",
+          max_buffers=5_000),
+
+    # ── full-table reports: budgets only ──────────────────
+    check('report_supervisor_team', queries.REPORT_SUPERVISORS,
+          seq_ok=HOT, max_cost=400_000),
+    check('report_category_stats', queries.REPORT_CATEGORIES,
+          seq_ok=HOT, max_cost=200_000),
+    check('report_top_users', queries.REPORT_TOP_USERS,
+          seq_ok=HOT, max_cost=400_000),
+]
+
+# Constants the routes pass: one page of alerts (100 + 1) and of audit log (50).
+FIXED = {'pending_status': 'pending', 'page_limit': 101, 'log_limit': 50, 'page_offset': 0}
+
+
+def load_samples(cur):
+    values = dict(FIXED)
+    for sql in SAMPLES:
+        cur.execute(sql)
+        row = cur.fetchone()
+        if row:
+            values.update(zip([d[0] for d in cur.description], row))
+    return values
+
+def walk(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from walk(child)
+
+def explain(cur, sql, params):
+    cur.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql, params)
+    doc = cur.fetchone()[0]
+    return (json.loads(doc) if isinstance(doc, str) else doc)[0]
+
+def evaluate(c, result):
+    plan = result['Plan']
+    problems = []
+    for node in walk(plan):
+        if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in c['no_seq_scan']:
+            problems.append(f"Seq Scan on {node['Relation Name']}")
+    cost    = plan['Total Cost']
+    buffers = plan.get('Shared Hit Blocks', 0) + plan.get('Shared Read Blocks', 0)
+    if c['max_cost'] is not None and cost > c['max_cost']:
+        problems.append(f"cost {cost:,.0f} > {c['max_cost']:,}")
+    if c['max_buffers'] is not None and buffers > c['max_buffers']:
+        problems.append(f"buffers {buffers:,} > {c['max_buffers']:,}")
+    return cost, buffers, result.get('Execution Time', 0), problems
+
+def print_plan(node, depth=0):
+    rel = f" on {node['Relation Name']}" if 'Relation Name' in node else ''
+    idx = f" using {node['Index Name']}" if 'Index Name' in node else ''
+    print(f"      {'  ' * depth}-> {node['Node Type']}{rel}{idx}"
+          f"  (cost={node['Total Cost']:.0f} rows={node.get('Actual Rows', '?')})")
+    for child in node.get('Plans', []):
+        print_plan(child, depth + 1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Assert on query plans of hot statements.')
+    parser.add_argument('--dbname', default=DEFAULT_DBNAME)
+    parser.add_argument('--only', default='', help='run checks whose name starts with this')
+    parser.add_argument('--show', action='store_true', help='print plan trees')
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(**dict(DB_CONFIG, dbname=args.dbname))
+    failed = skipped = 0
+    try:
+        with conn.cursor() as cur:
+            samples = load_samples(cur)
+            conn.rollback()
+            print(f"{'check':<30} {'cost':>10} {'buffers':>9} {'ms':>8}  result")
+            for c in CATALOG:
+                if not c['name'].startswith(args.only):
+                    continue
+                params = [samples.get(p) for p in c['params']]
+                if any(p is None for p in params):
+                    print(f"{c['name']:<30} {'':>10} {'':>9} {'':>8}  skipped (no sample data)")
+                    skipped += 1
+                    continue
+                if not c['writes']:
+                    cur.execute('SET TRANSACTION READ ONLY')
+                explain(cur, c['sql'], params)           # warm the cache
+                result = explain(cur, c['sql'], params)
+                conn.rollback()                          # undo a writes=True check
+                cost, buffers, ms, problems = evaluate(c, result)
+                status = 'FAIL: ' + '; '.join(problems) if problems else 'ok'
+                print(f"{c['name']:<30} {cost:>10,.0f} {buffers:>9,} {ms:>8.1f}  {status}")
+                if args.show or problems:
+                    print_plan(result['Plan'])
+                failed += bool(problems)
+    finally:
+        conn.rollback()
+        conn.close()
+    print(f'{failed} failed, {skipped} skipped')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,406 @@
+"""
+scripts/seed_dataset.py — Load a large generated dataset for plan / load testing
+
+Creates the target database if needed, applies migrations and the demo
+data (migrate.py seed), then generates
+users, staff, pickups, items, weights, payments, batches and alerts with
+generate_series (no per-row round trips). Triggers and FK checks are off
+while loading (session_replication_role = replica, needs superuser); the
+daily fact tables are rebuilt afterwards and old pickups are archived so
+both sides of the history views hold data.
+
+Usage:
+    python scripts/seed_dataset.py                    # ewaste_plan, scale 1 (300k pickups)
+    python scripts/seed_dataset.py --scale 0.1        # quick
+    python scripts/seed_dataset.py --dbname other --reseed
+    python scripts/seed_dataset.py --dbname ewaste_bench --set pickups=5000000 --set field_staff=5000
+"""
+import os
+import sys
+import time
+import argparse
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(ROOT, '.env'))
+
+from db import DB_CONFIG
+import migrate
+
+DEFAULT_DBNAME = os.environ.get('PLAN_DB_NAME', 'ewaste_plan')
+
+# Row counts at --scale 1
+BASE = {
+    'users':       50_000,
+    'supervisors': 40,
+    'field_staff': 400,       # drivers, and as many collectors
+    'pickups':     300_000,   # ~2.5 items each
+    'alerts':      5_000,
+}
+
+STEPS = [
+    ('users', """
+        INSERT INTO users (full_name, email, phone, address, city, registered_at)
+        SELECT 'Seed User ' || g,
+               'seed.user' || g || '@example.test',
+               '+8801' || lpad(g::TEXT, 9, '0'),
+               (g %% 400) || ' ' || (ARRAY['Lake','Park','Station','Market','College','River'])[1 + g %% 6] || ' Road',
+               (ARRAY['Dhaka','Chattogram','Khulna','Rajshahi','Sylhet','Barishal'])[1 + g %% 6],
+               NOW() - (g %% 1460) * INTERVAL '1 day'
+        FROM generate_series(1, %(users)s) g;
+
+        INSERT INTO accounts (username, password_hash, role, user_id, display_name)
+        SELECT 'seed.user' || u.user_id, 'seed-no-login', 'user', u.user_id, u.full_name
+        FROM users u WHERE u.email LIKE 'seed.user%%@example.test';
+    """),
+    ('staff', """
+        INSERT INTO staff (full_name, sub_role, contact_number)
+        SELECT 'Seed Supervisor ' || g, 'supervisor', '+8802' || lpad(g::TEXT, 9, '0')
+        FROM generate_series(1, %(supervisors)s) g;
+
+        CREATE TEMP TABLE seed_sup AS
+        SELECT (row_number() OVER (ORDER BY staff_id) - 1)::INT AS n, staff_id
+        FROM staff WHERE full_name LIKE 'Seed Supervisor %%';
+
+        INSERT INTO staff (full_name, sub_role, contact_number, supervisor_id)
+        SELECT 'Seed ' || r.role || ' ' || g, r.role, r.prefix || lpad(g::TEXT, 9, '0'), s.staff_id
+        FROM generate_series(1, %(field_staff)s) g
+        CROSS JOIN (VALUES ('driver', '+8803'), ('collector', '+8804')) AS r(role, prefix)
+        JOIN seed_sup s ON s.n = g %% %(supervisors)s;
+
+        INSERT INTO vehicles (vehicle_number, vehicle_type, capacity_kg, supervisor_id)
+        SELECT 'SEED-' || g, (ARRAY['van','truck','pickup'])[1 + g %% 3], 1000 + (g %% 4) * 500, s.staff_id
+        FROM generate_series(1, %(field_staff)s) g
+        JOIN seed_sup s ON s.n = g %% %(supervisors)s;
+
+        INSERT INTO accounts (username, password_hash, role, staff_id, display_name)
+        SELECT 'seed.staff' || st.staff_id, 'seed-no-login', 'staff', st.staff_id, st.full_name
+        FROM staff st WHERE st.full_name LIKE 'Seed %%';
+
+        -- One (supervisor, driver, collector, vehicle) crew per driver
+        CREATE TEMP TABLE seed_team AS
+        SELECT (row_number() OVER (ORDER BY d.staff_id) - 1)::INT AS n,
+               d.supervisor_id, d.staff_id AS driver_id, c.staff_id AS collector_id, v.vehicle_id
+        FROM (SELECT staff_id, supervisor_id,
+                     row_number() OVER (PARTITION BY supervisor_id ORDER BY staff_id) AS k
+              FROM staff WHERE sub_role = 'driver' AND full_name LIKE 'Seed %%') d
+        JOIN (SELECT staff_id, supervisor_id,
+                     row_number() OVER (PARTITION BY supervisor_id ORDER BY staff_id) AS k
+              FROM staff WHERE sub_role = 'collector' AND full_name LIKE 'Seed %%') c
+             ON c.supervisor_id = d.supervisor_id AND c.k = d.k
+        JOIN (SELECT vehicle_id, supervisor_id,
+                     row_number() OVER (PARTITION BY supervisor_id ORDER BY vehicle_id) AS k
+              FROM vehicles WHERE vehicle_number LIKE 'SEED-%%') v
+             ON v.supervisor_id = d.supervisor_id AND v.k = d.k;
+
+        CREATE TEMP TABLE seed_fac AS
+        SELECT (row_number() OVER (ORDER BY facility_id) - 1)::INT AS n, facility_id
+        FROM recycling_facilities;
+
+        CREATE TEMP TABLE seed_cat AS
+        SELECT (row_number() OVER (ORDER BY category_id) - 1)::INT AS n, category_id, base_price_per_kg
+        FROM categories;
+    """),
+    ('pickups', """
+        SELECT setseed(0.31);
+
+        -- stage: 0 pending/cancelled, 1 supervisor_assigned, 2 field_assigned,
+        --        3 picked_up, 4 delivered, 5 collected, 6 completed.
+        -- Open work is recent; finished work is spread over three years.
+        -- User ids are skewed (power 1.5) so some users have hundreds of pickups.
+        INSERT INTO pickup_requests (
+            user_id, request_date, preferred_date, pickup_address, status,
+            supervisor_id, driver_id, collector_id, assigned_vehicle_id, assigned_facility_id,
+            scheduled_time, collected_at, collector_confirmed, collector_confirmed_at,
+            driver_confirmed, driver_confirmed_at, completed_time, payment_due_by,
+            created_at, updated_at)
+        SELECT x.user_id, x.req, x.req::DATE + 2, x.addr, x.status,
+               CASE WHEN x.stage >= 1 THEN t.supervisor_id END,
+               CASE WHEN x.stage >= 2 THEN t.driver_id END,
+               CASE WHEN x.stage >= 2 THEN t.collector_id END,
+               CASE WHEN x.stage >= 2 THEN t.vehicle_id END,
+               CASE WHEN x.stage >= 2 THEN f.facility_id END,
+               CASE WHEN x.stage >= 2 THEN x.req + INTERVAL '2 days' END,
+               CASE WHEN x.stage >= 3 THEN x.req + INTERVAL '2 days 3 hours' END,
+               x.stage >= 3,
+               CASE WHEN x.stage >= 3 THEN x.req + INTERVAL '2 days 3 hours' END,
+               x.stage >= 4,
+               CASE WHEN x.stage >= 4 THEN x.req + INTERVAL '2 days 6 hours' END,
+               CASE WHEN x.stage = 6 THEN x.req + INTERVAL '4 days' END,
+               CASE WHEN x.stage >= 5 THEN x.req + INTERVAL '5 days 6 hours' END,
+               x.req, x.req + CASE WHEN x.stage = 6 THEN INTERVAL '4 days' ELSE INTERVAL '0' END
+        FROM (
+            SELECT s.g, s.user_id, s.status, s.stage, s.addr,
+                   CASE WHEN s.stage >= 6 OR s.status = 'cancelled'
+                        THEN NOW() - INTERVAL '7 days' - random() * INTERVAL '3 years'
+                        ELSE NOW() - random() * INTERVAL '14 days' END AS req
+            FROM (
+                SELECT g,
+                       u.first_id + floor(power(random(), 1.5) * %(users)s)::INT AS user_id,
+                       (g %% 400) || ' ' || (ARRAY['Lake','Park','Station','Market','College','River'])[1 + g %% 6] || ' Road' AS addr,
+                       CASE WHEN r < 0.70 THEN 'completed'  WHEN r < 0.75 THEN 'collected'
+                            WHEN r < 0.78 THEN 'delivered'  WHEN r < 0.81 THEN 'picked_up'
+                            WHEN r < 0.85 THEN 'field_assigned'
+                            WHEN r < 0.90 THEN 'supervisor_assigned'
+                            WHEN r < 0.95 THEN 'pending' ELSE 'cancelled' END AS status,
+                       CASE WHEN r < 0.70 THEN 6 WHEN r < 0.75 THEN 5 WHEN r < 0.78 THEN 4
+                            WHEN r < 0.81 THEN 3 WHEN r < 0.85 THEN 2 WHEN r < 0.90 THEN 1
+                            ELSE 0 END AS stage
+                FROM (SELECT g, random() AS r FROM generate_series(1, %(pickups)s) g) gs
+                CROSS JOIN (SELECT MIN(user_id) AS first_id FROM users
+                            WHERE email LIKE 'seed.user%%@example.test') u
+            ) s
+        ) x
+        JOIN seed_team t ON t.n = x.g %% %(field_staff)s
+        JOIN seed_fac  f ON f.n = x.g %% (SELECT COUNT(*) FROM seed_fac);
+
+        CREATE TEMP TABLE seed_pickups AS
+        SELECT pickup_id FROM pickup_requests p
+        JOIN users u ON u.user_id = p.user_id
+        WHERE u.email LIKE 'seed.user%%@example.test';
+    """),
+    ('items', """
+        INSERT INTO items (pickup_id, category_id, item_description, condition,
+                           estimated_weight_kg, actual_weight_kg, hazard_details, created_at)
+        SELECT p.pickup_id, c.category_id,
+               'Seed item ' || p.pickup_id || '-' || k,
+               (ARRAY['working','broken','repairable'])[1 + (p.pickup_id + k) %% 3],
+               w.est,
+               CASE WHEN p.status IN ('picked_up','delivered','collected','completed')
+                    THEN round(w.est * (0.9 + ((p.pickup_id + k) %% 20) / 100.0), 2) END,
+               CASE WHEN (p.pickup_id + k) %% 20 = 0 THEN '{"contains_mercury": true}'::JSONB
+                    WHEN (p.pickup_id + k) %% 5  = 0 THEN jsonb_build_object('battery_count', 1 + k %% 3)
+                    ELSE '{}'::JSONB END,
+               p.request_date
+        FROM pickup_requests p
+        JOIN seed_pickups sp ON sp.pickup_id = p.pickup_id
+        CROSS JOIN LATERAL generate_series(1, 1 + p.pickup_id %% 4) k
+        CROSS JOIN LATERAL (SELECT round((0.5 + ((p.pickup_id * 31 + k * 17) %% 200) / 10.0)::NUMERIC, 2) AS est) w
+        JOIN seed_cat c ON c.n = (p.pickup_id * 7 + k) %% (SELECT COUNT(*) FROM seed_cat);
+
+        INSERT INTO weight_records (item_id, weighing_stage, weight_kg, weighed_by, weighed_at)
+        SELECT i.item_id, 'pickup', i.actual_weight_kg, p.collector_id, p.collected_at
+        FROM items i
+        JOIN pickup_requests p ON p.pickup_id = i.pickup_id
+        JOIN seed_pickups sp   ON sp.pickup_id = p.pickup_id
+        WHERE i.actual_weight_kg IS NOT NULL;
+
+        UPDATE pickup_requests p
+        SET    total_weight_kg = t.weight,
+               total_amount    = CASE WHEN p.status IN ('collected','completed') THEN t.amount ELSE 0 END
+        FROM (
+            SELECT i.pickup_id,
+                   SUM(COALESCE(i.actual_weight_kg, 0)) AS weight,
+                   ROUND(SUM(COALESCE(i.actual_weight_kg, 0) * c.base_price_per_kg), 2) AS amount
+            FROM items i JOIN seed_cat c ON c.category_id = i.category_id
+            JOIN seed_pickups sp ON sp.pickup_id = i.pickup_id
+            GROUP BY i.pickup_id
+        ) t
+        WHERE p.pickup_id = t.pickup_id;
+    """),
+    ('assignments', """
+        INSERT INTO pickup_assignments (pickup_id, role, staff_id, status, scheduled_time,
+                                        collected_at, total_weight_kg)
+        SELECT p.pickup_id, c.role, c.staff_id, p.status, p.scheduled_time, p.collected_at, p.total_weight_kg
+        FROM pickup_requests p
+        JOIN seed_pickups sp ON sp.pickup_id = p.pickup_id
+        CROSS JOIN LATERAL (VALUES ('driver', p.driver_id), ('collector', p.collector_id)) AS c(role, staff_id)
+        WHERE c.staff_id IS NOT NULL;
+    """),
+    ('payments', """
+        INSERT INTO payments (pickup_id, amount, payment_method, payment_status,
+                              transaction_reference, processed_by, processed_at)
+        SELECT p.pickup_id, p.total_amount,
+               (ARRAY['bkash','nagad','cash','bank'])[1 + p.pickup_id %% 4],
+               'completed', 'SEED-' || p.pickup_id, p.supervisor_id, p.completed_time
+        FROM pickup_requests p JOIN seed_pickups sp ON sp.pickup_id = p.pickup_id
+        WHERE p.status = 'completed';
+
+        INSERT INTO payment_requests (pickup_id, user_id, supervisor_id, requested_at, status)
+        SELECT p.pickup_id, p.user_id, p.supervisor_id, p.payment_due_by + INTERVAL '1 hour',
+               CASE WHEN p.status = 'collected' THEN 'pending' ELSE 'resolved' END
+        FROM pickup_requests p JOIN seed_pickups sp ON sp.pickup_id = p.pickup_id
+        WHERE p.status IN ('collected','completed') AND p.pickup_id %% 10 = 0;
+    """),
+    ('batches', """
+        -- One completed batch per supervisor per month of completed pickups
+        INSERT INTO recycling_batches (facility_id, supervisor_id, batch_name, created_date,
+                                       processing_start_date, processing_end_date, status,
+                                       total_weight_kg, recovery_rate_percentage)
+        SELECT MIN(p.assigned_facility_id), p.supervisor_id,
+               'SEED ' || p.supervisor_id || ' ' || to_char(date_trunc('month', p.completed_time), 'YYYY-MM'),
+               date_trunc('month', p.completed_time)::DATE,
+               date_trunc('month', p.completed_time)::DATE + 28,
+               date_trunc('month', p.completed_time)::DATE + 30,
+               'completed', SUM(p.total_weight_kg), 70
+        FROM pickup_requests p JOIN seed_pickups sp ON sp.pickup_id = p.pickup_id
+        WHERE p.status = 'completed'
+        GROUP BY p.supervisor_id, date_trunc('month', p.completed_time);
+
+        INSERT INTO batch_items (batch_id, item_id, pickup_id, added_by, added_at)
+        SELECT b.batch_id, i.item_id, p.pickup_id, p.supervisor_id, p.completed_time
+        FROM pickup_requests p
+        JOIN seed_pickups sp ON sp.pickup_id = p.pickup_id
+        JOIN items i ON i.pickup_id = p.pickup_id
+        JOIN recycling_batches b
+          ON b.batch_name = 'SEED ' || p.supervisor_id || ' ' || to_char(date_trunc('month', p.completed_time), 'YYYY-MM')
+        WHERE p.status = 'completed';
+
+        INSERT INTO system_revenue (batch_id, facility_id, material_type, weight_kg, price_per_kg,
+                                    recorded_by, recorded_at)
+        SELECT b.batch_id, b.facility_id, m.material, GREATEST(b.total_weight_kg * m.share, 0.01), m.price,
+               b.supervisor_id, b.processing_end_date
+        FROM recycling_batches b
+        CROSS JOIN (VALUES ('copper', 0.08, 780), ('aluminum', 0.30, 210), ('plastics', 0.25, 35)) AS m(material, share, price)
+        WHERE b.batch_name LIKE 'SEED %%';
+
+        UPDATE recycling_batches b SET total_revenue = r.total
+        FROM (SELECT batch_id, SUM(total_value) AS total FROM system_revenue GROUP BY batch_id) r
+        WHERE b.batch_id = r.batch_id AND b.batch_name LIKE 'SEED %%';
+
+        -- Maintained totals (their triggers are off while loading)
+        SELECT rebuild_batch_aggregates();
+    """),
+    ('alerts & audit', """
+        INSERT INTO admin_alerts (alert_type, severity, title, related_table, related_id,
+                                  is_resolved, created_at, last_seen_at, resolved_at)
+        SELECT (ARRAY['payment_overdue','duplicate_payment_request','batch_underrun','user_inactive'])[1 + g %% 4],
+               (ARRAY['low','medium','high','critical'])[1 + g %% 4],
+               'Seed alert ' || g, 'pickup_requests', g,
+               g %% 10 <> 0,
+               NOW() - (g %% 1000) * INTERVAL '1 day',
+               NOW() - (g %% 1000) * INTERVAL '1 day',
+               CASE WHEN g %% 10 <> 0 THEN NOW() - (g %% 1000) * INTERVAL '1 day' + INTERVAL '1 day' END
+        FROM generate_series(1, %(alerts)s) g;
+
+        INSERT INTO audit_log (table_name, operation, record_id, new_values, changed_by, changed_at)
+        SELECT 'pickup_requests', 'UPDATE', p.pickup_id, jsonb_build_object('status', p.status),
+               'seed', p.updated_at
+        FROM pickup_requests p JOIN seed_pickups sp ON sp.pickup_id = p.pickup_id;
+    """),
+    ('daily facts', """
+        TRUNCATE fact_revenue_daily, fact_hazard_daily;
+
+        INSERT INTO fact_revenue_daily (day, facility_id, material_type, weight_kg, total_value, entry_count)
+        SELECT recorded_at::DATE, facility_id, material_type, SUM(weight_kg), SUM(total_value), COUNT(*)
+        FROM system_revenue GROUP BY 1, 2, 3;
+
+        -- Same rules as fn_apply_hazard_fact
+        INSERT INTO fact_hazard_daily (day, supervisor_id, category_id, hazardous_items,
+                                       mercury_items, total_batteries, high_hazard_items)
+        SELECT i.created_at::DATE, p.supervisor_id, i.category_id,
+               COUNT(*),
+               COUNT(*) FILTER (WHERE COALESCE((i.hazard_details->>'contains_mercury')::BOOLEAN, FALSE)),
+               SUM(COALESCE((i.hazard_details->>'battery_count')::INT, 0)),
+               COUNT(*) FILTER (WHERE c.hazard_level >= 4)
+        FROM items i
+        JOIN pickup_requests p ON p.pickup_id = i.pickup_id
+        JOIN categories c      ON c.category_id = i.category_id
+        WHERE p.supervisor_id IS NOT NULL
+          AND (COALESCE(c.hazard_level, 0) >= 3
+               OR COALESCE((i.hazard_details->>'contains_mercury')::BOOLEAN, FALSE))
+        GROUP BY 1, 2, 3;
+    """),
+]
+
+
+def ensure_database(dbname):
+    conn = psycopg2.connect(**dict(DB_CONFIG, dbname='postgres'))
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (dbname,))
+            if not cur.fetchone():
+                cur.execute(f'CREATE DATABASE "{dbname}"')
+                print(f'[seed] created database {dbname}')
+    finally:
+        conn.close()
+
+def already_seeded(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM users WHERE email LIKE 'seed.user%@example.test')")
+        return cur.fetchone()[0]
+
+def seed(conn, counts):
+    with conn.cursor() as cur:
+        cur.execute("SET session_replication_role = replica")
+        for label, sql in STEPS:
+            started = time.monotonic()
+            cur.execute(sql, counts)
+            print(f'[seed] {label:<15} {time.monotonic() - started:6.1f}s')
+    conn.commit()
+
+def archive(conn, months):
+    """Archive old completed pickups so history views have both branches populated."""
+    total = 0
+    with conn.cursor() as cur:
+        cur.execute("SET session_replication_role = replica")
+        while True:
+            cur.execute("CALL archive_completed_pickups(%s, %s, NULL)", (months, 5000))
+            moved = cur.fetchone()[0] or 0
+            conn.commit()
+            total += moved
+            if moved == 0:
+                break
+    print(f'[seed] archived        {total} pickup(s) older than {months} months')
+
+def analyze(conn):
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("VACUUM ANALYZE")
+    conn.autocommit = False
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a large dataset for plan checks.')
+    parser.add_argument('--dbname', default=DEFAULT_DBNAME)
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--archive-months', type=int, default=24)
+    parser.add_argument('--reseed', action='store_true', help='drop and recreate the database first')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=N',
+                        help=f'override a row count ({", ".join(BASE)})')
+    parser.add_argument('--force', action='store_true', help='allow seeding the app database (DB_NAME)')
+    args = parser.parse_args(argv)
+
+    if args.dbname == os.environ.get('DB_NAME', 'ewaste_db') and not args.force:
+        print(f'[seed] refusing to load test data into the app database {args.dbname} (use --force)')
+        return 1
+
+    if args.reseed:
+        conn = psycopg2.connect(**dict(DB_CONFIG, dbname='postgres'))
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f'DROP DATABASE IF EXISTS "{args.dbname}"')
+        conn.close()
+    ensure_database(args.dbname)
+    DB_CONFIG['dbname'] = args.dbname      # migrate.py reads the same dict
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        migrate.cmd_up(conn)
+        migrate.cmd_seed(conn)                   # categories and facilities the steps draw from
+        if already_seeded(conn):
+            print(f'[seed] {args.dbname} already seeded (use --reseed to start over)')
+        else:
+            counts = {k: max(1, int(v * args.scale)) for k, v in BASE.items()}
+            for item in args.set:
+                key, _, value = item.partition('=')
+                if key not in BASE:
+                    parser.error(f'unknown --set key {key!r}')
+                counts[key] = int(value)
+            counts['supervisors'] = min(counts['supervisors'], counts['field_staff'])
+            seed(conn, counts)
+            archive(conn, args.archive_months)
+        analyze(conn)
+    except migrate.MigrationError as e:
+        print(f'[seed] {e}')
+        return 1
+    finally:
+        conn.close()
+    print(f'[seed] done — run: python scripts/plan_check.py --dbname {args.dbname}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
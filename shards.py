@@ -0,0 +1,398 @@
+"""
+shards.py — City shards: directory lookups, cross-shard fan-out, city moves
+
+Each city's users, pickups and regional staff / facilities / vehicles live on
+one PostgreSQL shard (db.SHARDS, from DB_SHARDS). The directory shard
+(DB_DEFAULT_SHARD) holds two routing tables (database/16_shard_directory.sql):
+
+  shard_directory    city -> shard (+ 'moving' while move_city runs)
+  account_directory  username -> shard, so /login knows where to look
+
+A request runs on one shard: the shard of the session's city, else the shard
+it logged in on (admins pick one, see /admin/shard). Admin reports run on
+every shard with fan_out() and are merged here. Cities not in the directory
+go to the default shard, and with a single shard none of this is consulted.
+
+Ids are interleaved across shards (configure_shard_ids), so move_city copies
+rows unchanged. Local setup: two databases on one server are enough, e.g.
+DB_SHARDS='{"north": {"dbname": "ewaste_n"}, "south": {"dbname": "ewaste_s"}}'.
+"""
+import os
+import time
+import tempfile
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+import psycopg2.extras
+from db import SHARDS, DEFAULT_SHARD, use_shard, execute_query, execute_one, execute_update, get_conn
+
+DIRECTORY_TTL = float(os.environ.get('SHARD_DIRECTORY_TTL', 5))    # seconds a city lookup is cached
+MOVE_COPY_MEMORY = 64 * 1024 * 1024                                 # spill a table's COPY to disk past this
+
+
+def sharded():
+    return len(SHARDS) > 1
+
+def normalize_city(city):
+    return (city or '').strip().lower()
+
+
+# ── Directory ─────────────────────────────────────────────
+_directory = {'cities': {}, 'loaded_at': float('-inf')}
+_directory_lock = threading.Lock()
+
+def _cities():
+    """{city: (shard, state)}, re-read from the directory shard every DIRECTORY_TTL seconds."""
+    if time.monotonic() - _directory['loaded_at'] > DIRECTORY_TTL:
+        with _directory_lock:
+            if time.monotonic() - _directory['loaded_at'] > DIRECTORY_TTL:
+                with use_shard(DEFAULT_SHARD):
+                    rows = execute_query("SELECT city, shard, state FROM shard_directory")
+                _directory['cities'] = {r['city']: (r['shard'], r['state']) for r in rows if r['shard'] in SHARDS}
+                _directory['loaded_at'] = time.monotonic()
+    return _directory['cities']
+
+def directory_stale():
+    """True when the next lookup will re-read the directory (a blocking query)."""
+    return sharded() and time.monotonic() - _directory['loaded_at'] > DIRECTORY_TTL
+
+def shard_for_city(city):
+    if not sharded():
+        return DEFAULT_SHARD
+    return _cities().get(normalize_city(city), (DEFAULT_SHARD, 'active'))[0]
+
+def city_moving(city):
+    """True while move_city is copying this city; its writes are refused meanwhile."""
+    return sharded() and bool(city) and _cities().get(normalize_city(city), (None, 'active'))[1] == 'moving'
+
+def moving_out(shard):
+    """True while a city is being moved off `shard`. Writers not tied to one city
+    (admins, maintenance jobs) hold off on that shard meanwhile."""
+    return sharded() and any(s == shard and state == 'moving' for s, state in _cities().values())
+
+def session_shard(sess):
+    """Shard for a request: the session city's (follows moves), else the one it logged in on."""
+    if not sharded():
+        return DEFAULT_SHARD
+    if sess.get('city'):
+        return shard_for_city(sess['city'])
+    return sess['shard'] if sess.get('shard') in SHARDS else DEFAULT_SHARD
+
+def account_shard(username):
+    if not sharded():
+        return DEFAULT_SHARD
+    with use_shard(DEFAULT_SHARD):
+        row = execute_one("SELECT shard FROM account_directory WHERE username=%s", (username,))
+    return row['shard'] if row and row['shard'] in SHARDS else DEFAULT_SHARD
+
+def reserve_username(username, shard):
+    """Claim a username across all shards for an account about to be created on `shard`.
+    False if taken. Single shard: accounts.username's UNIQUE constraint does this."""
+    if not sharded():
+        return True
+    with use_shard(DEFAULT_SHARD):
+        return execute_update("INSERT INTO account_directory (username, shard) VALUES (%s,%s) "
+                              "ON CONFLICT (username) DO NOTHING", (username, shard)) == 1
+
+def release_username(username):
+    """Undo reserve_username when the account could not be created."""
+    if sharded():
+        with use_shard(DEFAULT_SHARD):
+            execute_update("DELETE FROM account_directory WHERE username=%s", (username,))
+
+
+# ── Fan-out ───────────────────────────────────────────────
+_executor = {'pool': None, 'pid': None}
+
+def _pool():
+    if _executor['pid'] != os.getpid():
+        with _directory_lock:
+            if _executor['pid'] != os.getpid():
+                _executor['pool'] = ThreadPoolExecutor(max_workers=len(SHARDS), thread_name_prefix='fan-out')
+                _executor['pid']  = os.getpid()
+    return _executor['pool']
+
+def fan_out(fn, *args, **kwargs):
+    """fn(*args, **kwargs) on every shard at once; {shard: result}. Any failure raises."""
+    def run(shard):
+        with use_shard(shard):
+            return fn(*args, **kwargs)
+    if not sharded():
+        return {DEFAULT_SHARD: run(DEFAULT_SHARD)}
+    futures = {shard: _pool().submit(contextvars.copy_context().run, run, shard) for shard in SHARDS}
+    return {shard: f.result() for shard, f in futures.items()}
+
+def _sort(rows, order_by, reverse, limit):
+    if order_by:
+        keys = (order_by,) if isinstance(order_by, str) else order_by
+        rows.sort(key=lambda r: tuple((r[k] is not None, r[k] if r[k] is not None else 0) for k in keys),
+                  reverse=reverse)
+    return rows[:limit] if limit else rows
+
+def merge_rows(results, order_by=None, reverse=False, limit=None):
+    """Concatenate per-shard row lists (rows are disjoint, e.g. one per supervisor)."""
+    return _sort([r for rows in results.values() for r in rows], order_by, reverse, limit)
+
+def merge_sum(results, keys, sums, order_by=None, reverse=False, limit=None):
+    """Rows with the same `keys` from different shards become one; `sums` columns are
+    added up, every other column comes from the first shard's row."""
+    merged = {}
+    for rows in results.values():
+        for r in rows:
+            k = tuple(r[c] for c in keys)
+            if k not in merged:
+                merged[k] = dict(r)
+            else:
+                for c in sums:
+                    merged[k][c] = (merged[k][c] or 0) + (r[c] or 0)
+    return _sort(list(merged.values()), order_by, reverse, limit)
+
+
+# ── Setup ─────────────────────────────────────────────────
+def init_shards():
+    """Interleave every shard's id sequences (shard n of N, in DB_SHARDS order) and register
+    the cities and usernames each shard already holds. Rerun after adding a shard at the end
+    of DB_SHARDS; never reorder it. Returns a list of conflicts (same city / username on two shards)."""
+    names, conflicts = list(SHARDS), []
+    for number, shard in enumerate(names, 1):
+        with use_shard(shard):
+            seqs = execute_one("SELECT configure_shard_ids(%s, %s) AS n", (number, len(names)))['n']
+            cities = [r['city'] for r in execute_query(
+                "SELECT DISTINCT lower(trim(city)) AS city FROM users "
+                "UNION SELECT DISTINCT lower(trim(city)) FROM staff WHERE city IS NOT NULL")]
+            usernames = [r['username'] for r in execute_query("SELECT username FROM accounts")]
+        print(f'[shards] {shard}: shard {number}/{len(names)}, {seqs} sequence(s), '
+              f'{len(cities)} city(ies), {len(usernames)} account(s)')
+        with use_shard(DEFAULT_SHARD), get_conn() as conn, conn.cursor() as cur:
+            for table, key, values in (('shard_directory', 'city', cities),
+                                       ('account_directory', 'username', usernames)):
+                taken = psycopg2.extras.execute_values(cur, f"""
+                    INSERT INTO {table} ({key}, shard) VALUES %s
+                    ON CONFLICT ({key}) DO UPDATE SET shard = {table}.shard
+                    RETURNING {key}, shard
+                """, [(v, shard) for v in values], page_size=1000, fetch=True)
+                conflicts += [f'{key} {v!r} is on {s} and {shard}' for v, s in taken if s != shard]
+    return conflicts
+
+
+# ── Moving a city ─────────────────────────────────────────
+# A city's rows, parents before children; deleted in reverse.
+# %(city)s is normalize_city(city).
+_USERS      = "SELECT user_id FROM users WHERE lower(trim(city)) = %(city)s"
+_CITY_STAFF = "SELECT staff_id FROM staff WHERE lower(trim(city)) = %(city)s"
+_STAFF      = f"SELECT staff_id FROM staff WHERE lower(trim(city)) = %(city)s OR supervisor_id IN ({_CITY_STAFF})"
+_FACILITIES = "SELECT facility_id FROM recycling_facilities WHERE lower(trim(city)) = %(city)s"
+_PICKUPS    = f"SELECT pickup_id FROM pickup_requests WHERE user_id IN ({_USERS})"
+_ARCHIVED   = f"SELECT pickup_id FROM pickup_requests_archive WHERE user_id IN ({_USERS})"
+_BATCHES    = f"SELECT batch_id FROM recycling_batches WHERE facility_id IN ({_FACILITIES})"
+
+CITY_TABLES = [
+    ('recycling_facilities',      f"facility_id IN ({_FACILITIES})"),
+    ('staff',                     f"staff_id IN ({_STAFF})"),
+    ('vehicles',                  f"supervisor_id IN ({_STAFF})"),
+    ('users',                     f"user_id IN ({_USERS})"),
+    ('accounts',                  f"user_id IN ({_USERS}) OR staff_id IN ({_STAFF})"),
+    ('pickup_requests',           f"pickup_id IN ({_PICKUPS})"),
+    ('pickup_assignments',        f"pickup_id IN ({_PICKUPS}) OR pickup_id IN ({_ARCHIVED})"),
+    ('items',                     f"pickup_id IN ({_PICKUPS})"),
+    ('weight_records',            f"item_id IN (SELECT item_id FROM items WHERE pickup_id IN ({_PICKUPS}))"),
+    ('payment_requests',          f"pickup_id IN ({_PICKUPS})"),
+    ('payments',                  f"pickup_id IN ({_PICKUPS})"),
+    ('warnings',                  f"target_user_id IN ({_USERS}) OR target_staff_id IN ({_STAFF})"),
+    ('pickup_requests_archive',   f"user_id IN ({_USERS})"),
+    ('items_archive',             f"pickup_id IN ({_ARCHIVED})"),
+    ('weight_records_archive',    f"item_id IN (SELECT item_id FROM items_archive WHERE pickup_id IN ({_ARCHIVED}))"),
+    ('payment_requests_archive',  f"pickup_id IN ({_ARCHIVED})"),
+    ('payments_archive',          f"pickup_id IN ({_ARCHIVED})"),
+    ('archive_user_totals',       f"user_id IN ({_USERS})"),
+    ('archive_supervisor_totals', f"supervisor_id IN ({_STAFF})"),
+    ('recycling_batches',         f"batch_id IN ({_BATCHES})"),
+    ('batch_items',               f"batch_id IN ({_BATCHES})"),
+    ('batch_items_archive',       f"batch_id IN ({_BATCHES})"),
+    ('batch_pickup_counts',       f"batch_id IN ({_BATCHES})"),
+    ('system_revenue',            f"batch_id IN ({_BATCHES})"),
+    ('facility_load_ledger',      f"facility_id IN ({_FACILITIES})"),
+    ('fact_revenue_daily',        f"facility_id IN ({_FACILITIES})"),
+    ('fact_hazard_daily',         f"supervisor_id IN ({_STAFF})"),
+]
+
+# Every single-column foreign key in the schema, from the catalog, so the move
+# checks cover columns added later. Multi-column ones are reported, not checked.
+_FOREIGN_KEYS = """
+    SELECT c.conname, c.conrelid::regclass::text, a.attname, c.confrelid::regclass::text, af.attname,
+           cardinality(c.conkey)
+    FROM   pg_constraint c
+    JOIN   pg_attribute a  ON a.attrelid  = c.conrelid  AND a.attnum  = c.conkey[1]
+    JOIN   pg_attribute af ON af.attrelid = c.confrelid AND af.attnum = c.confkey[1]
+    WHERE  c.contype = 'f' AND c.connamespace = 'public'::regnamespace
+    ORDER  BY 2, 1
+"""
+
+# References with no foreign key behind them: (table, column, the city's ids it may hold).
+# pickup_assignments rows outlive archiving, so their pickup is hot or archived.
+_LOOSE_KEYS = [
+    ('pickup_assignments', 'pickup_id', f"{_PICKUPS} UNION ALL {_ARCHIVED}"),
+]
+
+
+class MoveError(Exception):
+    pass
+
+
+@contextmanager
+def _connect(shard):
+    """A direct connection (not pooled), closed on exit; the caller commits."""
+    conn = psycopg2.connect(**SHARDS[shard])
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def _columns(cur, table):
+    """Stored, non-generated columns (generated ones are recomputed by COPY FROM)."""
+    cur.execute("""SELECT attname FROM pg_attribute
+                   WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+                   ORDER BY attnum""", (table,))
+    return ', '.join(f'"{r[0]}"' for r in cur.fetchall())
+
+def check_move(city, source, target):
+    """Reasons the move would leave dangling references (empty list = safe).
+    Checks every foreign key both ways: moving rows that point at rows staying behind
+    (those must already exist on target), and staying rows that point at moving ones."""
+    params, problems = {'city': normalize_city(city)}, []
+    moving = dict(CITY_TABLES)
+    needed = []                                       # (fk, child, col, parent, pcol, ids)
+    with _connect(source) as src, src.cursor() as cur:
+        cur.execute(_FOREIGN_KEYS)
+        for name, child, col, parent, pcol, width in cur.fetchall():
+            if width > 1:
+                if child in moving or parent in moving:
+                    problems.append(f'{name}: multi-column foreign key, not checked')
+                continue
+            if child in moving:
+                stays = (f'AND COALESCE("{col}" NOT IN (SELECT "{pcol}" FROM {parent} WHERE {moving[parent]}), TRUE)'
+                         if parent in moving else '')
+                cur.execute(f'SELECT DISTINCT "{col}" FROM {child} '
+                            f'WHERE ({moving[child]}) AND "{col}" IS NOT NULL {stays}', params)
+                ids = {r[0] for r in cur.fetchall()}
+                if ids:
+                    needed.append((name, child, col, parent, pcol, ids))
+            if parent in moving:
+                leaves = f'AND NOT COALESCE(({moving[child]}), FALSE)' if child in moving else ''
+                cur.execute(f'SELECT COUNT(*) FROM {child} '
+                            f'WHERE "{col}" IN (SELECT "{pcol}" FROM {parent} WHERE {moving[parent]}) {leaves}', params)
+                staying = cur.fetchone()[0]
+                if staying:
+                    problems.append(f'{staying} {child} row(s) staying on {source} reference '
+                                    f"{city}'s {parent} through {col} ({name})")
+        for table, col, ids in _LOOSE_KEYS:
+            cur.execute(f'SELECT COUNT(*) FROM {table} '
+                        f'WHERE "{col}" IN ({ids}) AND NOT COALESCE(({moving[table]}), FALSE)', params)
+            staying = cur.fetchone()[0]
+            if staying:
+                problems.append(f"{staying} {table} row(s) of {city}'s pickups would stay on {source}")
+    if needed:
+        with _connect(target) as dst, dst.cursor() as cur:
+            for name, child, col, parent, pcol, ids in needed:
+                cur.execute(f'SELECT "{pcol}" FROM {parent} WHERE "{pcol}" = ANY(%s)', (list(ids),))
+                missing = ids - {r[0] for r in cur.fetchall()}
+                if missing:
+                    problems.append(f'{len(missing)} {parent} row(s) that {city}\'s {child}.{col} uses '
+                                    f'are not on {target} ({name}): {sorted(missing)[:10]}')
+    return problems
+
+def _set_city(city, **fields):
+    sets = ', '.join(f'{k} = %({k})s' for k in fields)
+    with use_shard(DEFAULT_SHARD):
+        execute_update(f"UPDATE shard_directory SET {sets}, updated_at = NOW() WHERE city = %(city)s",
+                       dict(fields, city=city))
+    _directory['loaded_at'] = float('-inf')
+
+def move_city(city, target, dry_run=False, grace=None):
+    """Move every row of `city` to shard `target`:
+      1. mark the city 'moving' and wait out cached lookups: the app refuses the city's
+         writes, and admin writes and maintenance jobs on the source shard
+      2. on the source, lock the city's rows (FOR UPDATE) in a transaction held to the end,
+         so any other writer blocks and then fails (FK) or finds nothing, never lost
+      3. COPY the rows into target in one transaction
+      4. point the directory (city and usernames) at target
+      5. delete the rows from the source and commit, releasing the locks
+    Triggers are off while copying and deleting (session_replication_role, needs a
+    superuser): the rows move as they are. A run that fails before step 4 can simply be
+    rerun: step 3 checks each table on target and copies only the ones with none of the
+    city's rows yet. After step 4, only step 5's leftovers remain (rerun the DELETEs by hand)."""
+    city = normalize_city(city)
+    if target not in SHARDS:
+        raise MoveError(f'unknown shard {target!r}')
+    with use_shard(DEFAULT_SHARD):
+        row = execute_one("SELECT shard, state, moving_to FROM shard_directory WHERE city=%s", (city,))
+    if row is None:
+        raise MoveError(f'{city!r} is not in shard_directory (python maintenance.py shard-init)')
+    source = row['shard']
+    if source == target:
+        raise MoveError(f'{city!r} is already on {target}')
+    if row['state'] == 'moving' and row['moving_to'] != target:
+        raise MoveError(f"{city!r} is being moved to {row['moving_to']}; finish that first")
+    problems = check_move(city, source, target)
+    if problems:
+        raise MoveError('; '.join(problems))
+
+    params = {'city': city}
+    counts = {}
+    with _connect(source) as src, src.cursor() as cur:
+        for table, where in CITY_TABLES:
+            cur.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}", params)
+            counts[table] = cur.fetchone()[0]
+    if dry_run:
+        return {'source': source, 'target': target, 'rows': counts, 'moved': False}
+
+    _set_city(city, state='moving', moving_to=target)
+    time.sleep(DIRECTORY_TTL + 1 if grace is None else grace)
+
+    started = time.monotonic()
+    with _connect(source) as src, _connect(target) as dst:
+        with src.cursor() as cur:
+            # Parents first; a blocked child insert waits on its parent's lock
+            for table, where in CITY_TABLES:
+                cur.execute(f"SELECT 1 FROM {table} WHERE {where} FOR UPDATE", params)
+                counts[table] = cur.rowcount
+        # Locked rows cannot change, so each COPY sees the same data; one target transaction.
+        # A table already holding all of the city's rows on target (an earlier run) is skipped,
+        # one holding some of them stops the move, so no row is ever copied twice.
+        with src.cursor() as scur, dst.cursor() as dcur:
+            dcur.execute("SET LOCAL session_replication_role = replica")
+            for table, where in CITY_TABLES:
+                dcur.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}", params)
+                copied = dcur.fetchone()[0]
+                if copied == counts[table]:
+                    continue
+                if copied:
+                    raise MoveError(f'{table}: {copied} of {counts[table]} row(s) of {city!r} are '
+                                    f'already on {target}; remove them there and rerun')
+                cols = _columns(scur, table)
+                with tempfile.SpooledTemporaryFile(MOVE_COPY_MEMORY) as buf:
+                    scur.copy_expert(scur.mogrify(
+                        f"COPY (SELECT {cols} FROM {table} WHERE {where}) TO STDOUT (FORMAT binary)",
+                        params).decode(), buf)
+                    buf.seek(0)
+                    dcur.copy_expert(f"COPY {table} ({cols}) FROM STDIN (FORMAT binary)", buf)
+        dst.commit()
+
+        with src.cursor() as cur:
+            cur.execute(f"SELECT username FROM accounts WHERE {CITY_TABLES[4][1]}", params)
+            usernames = [r[0] for r in cur.fetchall()]
+        with use_shard(DEFAULT_SHARD), get_conn() as conn, conn.cursor() as cur:
+            cur.execute("UPDATE account_directory SET shard=%s WHERE username = ANY(%s)", (target, usernames))
+            cur.execute("UPDATE shard_directory SET shard=%s, state='active', moving_to=NULL, updated_at=NOW() "
+                        "WHERE city=%s", (target, city))
+        _directory['loaded_at'] = float('-inf')
+
+        with src.cursor() as cur:
+            cur.execute("SET LOCAL session_replication_role = replica")
+            for table, where in reversed(CITY_TABLES):
+                cur.execute(f"DELETE FROM {table} WHERE {where}", params)
+        src.commit()
+    return {'source': source, 'target': target, 'rows': counts, 'moved': True,
+            'seconds': round(time.monotonic() - started, 1)}
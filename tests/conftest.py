@@ -0,0 +1,21 @@
+"""
+Test setup. Most tests need only requirements.txt; the shard tests need
+TEST_DB_SHARDS: two scratch databases (wiped and rebuilt by the tests) on a
+server where DB_USER is a superuser (move_city turns triggers off):
+
+    createdb ewaste_test_n && createdb ewaste_test_s
+    TEST_DB_SHARDS='{"north": {"dbname": "ewaste_test_n"}, "south": {"dbname": "ewaste_test_s"}}' \\
+        python -m pytest tests
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# db.py reads these at import; never point the tests at a .env database
+os.environ['DB_SHARDS'] = os.environ.get('TEST_DB_SHARDS', '')
+os.environ.pop('DB_DEFAULT_SHARD', None)
+os.environ.pop('DB_REPLICA_HOST', None)
+os.environ['SKIP_SCHEMA_CHECK'] = '1'
+os.environ['PASSWORD_WORKERS'] = '0'
@@ -0,0 +1,51 @@
+"""
+db.py bookkeeping: the bounded unpreparable-SQL memory and the pool checkout
+counters behind /api/db-metrics. No database needed.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('dotenv')
+
+import db
+
+
+class FakeConnection:
+    closed = False
+
+    def get_transaction_status(self):
+        return 0
+
+class FakePool:
+    def getconn(self):
+        return FakeConnection()
+
+    def putconn(self, conn, close=False):
+        pass
+
+
+def test_unpreparable_sql_is_forgotten_least_recently_used_first(monkeypatch):
+    monkeypatch.setattr(db, '_unpreparable', OrderedDict())
+    monkeypatch.setattr(db, 'UNPREPARABLE_MAX', 2)
+    db._mark_unpreparable('SELECT a')
+    db._mark_unpreparable('SELECT b')
+    assert db._is_unpreparable('SELECT a')
+    db._mark_unpreparable('SELECT c')
+    assert list(db._unpreparable) == ['SELECT a', 'SELECT c']
+
+def test_pool_checkouts_are_counted(monkeypatch):
+    stats = {'in_use': 0, 'peak_in_use': 0, 'waiting': 0, 'checkouts': 0, 'timeouts': 0}
+    entry = (FakePool(), threading.BoundedSemaphore(2), stats)
+    monkeypatch.setattr(db, '_pool_state', {'pools': {db.DEFAULT_SHARD: entry}, 'pid': os.getpid()})
+    monkeypatch.setattr(db, 'POOL_TIMEOUT', 0.01)
+    first, second = db._pool_get(db.DEFAULT_SHARD), db._pool_get(db.DEFAULT_SHARD)
+    with pytest.raises(db.psycopg2.pool.PoolError):
+        db._pool_get(db.DEFAULT_SHARD)
+    db._pool_put(db.DEFAULT_SHARD, first)
+    assert db.db_metrics()['pool'] == {'max': db.POOL_MAX, 'in_use': 1, 'peak_in_use': 2,
+                                       'waiting': 0, 'checkouts': 2, 'timeouts': 1}
+    db._pool_put(db.DEFAULT_SHARD, second)
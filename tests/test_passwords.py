@@ -0,0 +1,34 @@
+"""
+passwords.py queue slots, with a thread pool standing in for the process pool.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip('werkzeug')
+
+import passwords
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(passwords, 'WORKERS', 1)
+    monkeypatch.setattr(passwords, 'JOB_TIMEOUT', 0.05)
+    monkeypatch.setattr(passwords, 'QUEUE_TIMEOUT', 0.05)
+    monkeypatch.setattr(passwords, '_slots', threading.BoundedSemaphore(1))
+    monkeypatch.setattr(passwords, '_pool', lambda: executor)
+    yield executor
+    executor.shutdown(wait=True)
+
+def test_a_timed_out_job_keeps_its_slot_until_it_finishes(pool, monkeypatch):
+    release = threading.Event()
+    with pytest.raises(passwords.Busy):
+        passwords._run(lambda: (release.wait(5), 0.0))
+    with pytest.raises(passwords.Busy, match='saturated'):
+        passwords._run(lambda: ('second', 0.0))
+    release.set()
+    pool.submit(lambda: None).result()             # the first job has finished
+    monkeypatch.setattr(passwords, 'JOB_TIMEOUT', 5)
+    assert passwords._run(lambda: ('third', 0.0)) == 'third'
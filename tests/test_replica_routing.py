@@ -0,0 +1,104 @@
+"""
+Read-replica routing in db.py, with the primary pool and the replica faked:
+which connection serves each query. No database needed.
+"""
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('dotenv')
+
+import db
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.connection = conn
+        self.statusmessage = None
+        self.rowcount = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql, params=None):
+        self.connection.log.append(self.connection.role)
+        self.statusmessage = sql.split()[0].upper() + ' 1'      # command tag, e.g. 'INSERT 1'
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return {'id': 1}
+
+class FakeConnection:
+    def __init__(self, role, log):
+        self.role, self.log = role, log
+        self.autocommit = False
+
+    def cursor(self, cursor_factory=None):
+        return FakeCursor(self)
+
+    def set_session(self, **kwargs):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def served_by(monkeypatch):
+    """List that records 'primary' / 'replica' for every statement run."""
+    log = []
+    monkeypatch.setattr(db, 'REPLICA_CONFIG', {'host': 'replica'})
+    monkeypatch.setattr(db.psycopg2, 'connect', lambda **kw: FakeConnection('replica', log))
+    monkeypatch.setattr(db, '_replica_lag_ok', lambda conn: True)
+    monkeypatch.setitem(db._replica_state, 'down_until', 0.0)
+    monkeypatch.setattr(db, '_pool_get', lambda shard: FakeConnection('primary', log))
+    monkeypatch.setattr(db, '_pool_put', lambda shard, conn: None)
+    db.begin_request()
+    return log
+
+
+def test_readonly_reads_go_to_the_replica(served_by):
+    db.execute_query("SELECT * FROM v_supervisor_team", readonly=True)
+    db.call_func('get_supervisor_stats', (1,), readonly=True)
+    db.execute_query("SELECT * FROM v_pickup_full")
+    assert served_by == ['replica', 'replica', 'primary']
+    assert not db.wrote_during_request()
+
+def test_insert_returning_pins_the_rest_of_the_request(served_by):
+    db.execute_one("INSERT INTO staff (full_name) VALUES (%s) RETURNING staff_id", ('A',))
+    db.execute_query("SELECT * FROM v_supervisor_team", readonly=True)
+    assert served_by == ['primary', 'primary']
+    assert db.wrote_during_request()
+
+def test_a_direct_connection_counts_as_a_write(served_by):
+    with db.get_conn() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE accounts SET last_login = NOW()")
+    db.execute_query("SELECT * FROM v_supervisor_team", readonly=True)
+    assert served_by == ['primary', 'primary']
+
+def test_the_next_request_after_a_write_reads_the_primary(served_by):
+    flask = pytest.importorskip('flask')
+    from app import app
+    with app.test_request_context('/'):
+        app.preprocess_request()
+        db.execute_update("UPDATE users SET phone = %s WHERE user_id = %s", ('0', 1))
+        app.process_response(app.response_class())
+        rw_until = flask.session['rw_until']
+    with app.test_request_context('/'):
+        flask.session['rw_until'] = rw_until
+        app.preprocess_request()
+        db.execute_query("SELECT * FROM v_supervisor_team", readonly=True)
+    with app.test_request_context('/'):
+        app.preprocess_request()
+        db.execute_query("SELECT * FROM v_supervisor_team", readonly=True)
+    assert served_by == ['primary', 'primary', 'replica']
@@ -0,0 +1,109 @@
+"""
+City shards: merging fan-out results, and a real move between two databases
+(needs TEST_DB_SHARDS, see conftest.py).
+"""
+import os
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+pytest.importorskip('dotenv')
+
+import migrate
+import shards
+from db import SHARDS, use_shard, get_conn, execute_one, execute_query
+
+CITY = 'chittagong'          # bob's city in database/seed/sample_data.sql
+
+
+# ── Merging (no database) ─────────────────────────────────
+def test_merge_rows_concatenates_and_orders():
+    results = {'north': [{'id': 3}, {'id': 1}], 'south': [{'id': 2}, {'id': None}]}
+    assert [r['id'] for r in shards.merge_rows(results, order_by='id')] == [None, 1, 2, 3]
+    assert [r['id'] for r in shards.merge_rows(results, order_by='id', reverse=True, limit=2)] == [3, 2]
+
+def test_merge_sum_adds_rows_with_the_same_key():
+    results = {'north': [{'city': 'dhaka', 'n': 2, 'name': 'n'}, {'city': 'sylhet', 'n': None, 'name': 'n'}],
+               'south': [{'city': 'dhaka', 'n': 3, 'name': 's'}]}
+    merged = shards.merge_sum(results, keys=('city',), sums=('n',), order_by='n', reverse=True)
+    assert merged == [{'city': 'dhaka', 'n': 5, 'name': 'n'}, {'city': 'sylhet', 'n': None, 'name': 'n'}]
+
+
+# ── Two shards ────────────────────────────────────────────
+def _count(shard, table, where):
+    with use_shard(shard):
+        return execute_one(f"SELECT COUNT(*) AS n FROM {table} WHERE {where}", {'city': CITY})['n']
+
+@pytest.fixture(scope='module')
+def cluster():
+    """Fresh schema and demo data on every shard; one pending pickup with an item for CITY.
+    Returns (source, target) shards of CITY."""
+    if not os.environ.get('TEST_DB_SHARDS') or len(SHARDS) < 2:
+        pytest.skip('set TEST_DB_SHARDS to two scratch databases')
+    for config in SHARDS.values():
+        conn = psycopg2.connect(**config)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public")
+        conn.close()
+    assert migrate.main(['up']) == 0
+    assert migrate.main(['seed']) == 0
+    assert shards.init_shards() == []
+    source = shards.shard_for_city(CITY)
+    target = next(s for s in SHARDS if s != source)
+    with use_shard(source), get_conn() as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO pickup_requests (user_id, preferred_date, pickup_address) "
+                    "SELECT user_id, CURRENT_DATE, address FROM users WHERE lower(city) = %s "
+                    "RETURNING pickup_id", (CITY,))
+        pickup_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO items (pickup_id, category_id, item_description, estimated_weight_kg) "
+                    "VALUES (%s, 1, 'Old laptop', 2.5)", (pickup_id,))
+    return source, target
+
+def test_fan_out_queries_every_shard(cluster):
+    dbs = shards.fan_out(execute_one, "SELECT current_database() AS db")
+    assert {s: r['db'] for s, r in dbs.items()} == {s: c['dbname'] for s, c in SHARDS.items()}
+    per_city = shards.fan_out(execute_query, "SELECT lower(city) AS city, COUNT(*) AS n FROM users GROUP BY 1")
+    merged = shards.merge_sum(per_city, keys=('city',), sums=('n',), order_by='city')
+    assert [(r['city'], r['n']) for r in merged] == [('chittagong', 1), ('dhaka', 2), ('sylhet', 1)]
+
+def test_writes_to_a_moving_city_are_refused(cluster):
+    pytest.importorskip('flask')
+    from app import app
+    source, target = cluster
+    with use_shard(source):
+        bob = execute_one("SELECT account_id, user_id FROM accounts WHERE username = 'bob'")
+    pickups = f"user_id = {bob['user_id']}"
+    before = _count(source, 'pickup_requests', pickups)
+    shards._set_city(CITY, state='moving', moving_to=target)
+    try:
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess.update(account_id=bob['account_id'], username='bob', role='user', user_id=bob['user_id'],
+                        city='Chittagong', shard=source, full_name='Bob Hasan')
+        resp = client.post('/my-pickups/new', data={'preferred_date': '2030-01-01', 'address': '12 GEC Circle'})
+        assert resp.status_code == 302
+        assert _count(source, 'pickup_requests', pickups) == before
+
+        anonymous = app.test_client()
+        anonymous.post('/register', data={'full_name': 'New Person', 'email': 'new@mail.com', 'phone': '0',
+                                          'address': 'Agrabad', 'city': 'Chittagong',
+                                          'username': 'newperson', 'password': 'password123'})
+        assert all(_count(s, 'users', "email = 'new@mail.com'") == 0 for s in SHARDS)
+    finally:
+        shards._set_city(CITY, state='active', moving_to=None)
+
+def test_move_city_copies_every_row_and_empties_the_source(cluster):
+    source, target = cluster
+    result = shards.move_city(CITY, target, grace=0)
+    assert result['moved']
+    assert result['rows']['users'] == 1 and result['rows']['pickup_requests'] == 1 and result['rows']['items'] == 1
+    for table, where in shards.CITY_TABLES:
+        assert _count(target, table, where) == result['rows'][table], table
+        assert _count(source, table, where) == 0, table
+    assert shards.shard_for_city(CITY) == target
+    assert shards.account_shard('bob') == target
+
+def test_move_city_to_its_own_shard_is_refused(cluster):
+    source, target = cluster
+    with pytest.raises(shards.MoveError):
+        shards.move_city(CITY, target, grace=0)
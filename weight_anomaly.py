@@ -0,0 +1,225 @@
+"""
+weight_anomaly.py — Batch scoring of weighings for inflated weights
+
+Pulls weight_records joined to items with one binary COPY, parses it straight
+into NumPy columns, and scores whole columns at once (no per-row Python):
+
+  ratio z     log(collector weight / estimated weight), robust z-score within
+              the item's category (median / MAD)
+  facility z  log(collector weight / facility_in weight) for items weighed at
+              both, robust z-score within the category
+  collector   median ratio z over a collector's weighings; a high median means
+              their weights run high across the board, not just on one item
+
+Items over --item-z and collectors over --collector-z become 'weight_anomaly'
+admin_alerts, raised in one statement through raise_admin_alert: a target
+that still has an open weight_anomaly alert gets its occurrence count bumped
+instead of a second alert. Inflated collector weights inflate payouts
+through calculate_item_value, so these are the weighings worth a second look.
+
+Run from cron via `python maintenance.py score-weights`.
+"""
+import io
+import json
+import time
+import numpy as np
+import psycopg2.extras
+from db import get_conn
+
+ITEM_Z          = 3.5     # Iglewicz–Hoaglin cut-off for single weighings
+COLLECTOR_Z     = 1.5     # median z across a collector's weighings
+MIN_RECORDS     = 20      # weighings before a collector is judged
+MAX_ITEM_ALERTS = 200     # highest-scoring items per run
+COALESCE_WINDOW = '7 days'
+
+STAGES = {'pickup': 0, 'facility_in': 1, 'facility_out': 2}
+
+FETCH_SQL = """
+COPY (
+    SELECT w.weight_id, w.item_id, i.category_id, COALESCE(w.weighed_by, -1),
+           CASE w.weighing_stage WHEN 'pickup' THEN 0 WHEN 'facility_in' THEN 1 ELSE 2 END,
+           w.weight_kg::FLOAT8, COALESCE(i.estimated_weight_kg::FLOAT8, 'NaN')
+    FROM   weight_records w
+    JOIN   items i ON i.item_id = w.item_id
+    {where}
+) TO STDOUT (FORMAT binary)
+"""
+
+# One binary COPY row: field count, then (length, value) per column. No NULLs
+# reach it (COALESCE above), so every row has the same width.
+_ROW = np.dtype([('n', '>i2'),
+                 ('l0', '>i4'), ('weight_id', '>i4'),
+                 ('l1', '>i4'), ('item_id', '>i4'),
+                 ('l2', '>i4'), ('category_id', '>i4'),
+                 ('l3', '>i4'), ('collector_id', '>i4'),
+                 ('l4', '>i4'), ('stage', '>i4'),
+                 ('l5', '>i4'), ('weight', '>f8'),
+                 ('l6', '>i4'), ('estimated', '>f8')])
+_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+
+
+def fetch(conn, days=None):
+    """weight_records (optionally the last `days`) as a dict of NumPy columns."""
+    where = 'WHERE w.weighed_at >= NOW() - make_interval(days => %s)' if days else ''
+    buf = io.BytesIO()
+    with conn.cursor() as cur:
+        sql = FETCH_SQL.format(where=where)
+        if days:
+            sql = cur.mogrify(sql, (days,)).decode()
+        cur.copy_expert(sql, buf)
+    raw = buf.getbuffer()
+    if bytes(raw[:11]) != _SIGNATURE:
+        raise ValueError('unexpected COPY header')
+    start = 19 + int.from_bytes(raw[15:19], 'big')    # signature, flags, header extension
+    body  = raw[start:len(raw) - 2]                   # minus the -1 trailer
+    rows  = np.frombuffer(body, dtype=_ROW)
+    if len(rows) and not (rows['n'] == 7).all():
+        raise ValueError('unexpected COPY row layout')
+    return {name: rows[name].astype(rows.dtype[name].newbyteorder('='))
+            for name in ('weight_id', 'item_id', 'category_id', 'collector_id', 'stage', 'weight', 'estimated')}
+
+
+# ── Grouped robust statistics ─────────────────────────────
+def group_median(keys, values):
+    """Median of values per key: (unique keys, medians, counts, median for each row)."""
+    order  = np.lexsort((values, keys))
+    k, v   = keys[order], values[order]
+    starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+    counts = np.diff(np.r_[starts, len(k)])
+    med    = (v[starts + (counts - 1) // 2] + v[starts + counts // 2]) / 2
+    uniq   = k[starts]
+    return uniq, med, counts, med[np.searchsorted(uniq, keys)]
+
+def robust_z(keys, values):
+    """0.6745 * (x - median) / MAD within each key; mean absolute deviation
+    (x 1.2533) stands in where MAD is 0, and z is 0 where both are."""
+    _, _, _, med = group_median(keys, values)
+    dev = np.abs(values - med)
+    uniq, _, counts, mad_row = group_median(keys, dev)
+    group = np.searchsorted(uniq, keys)
+    mean_ad = np.bincount(group, weights=dev) / counts
+    scale = np.where(mad_row > 0, mad_row / 0.6745, 1.2533 * mean_ad[group])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(scale > 0, (values - med) / scale, 0.0)
+
+def _latest_per_item(d, mask):
+    """Index of the newest weighing per item among rows in mask."""
+    idx   = np.flatnonzero(mask)
+    if idx.size == 0:                                  # e.g. no facility_in weighings yet
+        return idx
+    order = idx[np.lexsort((d['weight_id'][idx], d['item_id'][idx]))]
+    items = d['item_id'][order]
+    last  = np.r_[items[1:] != items[:-1], True]
+    return order[last]
+
+
+def score(d, item_z=ITEM_Z, collector_z=COLLECTOR_Z, min_records=MIN_RECORDS):
+    """Score the columns from fetch(); returns (item hits, collector hits) as dicts of arrays."""
+    pick = _latest_per_item(d, (d['stage'] == STAGES['pickup']) & (d['weight'] > 0))
+    item_id, cat, coll = d['item_id'][pick], d['category_id'][pick], d['collector_id'][pick]
+    weight, estimated  = d['weight'][pick], d['estimated'][pick]
+
+    # Collector weight vs the user's estimate
+    has_est = estimated > 0
+    ratio   = np.full(len(pick), np.nan)
+    ratio[has_est] = weight[has_est] / estimated[has_est]
+    z_ratio = np.full(len(pick), np.nan)
+    if has_est.any():
+        z_ratio[has_est] = robust_z(cat[has_est], np.log(ratio[has_est]))
+
+    # Collector weight vs the facility scale
+    fac = _latest_per_item(d, (d['stage'] == STAGES['facility_in']) & (d['weight'] > 0))
+    fac_items = d['item_id'][fac]                      # sorted, like item_id
+    facility_weight = np.full(len(pick), np.nan)
+    matched = np.zeros(len(pick), bool)
+    if len(fac):
+        pos = np.minimum(np.searchsorted(fac_items, item_id), len(fac) - 1)
+        matched = fac_items[pos] == item_id
+        facility_weight[matched] = d['weight'][fac][pos[matched]]
+    z_facility = np.full(len(pick), np.nan)
+    if matched.any():
+        z_facility[matched] = robust_z(cat[matched], np.log(weight[matched] / facility_weight[matched]))
+
+    item_score = np.fmax(z_ratio, z_facility)          # NaN only where neither applies
+    flagged = np.flatnonzero(item_score > item_z)
+    items = {'item_id': item_id[flagged], 'category_id': cat[flagged], 'collector_id': coll[flagged],
+             'weight': weight[flagged], 'estimated': estimated[flagged], 'ratio': ratio[flagged],
+             'facility_weight': facility_weight[flagged], 'z_ratio': z_ratio[flagged],
+             'z_facility': z_facility[flagged], 'score': item_score[flagged]}
+
+    # Collectors whose typical weighing runs high
+    judged = has_est & (coll >= 0)
+    collectors = {k: np.array([]) for k in ('collector_id', 'records', 'median_z', 'median_ratio')}
+    if judged.any():
+        ids, med_z, counts, _ = group_median(coll[judged], z_ratio[judged])
+        _, med_ratio, _, _    = group_median(coll[judged], ratio[judged])
+        hit = (counts >= min_records) & (med_z > collector_z)
+        collectors = {'collector_id': ids[hit], 'records': counts[hit],
+                      'median_z': med_z[hit], 'median_ratio': med_ratio[hit]}
+    return items, collectors
+
+
+# ── Alerts ────────────────────────────────────────────────
+def _num(x, digits=3):
+    return None if np.isnan(x) else round(float(x), digits)
+
+def alert_rows(items, collectors, max_item_alerts=MAX_ITEM_ALERTS, item_z=ITEM_Z):
+    rows = []
+    for i in np.argsort(-collectors['median_z']):
+        sid = int(collectors['collector_id'][i])
+        rows.append(('high', 'Collector Weights Running High',
+                     f"Collector #{sid}'s weighings sit {collectors['median_z'][i]:.1f} robust SDs above "
+                     f"their categories (median {collectors['median_ratio'][i]:.2f}x the estimate).",
+                     'staff', sid, json.dumps({
+                         'collector_id': sid, 'records': int(collectors['records'][i]),
+                         'median_z': _num(collectors['median_z'][i]),
+                         'median_ratio': _num(collectors['median_ratio'][i])})))
+    for i in np.argsort(-items['score'])[:max_item_alerts]:
+        iid = int(items['item_id'][i])
+        rows.append(('high' if items['score'][i] > 2 * item_z else 'medium', 'Item Weight Anomaly',
+                     f"Item #{iid} weighed {items['weight'][i]:.2f} kg at pickup "
+                     f"(robust z {items['score'][i]:.1f} for its category).",
+                     'items', iid, json.dumps({
+                         'item_id': iid, 'category_id': int(items['category_id'][i]),
+                         'collector_id': int(items['collector_id'][i]) if items['collector_id'][i] >= 0 else None,
+                         'weight_kg': _num(items['weight'][i], 2),
+                         'estimated_kg': _num(items['estimated'][i], 2),
+                         'facility_kg': _num(items['facility_weight'][i], 2),
+                         'ratio': _num(items['ratio'][i]), 'z_ratio': _num(items['z_ratio'][i]),
+                         'z_facility': _num(items['z_facility'][i])})))
+    return rows
+
+def write_alerts(conn, rows):
+    """One statement for all rows; open alerts for the same target are coalesced."""
+    if not rows:
+        return 0
+    with conn.cursor() as cur:
+        # Wider than the default window, so a daily run keeps folding into last night's alert
+        cur.execute("SELECT set_config('app.alert_coalesce_window', %s, TRUE)", (COALESCE_WINDOW,))
+        raised = psycopg2.extras.execute_values(cur, """
+            SELECT raise_admin_alert('weight_anomaly', v.severity, v.title, v.description,
+                                     v.related_table, v.related_id, v.payload)
+            FROM (VALUES %s) AS v(severity, title, description, related_table, related_id, payload)
+        """, rows, template='(%s, %s, %s, %s, %s::INT, %s::JSONB)', page_size=len(rows), fetch=True)
+    return len(raised)
+
+
+def run(days=None, item_z=ITEM_Z, collector_z=COLLECTOR_Z, min_records=MIN_RECORDS,
+        max_item_alerts=MAX_ITEM_ALERTS, dry_run=False):
+    """Fetch, score and alert; returns counts and per-phase timings."""
+    timings = {}
+    with get_conn() as conn:
+        started = time.perf_counter()
+        data = fetch(conn, days)
+        timings['fetch_s'] = round(time.perf_counter() - started, 2)
+
+        started = time.perf_counter()
+        items, collectors = score(data, item_z, collector_z, min_records)
+        rows = alert_rows(items, collectors, max_item_alerts, item_z)
+        timings['score_s'] = round(time.perf_counter() - started, 2)
+
+        started = time.perf_counter()
+        alerts = 0 if dry_run else write_alerts(conn, rows)
+        timings['insert_s'] = round(time.perf_counter() - started, 2)
+    return dict(records=len(data['weight_id']), flagged_items=len(items['item_id']),
+                flagged_collectors=len(collectors['collector_id']), alerts=alerts, **timings)
@@ -0,0 +1,172 @@
+"""
+writebehind.py — Coalescing write-behind buffer for low-value bookkeeping writes
+
+Requests record a write in memory and return; a background thread flushes all
+pending rows in one batched UPDATE ... FROM (VALUES ...) at most every
+WRITE_BEHIND_FLUSH_SECONDS (sooner once WRITE_BEHIND_MAX_PENDING keys are
+waiting). Repeated writes to the same key coalesce to the latest one. Pending
+rows are flushed on shutdown. Only for data that may lag by a few seconds and
+survive the loss of one flush window on a crash (e.g. accounts.last_login).
+
+Timestamps are sent as an age in seconds and applied as NOW() - age, so the
+database clock stays the source of truth. Each write remembers the shard it
+was recorded on (db.current_shard()) and is flushed there. Rows that match
+nothing there (the account's city moved meanwhile) are retried on the other
+shards; ids are unique across shards.
+"""
+import os
+import time
+import atexit
+import threading
+import psycopg2
+import psycopg2.extras
+from db import SHARDS, get_conn, current_shard, use_shard
+
+FLUSH_SECONDS = float(os.environ.get('WRITE_BEHIND_FLUSH_SECONDS', 5))   # 0 = write through
+MAX_PENDING   = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', 500))
+
+
+class WriteBehind:
+    def __init__(self, name, sql, template):
+        """sql has one VALUES %s slot and RETURNs the keys it matched;
+        each row is (key, *values, age_seconds)."""
+        self.name     = name
+        self.sql      = sql
+        self.template = template
+        self._pending = {}                     # key -> (values, monotonic time recorded)
+        self._lock    = threading.Lock()
+        self._flush_lock = threading.Lock()    # one flush at a time
+        self._wake    = threading.Event()
+        self._stop    = False
+        self._thread  = None
+        self._pid     = None
+        self._metrics = {'recorded': 0, 'coalesced': 0, 'flushes': 0, 'rows_flushed': 0,
+                         'failures': 0, 'last_flush_ms': None, 'last_flush_at': None,
+                         'last_error': None}
+
+    def record(self, key, *values):
+        if FLUSH_SECONDS <= 0:
+            self._write([(key, *values, 0.0)])
+            return
+        key = (current_shard(), key)
+        with self._lock:
+            self._metrics['recorded'] += 1
+            if key in self._pending:
+                self._metrics['coalesced'] += 1
+            self._pending[key] = (values, time.monotonic())
+            full = len(self._pending) >= MAX_PENDING
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Write every pending row now; returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            now      = time.monotonic()
+            by_shard = {}
+            for (shard, key), (values, at) in batch.items():
+                by_shard.setdefault(shard, []).append((key, *values, round(now - at, 3)))
+            written = 0
+            for shard, rows in by_shard.items():
+                try:
+                    with use_shard(shard):
+                        matched = self._write(rows)
+                    written += len(matched)
+                    written += self._elsewhere(shard, [r for r in rows if r[0] not in matched])
+                except psycopg2.Error as e:
+                    with self._lock:
+                        self._metrics['failures']  += 1
+                        self._metrics['last_error'] = str(e).strip()
+                        for key, entry in batch.items():   # retry next round unless superseded
+                            if key[0] == shard:
+                                self._pending.setdefault(key, entry)
+                    print(f'[writebehind] {self.name}: flush of {len(rows)} row(s) to {shard} failed: {e}')
+            return written
+
+    def _elsewhere(self, shard, rows):
+        """Write rows that matched nothing on `shard` to whichever other shard has them."""
+        written = 0
+        for other in SHARDS:
+            if not rows:
+                break
+            if other == shard:
+                continue
+            with use_shard(other):
+                matched = self._write(rows)
+            written += len(matched)
+            rows = [r for r in rows if r[0] not in matched]
+        return written
+
+    def _write(self, rows):
+        """Write rows on the current shard; returns the set of keys matched."""
+        started = time.monotonic()
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                returned = psycopg2.extras.execute_values(cur, self.sql, rows, template=self.template,
+                                                          page_size=1000, fetch=True)
+        with self._lock:
+            self._metrics['flushes']      += 1
+            self._metrics['rows_flushed'] += len(rows)
+            self._metrics['last_flush_ms'] = round((time.monotonic() - started) * 1000, 1)
+            self._metrics['last_flush_at'] = time.time()
+        return {r[0] for r in returned}
+
+    def metrics(self):
+        with self._lock:
+            oldest = min((at for _, at in self._pending.values()), default=None)
+            return dict(self._metrics, pending=len(self._pending),
+                        oldest_pending_seconds=round(time.monotonic() - oldest, 3) if oldest else 0,
+                        flush_seconds=FLUSH_SECONDS, max_pending=MAX_PENDING)
+
+    def _ensure_thread(self):
+        # Started lazily, and again in a forked worker (threads do not survive fork).
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid    = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f'writebehind-{self.name}', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop:
+            self._wake.wait(FLUSH_SECONDS)
+            self._wake.clear()
+            self.flush()
+
+    def stop(self):
+        """Stop the flusher and write whatever is pending (registered with atexit)."""
+        self._stop = True
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(timeout=FLUSH_SECONDS + 5)
+        self.flush()
+
+
+# ── Buffers ───────────────────────────────────────────────
+LAST_LOGIN = WriteBehind('last_login', """
+    UPDATE accounts a
+    SET    last_login = GREATEST(a.last_login, NOW() - make_interval(secs => v.age))
+    FROM   (VALUES %s) AS v(account_id, age)
+    WHERE  a.account_id = v.account_id
+    RETURNING a.account_id
+""", template='(%s, %s::FLOAT8)')
+
+BUFFERS = [LAST_LOGIN]
+
+def record_login(account_id):
+    LAST_LOGIN.record(account_id)
+
+def metrics():
+    return {b.name: b.metrics() for b in BUFFERS}
+
+def flush_all():
+    for b in BUFFERS:
+        b.stop()
+
+atexit.register(flush_all)